@@ -1,27 +1,41 @@
+import concurrent.futures
 import copy
 import decorator
 import flask
+import functools
 from flask.typing import ResponseReturnValue as RRV
+import hashlib
 import jinja2
 import json
+import math
 from markupsafe import Markup
 import mwapi  # type: ignore
+import os
 import random
 import re
+import requests
 import string
+import time
 import toolforge
-from typing import cast, Any, Optional, Tuple, TypedDict
+from typing import cast, Any, Iterator, Optional, Tuple, TypedDict
 import unicodedata
 import werkzeug
 import yaml
 
-from flask_utils import SetJSONProvider
+from bulk import RateLimiter, prefetch
+from bulk_jobs import BulkJob, BulkJobStore
+from cache import SizedLruCache, TtlCache
+from flask_utils import PrecomputedJSON, SetJSONProvider
 from language import lang_lex2int, lang_int2babel
-from language_info import label
-from matching import match_template_to_lexeme_data, match_lexeme_forms_to_template, match_template_entity_to_lexeme_entity, MatchedTemplate, MatchedTemplateForm
+from item_labels import ItemLabelCache
+from language_info import label, labels as language_labels
+from matching import match_template_to_lexeme_data, match_templates_to_lexeme_data, match_lexeme_forms_to_template, match_template_entity_to_lexeme_entity, MatchedTemplate, MatchedTemplateForm
+import metrics
 from mwoauth2 import MWOAuth2FlaskMWApi
 from parse_tpsv import parse_lexemes, FirstFieldNotLexemeIdError, FirstFieldLexemeIdError, WrongNumberOfFieldsError
+from session_pool import anonymous_sessions
 from templates import templates, templates_without_redirects, Template, TemplateForm
+import timing
 from toolforge_i18n import ToolforgeI18n, interface_language_code_from_request, lang_autonym, message, pop_html_lang, push_html_lang
 from wikibase_types import Lexeme, LexemeForm, LexemeLemmas, Statements, Term
 
@@ -29,6 +43,8 @@ app = flask.Flask(__name__)
 app.json = SetJSONProvider(app)
 app.add_template_filter(lang_lex2int)
 app.add_template_filter(lang_int2babel)
+timing.init_app(app)
+metrics.init_app(app)
 
 def interface_language_code(translations: dict[str, dict[str, str]]) -> str:
     legacy_language_codes: dict[str, str] = {  # any pair here can be removed after a while, see b762a62db6
@@ -51,9 +67,52 @@ def interface_language_code(translations: dict[str, dict[str, str]]) -> str:
 i18n = ToolforgeI18n(app, interface_language_code)
 
 user_agent = toolforge.set_user_agent('lexeme-forms', email='mail@lucaswerkmeister.de')
+anonymous_sessions.configure(user_agent=user_agent)
 
 app.config.from_file('config.yaml', load=toolforge.load_private_yaml, silent=True)
 app.config.from_prefixed_env('TOOL', loads=yaml.safe_load)
+if 'MWAPI_POOL' in app.config:
+    anonymous_sessions.configure(**{key.lower(): value for key, value in app.config['MWAPI_POOL'].items()})
+if 'MWAPI_HOST_OVERRIDE' in app.config:
+    # send all API requests to a different server, e.g. fake_mwapi.py for load tests
+    anonymous_sessions.configure(host_override=app.config['MWAPI_HOST_OVERRIDE'])
+# keep the compiled Jinja templates on disk (by default in a temporary directory),
+# so that after a restart they are loaded from there instead of compiled from source again
+if 'JINJA_BYTECODE_CACHE' in app.config:
+    os.makedirs(app.config['JINJA_BYTECODE_CACHE'], exist_ok=True)
+app.jinja_env.bytecode_cache = jinja2.FileSystemBytecodeCache(app.config.get('JINJA_BYTECODE_CACHE'))
+if 'LANGUAGE_LABELS' in app.config:
+    language_labels.configure(**{key.lower(): value for key, value in app.config['LANGUAGE_LABELS'].items()})
+if app.config.get('PREFETCH_LABELS', False):
+    # get the labels of all item-based language codes (abc-x-Q123) of the templates up front,
+    # in as few requests as possible, so that rendering a page doesn’t have to wait for them
+    # (with gunicorn’s preload_app, this happens once in the master process)
+    language_labels.prefetch(template['language_code'] for template in templates_without_redirects.values())
+else:
+    # only use the labels saved by earlier runs, if any, without making requests at import time
+    language_labels.load()
+grammatical_feature_labels = ItemLabelCache()
+if 'GRAMMATICAL_FEATURE_LABELS' in app.config:
+    grammatical_feature_labels.configure(**{key.lower(): value for key, value in app.config['GRAMMATICAL_FEATURE_LABELS'].items()})
+if app.config.get('PREFETCH_LABELS', False):
+    # likewise, get the labels of all grammatical features of the templates (in the template languages),
+    # so that the edit page doesn’t have to wait for them
+    for wiki in ['www', 'test']:
+        grammatical_features_item_ids_by_language: dict[str, set[str]] = {}
+        for template in templates_without_redirects.values():
+            if ('test' in template) != (wiki == 'test'):
+                continue
+            grammatical_features_item_ids = grammatical_features_item_ids_by_language.setdefault(template['language_code'], set())
+            for template_form in template['forms']:
+                grammatical_features_item_ids.update(template_form['grammatical_features_item_ids'])
+        if grammatical_features_item_ids_by_language:
+            grammatical_feature_labels.prefetch(
+                wiki,
+                grammatical_features_item_ids_by_language,
+                api_languages={language: lang_lex2int(language) for language in grammatical_features_item_ids_by_language},
+            )
+else:
+    grammatical_feature_labels.load()
 if 'OAUTH' in app.config:
     assert app.secret_key is not None, 'If OAuth is configured, the SECRET_KEY must also be configured (a fixed random string)'
     oauth = MWOAuth2FlaskMWApi(
@@ -67,6 +126,15 @@ else:
     if app.secret_key is None:
         app.secret_key = 'fake'
 
+def bulk_config() -> dict[str, Any]:
+    return {key.lower(): value for key, value in app.config.get('BULK', {}).items()}
+
+# asynchronous bulk mode jobs, only available if a job database is configured
+# (the jobs are processed by bulk_worker.py, which gunicorn starts next to the web workers)
+bulk_job_store: Optional[BulkJobStore] = None
+if 'OAUTH' in app.config and 'jobs_database' in bulk_config():
+    bulk_job_store = BulkJobStore(bulk_config()['jobs_database'])
+
 class BoundTemplate(MatchedTemplate):
     lexeme_id: str
     lexeme_revision: str
@@ -102,6 +170,11 @@ def denyFrame(response: werkzeug.Response) -> werkzeug.Response:
     response.headers['X-Frame-Options'] = 'deny'
     return response
 
+@app.after_request
+def update_session_pool_metrics(response: werkzeug.Response) -> werkzeug.Response:
+    anonymous_sessions.update_metrics()
+    return response
+
 @app.template_filter()
 def form2label(form: TemplateForm) -> Markup:
     ret = Markup.escape(form['label'])
@@ -282,10 +355,45 @@ def opted_into_wikifunctions(username: str) -> Optional[bool]:
 def index() -> RRV:
     return flask.render_template(
         'index.html',
-        templates=templates_without_redirects,
-        can_use_bulk_mode=can_use_bulk_mode(),
+        templates_list=index_templates_list(can_use_bulk_mode()),
     )
 
+# rendered template lists of the index page,
+# by interface language code, qqx mode, bulk mode links and script root
+index_templates_lists: dict[tuple[str, bool, bool, str], Markup] = {}
+
+def index_templates_list(can_use_bulk_mode: bool) -> Markup:
+    """Get the rendered list of templates for the index page.
+
+    Rendering the list takes a while (each group heading needs the language name,
+    possibly from Wikidata), but apart from the interface language and
+    whether the user can use bulk mode, it never changes,
+    so it is only rendered once for each combination and then cached."""
+    key = (flask.g.interface_language_code, flask.g.qqx, can_use_bulk_mode, flask.request.script_root)
+    templates_list = index_templates_lists.get(key)
+    if templates_list is None:
+        # render the list as if it was already inside the <html> element of base.html,
+        # so that the same elements get lang= attributes as when rendering it there
+        push_html_lang(flask.g.interface_language_code)
+        try:
+            templates_list = Markup(flask.render_template(
+                'index_templates.html',
+                templates=templates_without_redirects,
+                can_use_bulk_mode=can_use_bulk_mode,
+            ))
+        finally:
+            pop_html_lang(flask.g.interface_language_code)
+        index_templates_lists[key] = templates_list
+    return templates_list
+
+def warm_index_templates_lists() -> None:
+    """Render the index page template lists for all interface languages in advance."""
+    for interface_language_code in i18n.translations:
+        with app.test_request_context('/', query_string={'uselang': interface_language_code}):
+            app.preprocess_request()
+            for can_use_bulk_mode in (False, True):
+                index_templates_list(can_use_bulk_mode)
+
 @app.get('/settings/')
 def settings() -> RRV:
     return flask.render_template(
@@ -364,14 +472,17 @@ def process_template_bulk(template_name: str) -> RRV:
     readonly = 'OAUTH' in app.config and not oauth.has_access_token()
 
     if not can_use_bulk_mode() and not readonly:
-        user_name = None
-        userinfo = get_userinfo()
-        if userinfo is not None:
-            user_name = userinfo['name']
-        return flask.render_template(
-            'bulk-not-allowed.html',
-            user_name=user_name,
-        )
+        # the user may have become autoconfirmed since their userinfo was cached, check again
+        evict_userinfo()
+        if not can_use_bulk_mode():
+            user_name = None
+            userinfo = get_userinfo()
+            if userinfo is not None:
+                user_name = userinfo['name']
+            return flask.render_template(
+                'bulk-not-allowed.html',
+                user_name=user_name,
+            )
 
     if (flask.request.method == 'POST' and
             '_bulk_mode' in flask.request.form and
@@ -418,32 +529,22 @@ def process_template_bulk(template_name: str) -> RRV:
                 show_optional_forms_hint=show_optional_forms_hint,
             )
 
-        results = []  # type: list[dict]
+        if bulk_job_store is not None:
+            # the worker can’t refresh the token, so it should stay valid for a while
+            refresh_access_token_if_expiring(margin=60 * 60)
+            job_id = bulk_job_store.create_job(
+                template['@template_name'],
+                build_summary(template, form_data),
+                (oauth.get_access_token() or {}).get('access_token'),
+                lexemes,
+            )
+            return flask.redirect(flask.url_for(
+                'process_template_bulk_job',
+                template_name=template['@template_name'],
+                job_id=job_id,
+            ), code=303)
 
-        for lexeme in lexemes:
-            if not lexeme.get('lexeme_id'):
-                duplicates = find_duplicates(template, lexeme)
-                if duplicates:
-                    results.append({
-                        'duplicates': duplicates,
-                        'form_representations': lexeme.getlist('form_representation'),
-                    })
-                    continue
-            lexeme_data = build_lexeme(template, lexeme)
-            summary = build_summary(template, form_data)
-
-            if 'OAUTH' in app.config:
-                lexeme_id, lexeme_uri = submit_lexeme(template, lexeme_data, summary, bot=True)
-                results.append({
-                    'lexeme_data': lexeme_data,
-                    'lexeme_id': lexeme_id,
-                    'lexeme_uri': lexeme_uri,
-                })
-            else:
-                print(summary)
-                results.append({
-                    'lexeme_data': lexeme_data,
-                })
+        results = process_bulk_lexemes(template, lexemes, form_data)
 
         if 'OAUTH' in app.config:
             return flask.render_template(
@@ -493,6 +594,187 @@ def process_template_bulk(template_name: str) -> RRV:
             readonly=readonly,
         )
 
+@app.get('/template/<template_name>/bulk/job/<job_id>')
+def process_template_bulk_job(template_name: str, job_id: str) -> RRV:
+    job = get_bulk_job(job_id)
+    if job['template_name'] != template_name:
+        flask.abort(404)
+    template = templates_without_redirects[template_name]
+    return flask.render_template(
+        'bulk-job.html',
+        template=template,
+        job=job,
+        results=cast(BulkJobStore, bulk_job_store).get_results(job_id),
+    )
+
+@app.get('/api/v1/bulk_job/<job_id>')
+def bulk_job_api(job_id: str) -> RRV:
+    job = get_bulk_job(job_id)
+    offset = flask.request.args.get('offset', 0, type=int)
+    results = cast(BulkJobStore, bulk_job_store).get_results(job_id, offset)
+    return flask.jsonify({
+        'done': job['status'] == 'done',
+        'num_results': len(results),
+        'html': flask.render_template(
+            'bulk-job-results.html',
+            template=templates_without_redirects[job['template_name']],
+            results=results,
+        ),
+    })
+
+def get_bulk_job(job_id: str) -> BulkJob:
+    if bulk_job_store is None:
+        flask.abort(404)
+    job = bulk_job_store.get_job(job_id)
+    if job is None:
+        flask.abort(404)
+    return job
+
+def process_bulk_job(job_store: BulkJobStore, job: BulkJob) -> None:
+    """Process the pending lines of a bulk mode job (called by bulk_worker.py).
+
+    The edits are made with the access token of the user who created the job
+    (outside of any request, see access_token_session()),
+    which is forgotten once the job is done."""
+    template = templates_without_redirects[job['template_name']]
+    pending_lines = job_store.get_pending_lines(job['id'])
+    with app.app_context():
+        results = iter_bulk_results(
+            template,
+            [lexeme for line_index, lexeme in pending_lines],
+            job['summary'],
+            errors_as_results=True,
+            access_token=job['access_token'],
+        )
+        for (line_index, lexeme), result in zip(pending_lines, results):
+            job_store.set_result(job['id'], line_index, result)
+    job_store.finish_job(job['id'])
+
+def process_bulk_lexemes(
+        template: Template,
+        lexemes: list[werkzeug.datastructures.MultiDict],
+        form_data: werkzeug.datastructures.MultiDict,
+) -> list[dict]:
+    """Create or edit the given lexemes and return one result per lexeme, in order.
+
+    The results are also counted in the bulk_lines metric;
+    bulk jobs are not, since the bulk worker’s metrics are not collected."""
+    results = []
+    try:
+        for result in iter_bulk_results(template, lexemes, build_summary(template, form_data)):
+            metrics.bulk_lines.labels('duplicates' if 'duplicates' in result else 'done').inc()
+            results.append(result)
+    except (werkzeug.exceptions.HTTPException, mwapi.errors.APIError):
+        metrics.bulk_lines.labels('error').inc()
+        raise
+    return results
+
+def iter_bulk_results(
+        template: Template,
+        lexemes: list[werkzeug.datastructures.MultiDict],
+        summary: str,
+        errors_as_results: bool = False,
+        access_token: Optional[str] = None,
+) -> Iterator[dict]:
+    """Create or edit the given lexemes and yield one result per lexeme, in order.
+
+    The duplicate checks (for new lexemes) and the lexeme data (for existing lexemes)
+    are fetched concurrently up front, with a configurable number of threads;
+    the submissions then happen one by one, in input order,
+    spaced out to stay within Wikidata’s edit rate limits.
+    Since the duplicate checks cannot see lexemes created later in the same batch,
+    a new lexeme with the same lemma as one created earlier in the batch
+    gets that lexeme as its duplicate instead of being created again.
+
+    If errors_as_results is true, an HTTP or API error for one lexeme
+    is yielded as an error result and processing continues with the next lexeme;
+    otherwise, the error is raised.
+
+    The edits are made with the given access token if there is one,
+    otherwise with the OAuth session of the current request."""
+    config = bulk_config()
+    wiki = 'test' if 'test' in template else 'www'
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(config.get('concurrency', 8)))
+    try:
+        duplicates_futures = prefetch(
+            executor,
+            lambda lexeme: find_duplicates(template, lexeme),
+            [lexeme if not lexeme.get('lexeme_id') else None for lexeme in lexemes],
+        )
+        lexeme_data_futures = prefetch(
+            executor,
+            lambda lexeme_id: get_lexeme_data(lexeme_id, wiki),
+            [lexeme.get('lexeme_id') or None for lexeme in lexemes],
+        )
+        edit_rate_limiter = RateLimiter(float(config.get('edits_per_minute', 90)))
+        created_lexemes: dict[str, Duplicate] = {}  # by NFC lemma
+
+        for lexeme, duplicates_future, lexeme_data_future in zip(lexemes, duplicates_futures, lexeme_data_futures):
+            lemma = get_lemma(template, lexeme) if duplicates_future is not None else None
+            if lemma is not None:
+                lemma = unicodedata.normalize('NFC', lemma)
+                if lemma in created_lexemes:
+                    yield {
+                        'duplicates': [created_lexemes[lemma]],
+                        'form_representations': lexeme.getlist('form_representation'),
+                    }
+                    continue
+            try:
+                result = bulk_result(template, lexeme, summary, duplicates_future, lexeme_data_future, edit_rate_limiter, access_token)
+            except (werkzeug.exceptions.HTTPException, mwapi.errors.APIError) as error:
+                if not errors_as_results:
+                    raise
+                yield {
+                    'error': str(error),
+                    'form_representations': lexeme.getlist('form_representation'),
+                }
+            else:
+                if lemma is not None and 'lexeme_id' in result:
+                    created_lexemes[lemma] = {
+                        'id': result['lexeme_id'],
+                        'uri': result['lexeme_uri'],
+                        'label': lemma,
+                        'description': template['label'],
+                        'forms_count': str(len(result['lexeme_data']['forms'])),
+                        'senses_count': str(len(result['lexeme_data'].get('senses', []))),
+                    }
+                yield result
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def bulk_result(
+        template: Template,
+        lexeme: werkzeug.datastructures.MultiDict,
+        summary: str,
+        duplicates_future: Optional[concurrent.futures.Future[list[Duplicate]]],
+        lexeme_data_future: Optional[concurrent.futures.Future[Lexeme]],
+        edit_rate_limiter: RateLimiter,
+        access_token: Optional[str] = None,
+) -> dict:
+    if duplicates_future is not None:
+        duplicates = duplicates_future.result()
+        if duplicates:
+            return {
+                'duplicates': duplicates,
+                'form_representations': lexeme.getlist('form_representation'),
+            }
+    existing_lexeme_data = lexeme_data_future.result() if lexeme_data_future is not None else None
+    lexeme_data = build_lexeme(template, lexeme, existing_lexeme_data=existing_lexeme_data)
+
+    if 'OAUTH' in app.config:
+        edit_rate_limiter.wait()
+        lexeme_id, lexeme_uri = submit_lexeme(template, lexeme_data, summary, bot=True, access_token=access_token)
+        return {
+            'lexeme_data': lexeme_data,
+            'lexeme_id': lexeme_id,
+            'lexeme_uri': lexeme_uri,
+        }
+    else:
+        print(summary)
+        return {
+            'lexeme_data': lexeme_data,
+        }
+
 @app.route('/template/<template_name>/edit/<lexeme_id>', methods=['GET', 'POST'])
 def process_template_edit(template_name: str, lexeme_id: str) -> RRV:
     response = if_no_such_template_redirect(template_name)
@@ -554,7 +836,7 @@ def process_template_edit(template_name: str, lexeme_id: str) -> RRV:
     template = cast(BoundTemplate, template)
 
     add_labels_to_lexeme_forms_grammatical_features(
-        anonymous_session(f'https://{wiki}.wikidata.org'),
+        wiki,
         template_language_code,
         template.get('unmatched_lexeme_forms', []) + template.get('ambiguous_lexeme_forms', [])
     )
@@ -604,6 +886,7 @@ def oauth_callback() -> RRV:
         return flask.render_template('error-oauth-callback.html',
                                      already_logged_in=oauth.has_access_token(),
                                      query_string=flask.request.query_string.decode('utf8'))
+    evict_userinfo()
     flask.session.permanent = True
     flask.session.pop('_csrf_token', None)
     redirect_target = flask.session.pop('oauth_redirect_target', None)
@@ -620,6 +903,7 @@ def login() -> RRV:
 
 @app.route('/logout')
 def logout() -> RRV:
+    evict_userinfo()
     try:
         oauth.pop_access_token()
     except KeyError:
@@ -724,10 +1008,26 @@ def get_duplicates_api(wiki: str, language_code: str, lemma: str) -> RRV:
     else:
         return flask.jsonify(matches)
 
+# cache of recent duplicate lookups, keyed by (wiki, language code, NFC lemma);
+# entries expire after a short time, and are evicted by submit_lexeme()
+# so that a newly created lexeme is immediately found as a duplicate
+duplicates_cache: TtlCache[tuple[str, str, str], list[Duplicate]] = TtlCache(maxsize=1024, ttl=60, name='duplicates')
+
 def get_duplicates(wiki: str, language_code: str, lemma: str) -> list[Duplicate]:
+    lemma = unicodedata.normalize('NFC', lemma)
+    duplicates = duplicates_cache.get_or_compute(
+        (wiki, language_code, lemma),
+        lambda: query_duplicates(wiki, language_code, lemma),
+    )
+    return list(duplicates)
+
+def evict_duplicates(wiki: str, lemmas: LexemeLemmas) -> None:
+    for lemma in lemmas.values():
+        duplicates_cache.pop((wiki, lemma['language'], unicodedata.normalize('NFC', lemma['value'])))
+
+def query_duplicates(wiki: str, language_code: str, lemma: str) -> list[Duplicate]:
     session = anonymous_session(f'https://{wiki}.wikidata.org')
 
-    lemma = unicodedata.normalize('NFC', lemma)
     api_language_code = lang_lex2int(language_code)
 
     response = session.get(
@@ -786,10 +1086,7 @@ def render_advanced_partial_forms_hint(_unused: Optional[str] = None) -> RRV:
 def match_templates_to_lexeme_id(wiki: str, lexeme_id: str) -> RRV:
     lexeme_data = get_lexeme_data(lexeme_id, wiki)
 
-    return flask.jsonify({
-        template_name: match_template_to_lexeme_data(template, lexeme_data)
-        for template_name, template in templates_without_redirects.items()
-    })
+    return flask.jsonify(match_templates_to_lexeme_data(lexeme_data))
 
 @app.route('/api/v1/match_template_to_lexeme/<any(www,test):wiki>/<lexeme_id>/<template_name>')
 @enableCORS
@@ -815,14 +1112,153 @@ def match_template_to_lexeme_id(wiki: str, lexeme_id: str, template_name: str) -
 
     return flask.jsonify(match_template_to_lexeme_data(template, lexeme_data))
 
+# the maximum number of lexemes for one request to match_templates_to_lexeme_ids()
+max_batch_match_lexemes = 500
+
+@app.route('/api/v1/match_template_to_lexemes/<any(www,test):wiki>', methods=['POST'])
+@enableCORS
+def match_templates_to_lexeme_ids(wiki: str) -> RRV:
+    """Match many lexemes at once.
+
+    The request body is a JSON object with a "lexeme_ids" list
+    and an optional "template_names" list (by default, all templates).
+    The response is NDJSON, one line per lexeme in the same order,
+    streamed as soon as each chunk of lexemes has been fetched."""
+    body = flask.request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get('lexeme_ids'), list):
+        return '"request body must be a JSON object with a lexeme_ids list"\n', 400
+    lexeme_ids = body['lexeme_ids']
+    if len(lexeme_ids) > max_batch_match_lexemes:
+        return f'"at most {max_batch_match_lexemes} lexeme_ids allowed"\n', 400
+    for lexeme_id in lexeme_ids:
+        if not isinstance(lexeme_id, str) or not re.fullmatch(r'L[1-9][0-9]*', lexeme_id):
+            return '"invalid lexeme ID"\n', 400
+
+    template_names: Optional[list[str]] = None
+    if 'template_names' in body:
+        if not isinstance(body['template_names'], list):
+            return '"template_names must be a list"\n', 400
+        template_names = []
+        for template_name in body['template_names']:
+            template = templates.get(template_name) if isinstance(template_name, str) else None
+            if template is None:
+                return '"no such template"\n', 400
+            elif isinstance(template, str):
+                template_names.append(template)
+            elif isinstance(template, list):
+                template_names.extend(template)
+            else:
+                template_names.append(template_name)
+
+    def generate() -> Iterator[str]:
+        for lexeme_id, lexeme_data in iter_lexemes_data(lexeme_ids, wiki):
+            result: dict[str, Any]
+            if lexeme_data is None:
+                result = {'lexeme_id': lexeme_id, 'error': 'missing'}
+            else:
+                result = {'lexeme_id': lexeme_id, 'matches': match_templates_to_batch_lexeme_data(lexeme_data, template_names)}
+            yield app.json.dumps(result) + '\n'
+
+    return flask.Response(
+        flask.stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+    )
+
+def match_templates_to_batch_lexeme_data(lexeme_data: Lexeme, template_names: Optional[list[str]]) -> dict[str, dict]:
+    """Match the lexeme against the templates (by default, all of them).
+
+    For each template that the lexeme matches (same language and lexical category,
+    no conflicting statements), the result also includes which lexeme forms
+    match which template forms, as IDs."""
+    if template_names is None:
+        overall_matches = match_templates_to_lexeme_data(lexeme_data)
+    else:
+        overall_matches = {
+            template_name: match_template_to_lexeme_data(templates_without_redirects[template_name], lexeme_data)
+            for template_name in template_names
+        }
+    matches: dict[str, dict] = {}
+    for template_name, overall_match in overall_matches.items():
+        match: dict = dict(overall_match)
+        if overall_match['language'] and overall_match['lexical_category'] and not overall_match['conflicting_statements']:
+            matched_template = match_lexeme_forms_to_template(lexeme_data['forms'], templates_without_redirects[template_name])
+            match['forms'] = [
+                [lexeme_form['id'] for lexeme_form in cast(MatchedTemplateForm, template_form).get('lexeme_forms', [])]
+                for template_form in matched_template['forms']
+            ]
+            match['ambiguous_lexeme_forms'] = [lexeme_form['id'] for lexeme_form in matched_template.get('ambiguous_lexeme_forms', [])]
+            match['unmatched_lexeme_forms'] = [lexeme_form['id'] for lexeme_form in matched_template.get('unmatched_lexeme_forms', [])]
+        matches[template_name] = match
+    return matches
+
+def iter_lexemes_data(lexeme_ids: list[str], wiki: str) -> Iterator[tuple[str, Optional[Lexeme]]]:
+    """Get the latest data of the given lexemes, in order (None for missing lexemes).
+
+    Lexemes that are not cached are fetched with one wbgetentities call per chunk of 50 lexemes."""
+    session = anonymous_session(f'https://{wiki}.wikidata.org')
+    for chunk_start in range(0, len(lexeme_ids), 50):
+        chunk = lexeme_ids[chunk_start:chunk_start + 50]
+        lexemes_data = {lexeme_id: get_cached_lexeme_data(lexeme_id, wiki) for lexeme_id in chunk}
+        uncached_lexeme_ids = [lexeme_id for lexeme_id, lexeme_data in lexemes_data.items() if lexeme_data is None]
+        if uncached_lexeme_ids:
+            response = session.get(
+                action='wbgetentities',
+                ids=uncached_lexeme_ids,
+            )
+            for entity_id, entity_data in response['entities'].items():
+                if 'redirects' in entity_data:
+                    entity_id = entity_data['redirects']['from']
+                if 'missing' in entity_data or entity_id not in lexemes_data:
+                    continue
+                cache_lexeme_data(entity_id, wiki, entity_data, latest=True)
+                lexemes_data[entity_id] = entity_data
+        for lexeme_id in chunk:
+            yield lexeme_id, lexemes_data[lexeme_id]
+
+# lexeme JSON by (wiki, lexeme ID, revision ID) – a revision never changes, so these entries never expire,
+# but the cache is bounded by the total length of the JSON, not the number of lexemes
+lexeme_revisions_cache: SizedLruCache[tuple[str, str, str]] = SizedLruCache(max_size=32 * 1024 * 1024, name='lexeme_revisions')
+# latest revision ID by (wiki, lexeme ID), so that repeated lookups of a lexeme shortly after each other
+# can use the revision cache; entries expire after a short time, and are evicted by submit_lexeme()
+latest_lexeme_revisions_cache: TtlCache[tuple[str, str], str] = TtlCache(maxsize=4096, ttl=10, name='latest_lexeme_revisions')
+
 def get_lexeme_data(lexeme_id: str, wiki: str, revision: Optional[str] = None) -> Lexeme:
+    lexeme_data = get_cached_lexeme_data(lexeme_id, wiki, revision)
+    if lexeme_data is not None:
+        return lexeme_data
+
+    lexeme_data = query_lexeme_data(lexeme_id, wiki, revision)
+    cache_lexeme_data(lexeme_id, wiki, lexeme_data, latest=not revision)
+    return lexeme_data
+
+def get_cached_lexeme_data(lexeme_id: str, wiki: str, revision: Optional[str] = None) -> Optional[Lexeme]:
+    if not revision:
+        revision = latest_lexeme_revisions_cache.get((wiki, lexeme_id))
+    if not revision:
+        return None
+    lexeme_json = lexeme_revisions_cache.get((wiki, lexeme_id, revision))
+    if lexeme_json is None:
+        return None
+    # parse the JSON again for each caller, so that they can modify the lexeme data
+    return json.loads(lexeme_json)
+
+def cache_lexeme_data(lexeme_id: str, wiki: str, lexeme_data: Lexeme, latest: bool) -> None:
+    if 'lastrevid' not in lexeme_data:  # e. g. missing lexemes
+        return
+    lastrevid = str(lexeme_data['lastrevid'])
+    lexeme_revisions_cache.set((wiki, lexeme_id, lastrevid), json.dumps(lexeme_data))
+    if latest:
+        latest_lexeme_revisions_cache.set((wiki, lexeme_id), lastrevid)
+
+def query_lexeme_data(lexeme_id: str, wiki: str, revision: Optional[str] = None) -> Lexeme:
     host = f'https://{wiki}.wikidata.org'
     session = anonymous_session(host)
 
     if revision:
-        entities_data = session.session.get(
-            f'{host}/wiki/Special:EntityData/{lexeme_id}.json?revision={revision}',
-        ).json()
+        with timing.timed('mwapi-entitydata'):
+            entities_data = session.session.get(
+                f'{session.host}/wiki/Special:EntityData/{lexeme_id}.json?revision={revision}',
+            ).json()
     else:
         entities_data = session.get(
             action='wbgetentities',
@@ -837,10 +1273,13 @@ def add_form_data_to_template(
         template,  # no static type – some vague kind of Template
         overwrite: bool = True,
 ):  # no static return type – some vague kind of Template
-    template = copy.deepcopy(template)
-    for (form_representation, form) in zip(form_data.getlist('form_representation'), template['forms']):
+    # only copy the template and the forms that get a new value;
+    # everything else (e. g. the statements) stays shared with the original template
+    forms = list(template['forms'])
+    for index, (form_representation, form) in enumerate(zip(form_data.getlist('form_representation'), forms)):
         if overwrite or not form.get('value'):
-            form['value'] = form_representation
+            forms[index] = {**form, 'value': form_representation}
+    template = {**template, 'forms': forms}
     if 'lexeme_id' in form_data:
         template['lexeme_id'] = form_data['lexeme_id']
     if 'generated_via' in form_data:
@@ -887,7 +1326,11 @@ def can_use_bulk_mode() -> bool:
     userinfo = get_userinfo()
     return userinfo is not None and 'autoconfirmed' in userinfo['groups']
 
-def build_lexeme(template: Template, form_data: werkzeug.datastructures.MultiDict) -> Lexeme:
+def build_lexeme(
+        template: Template,
+        form_data: werkzeug.datastructures.MultiDict,
+        existing_lexeme_data: Optional[Lexeme] = None,
+) -> Lexeme:
     lang = template['language_code']
     forms = []
     form_representations = form_data.getlist('form_representation')
@@ -905,8 +1348,10 @@ def build_lexeme(template: Template, form_data: werkzeug.datastructures.MultiDic
     lexeme_id = form_data.get('lexeme_id', '')
     if lexeme_id:
         lexeme_data['id'] = lexeme_id
-        wiki = 'test' if 'test' in template else 'www'
-        match = match_template_to_lexeme_data(template, get_lexeme_data(lexeme_id, wiki))
+        if existing_lexeme_data is None:
+            wiki = 'test' if 'test' in template else 'www'
+            existing_lexeme_data = get_lexeme_data(lexeme_id, wiki)
+        match = match_template_to_lexeme_data(template, existing_lexeme_data)
         # TODO warn if match['conflicting_statements']?
         lexeme_data['claims'] = match['missing_statements']
     else:
@@ -1101,62 +1546,100 @@ def build_summary(template: Template, form_data: werkzeug.datastructures.MultiDi
 
     return summary
 
-def submit_lexeme(template: Template, lexeme_data: Lexeme, summary: str, bot: bool = False) -> tuple[str, str]:
+def submit_lexeme(
+        template: Template,
+        lexeme_data: Lexeme,
+        summary: str,
+        bot: bool = False,
+        access_token: Optional[str] = None,
+) -> tuple[str, str]:
     if 'test' in template:
         host = 'https://test.wikidata.org'
     else:
         host = 'https://www.wikidata.org'
-    session = authenticated_session(host)
+    if access_token is not None:
+        session: Optional[mwapi.Session] = access_token_session(host, access_token)
+        identity = access_token_identity(access_token)
+    else:
+        session = authenticated_session(host)
+        identity = oauth_identity()
     if session is None:
         flask.abort(403)  # this should never happen, submit_lexeme() should only be called if user is logged in
 
-    token = session.get(action='query', meta='tokens')['query']['tokens']['csrftoken']
     selector = {'id': lexeme_data['id']} if 'id' in lexeme_data else {'new': 'lexeme'}
     if 'base_revision_id' in lexeme_data:
         selector['baserevid'] = lexeme_data['base_revision_id']
-    response = session.post(
-        action='wbeditentity',
-        data=json.dumps(lexeme_data),
-        summary=summary,
-        token=token,
-        bot=bot,
-        **selector
-    )
+    csrf_tokens_key = (identity, host)
+
+    def edit() -> dict:
+        token = csrf_tokens_cache.get_or_compute(csrf_tokens_key, lambda: query_csrf_token(session))
+        return session.post(
+            action='wbeditentity',
+            data=json.dumps(lexeme_data),
+            summary=summary,
+            token=token,
+            bot=bot,
+            **selector
+        )
+
+    try:
+        response = edit()
+    except mwapi.errors.APIError as e:
+        if e.code != 'badtoken':
+            raise
+        # the cached token is no longer valid, get a new one and try once more
+        csrf_tokens_cache.pop(csrf_tokens_key)
+        response = edit()
     lexeme_id = response['entity']['id']
+    wiki = 'test' if 'test' in template else 'www'
+    evict_duplicates(wiki, lexeme_data.get('lemmas', {}))
+    latest_lexeme_revisions_cache.pop((wiki, lexeme_id))
 
     lexeme_uri = host + '/entity/' + lexeme_id
     return lexeme_id, lexeme_uri
 
+# CSRF tokens for edits, keyed by (OAuth identity, host),
+# so that e.g. bulk mode only needs to fetch the token once
+csrf_tokens_cache: TtlCache[tuple[str, str], str] = TtlCache(maxsize=1024, ttl=60 * 60, name='csrf_tokens')
+
+def oauth_identity() -> str:
+    """Get a key that identifies the current OAuth session.
+
+    This is a hash of the access token, so that the token itself
+    does not end up in any cache."""
+    if 'OAUTH' not in app.config:
+        return ''
+    access_token = oauth.get_access_token() or {}
+    return access_token_identity(str(access_token.get('access_token', '')))
+
+def access_token_identity(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode('utf8')).hexdigest()
+
+def query_csrf_token(session: mwapi.Session) -> str:
+    return session.get(action='query', meta='tokens')['query']['tokens']['csrftoken']
+
 def add_hash_to_uri(uri: str, hash: Optional[str]) -> str:
     assert '#' not in uri
     if hash is not None:
         uri += '#' + hash
     return uri
 
-def add_labels_to_lexeme_forms_grammatical_features(session, language, lexeme_forms):
+def add_labels_to_lexeme_forms_grammatical_features(wiki, language, lexeme_forms):
     grammatical_features_item_ids = set()
     for lexeme_form in lexeme_forms:
         grammatical_features_item_ids.update(lexeme_form['grammaticalFeatures'])
-    grammatical_features_item_ids = list(grammatical_features_item_ids)
-    labels_map = {}  # item ID to label
-    while grammatical_features_item_ids:
-        chunk, grammatical_features_item_ids = grammatical_features_item_ids[:50], grammatical_features_item_ids[50:]
-        response = session.get(action='wbgetentities',
-                               ids=chunk,
-                               props=['labels'],
-                               languages=[lang_lex2int(language)],
-                               languagefallback=True,
-                               formatversion=2)
-        for item_id, item in response['entities'].items():
-            labels_map[item_id] = item['labels'].get(language, {'language': 'zxx', 'value': item_id})
+    labels_map = grammatical_feature_labels.labels(wiki,
+                                                   grammatical_features_item_ids,
+                                                   language,
+                                                   api_language=lang_lex2int(language))
     for lexeme_form in lexeme_forms:
-        lexeme_form['grammaticalFeatures_labels'] = [labels_map[grammatical_feature_item_id]
+        lexeme_form['grammaticalFeatures_labels'] = [labels_map[grammatical_feature_item_id] or {'language': 'zxx', 'value': grammatical_feature_item_id}
                                                      for grammatical_feature_item_id in lexeme_form['grammaticalFeatures']]
 
 @app.route('/api/v1/template/')
 @enableCORS
 def get_all_templates_api() -> RRV:
-    return flask.jsonify(templates)
+    return precomputed_template_api(None).response(flask.request)
 
 @app.route('/api/v1/template/<template_name>')
 @enableCORS
@@ -1169,13 +1652,25 @@ def get_template_api(template_name: str) -> RRV:
             'get_template_api',
             template_name=template,
         ), code=307)
-    elif isinstance(template, list):
-        return flask.jsonify([
+    else:
+        return precomputed_template_api(template_name).response(flask.request)
+
+@functools.cache
+def precomputed_template_api(template_name: Optional[str]) -> PrecomputedJSON:
+    """Get the serialized template API response for the template name,
+    or for all templates if the name is None.
+
+    The templates never change while the tool is running,
+    so each response only needs to be serialized once."""
+    if template_name is None:
+        return PrecomputedJSON(app, dict(templates))  # read-only mappings are not JSON serializable
+    template = templates[template_name]
+    if isinstance(template, list):
+        return PrecomputedJSON(app, [
             templates[replacement_name]
             for replacement_name in template
         ])
-    else:
-        return flask.jsonify(template)
+    return PrecomputedJSON(app, template)
 
 @app.route('/api/v1/wikifunctions/<template_name>/<lemma>/<path:function_name>')
 def wikifunctions_api(template_name: str, lemma: str, function_name: str) -> RRV:
@@ -1184,61 +1679,172 @@ def wikifunctions_api(template_name: str, lemma: str, function_name: str) -> RRV
         return '"no such template"\n', 404
     elif isinstance(template, str) or isinstance(template, list):
         return '"must be a real template, not a redirect"\n', 400
-    result: list[Optional[str]] = []
-    result_cache: dict[str, Optional[str]] = {}  # map wikifunction ID to result of calling it with lemma
+    # the calls are made in other threads, where an expired token could not be refreshed
+    refresh_access_token_if_expiring()
     session = authenticated_session('https://www.wikifunctions.org')
     if session is None:
         return '"must be logged in"\n', 403
-    for form in template['forms']:
-        wikifunction = form.get('wikifunctions', {}).get(function_name)
-        if not wikifunction:
-            result.append(None)
-            continue
-        if wikifunction in result_cache:
-            result.append(result_cache[wikifunction])
-            continue
-        response = session.get(action='wikifunctions_run',
-                               function_call=json.dumps({
-                                   'Z1K1': 'Z7',
-                                   'Z7K1': wikifunction,
-                                   wikifunction + 'K1': lemma,
-                               }),
-                               formatversion=2)
-        if not isinstance(response.get('wikifunctions_run', {}).get('data'), str):
-            raise ValueError('Invalid Wikifunctions API response')
-        inner_response = json.loads(response['wikifunctions_run']['data'])
-        # TODO check whether the Z22 represents success or failure?
-        response_value = inner_response['Z22K1']
-        if response_value == 'Z24':  # void
-            response_value = None
-        elif isinstance(response_value, list):
-            assert response_value[0] == 'Z6'  # list of strings
-            response_value = response_value[1:]
-        else:
-            assert isinstance(response_value, str)
-        result_cache[wikifunction] = response_value
-        result.append(response_value)
+    wikifunctions = [form.get('wikifunctions', {}).get(function_name) for form in template['forms']]
+    futures = start_wikifunctions_calls(session, wikifunctions, lemma)
+    if flask.request.args.get('stream'):
+        # one line per form as soon as its function call is done, instead of one list at the end
+        return flask.Response(
+            iter_wikifunctions_results(wikifunctions, futures),
+            mimetype='application/x-ndjson',
+        )
+    result: list[Optional[str]] = [
+        futures[wikifunction].result() if wikifunction else None
+        for wikifunction in wikifunctions
+    ]
     return result
 
+def iter_wikifunctions_results(
+        wikifunctions: list[Optional[str]],
+        futures: dict[str, concurrent.futures.Future],
+) -> Iterator[str]:
+    """Yield an NDJSON line with the form index and value for each form, in the order the calls finish.
+
+    Forms without a function get no line; if a call fails,
+    the lines of its forms have an error instead of a value."""
+    form_indices: dict[concurrent.futures.Future, list[int]] = {}
+    for form_index, wikifunction in enumerate(wikifunctions):
+        if wikifunction:
+            form_indices.setdefault(futures[wikifunction], []).append(form_index)
+    for future in concurrent.futures.as_completed(form_indices):
+        line: dict[str, Any]
+        try:
+            line = {'value': future.result()}
+        except Exception as error:
+            app.logger.exception('Error calling Wikifunctions')
+            line = {'error': str(error)}
+        for form_index in form_indices[future]:
+            yield app.json.dumps({'form_index': form_index, **line}) + '\n'
+
+def wikifunctions_config() -> dict[str, Any]:
+    return {key.lower(): value for key, value in app.config.get('WIKIFUNCTIONS', {}).items()}
+
+# results of calling a Wikifunctions function with a lemma, by (function ID, lemma),
+# so that e.g. clicking the button again or reloading the edit page doesn’t call the function again
+wikifunctions_cache: TtlCache[tuple[str, str], Any] = TtlCache(maxsize=4096, ttl=60 * 60, name='wikifunctions')
+
+# the Wikifunctions calls of all requests (of one worker) share these threads,
+# which limits how many calls are made concurrently
+wikifunctions_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(wikifunctions_config().get('concurrency', 4)),
+    thread_name_prefix='wikifunctions',
+)
+
+def start_wikifunctions_calls(
+        session: mwapi.Session,
+        wikifunctions: list[Optional[str]],
+        lemma: str,
+) -> dict[str, concurrent.futures.Future]:
+    """Start calling each distinct function with the lemma concurrently.
+
+    Returns a future for the result of each function, by function ID.
+    The calls run with a copy of the current request context,
+    so that if the session refreshes the OAuth token after all,
+    the new token can still be stored in the Flask session."""
+    return {
+        wikifunction: wikifunctions_executor.submit(
+            wikifunctions_cache.get_or_compute,
+            (wikifunction, lemma),
+            flask.copy_current_request_context(functools.partial(call_wikifunction, session, wikifunction, lemma)),
+        )
+        for wikifunction in dict.fromkeys(wikifunctions)
+        if wikifunction
+    }
+
+def call_wikifunction(session: mwapi.Session, wikifunction: str, lemma: str) -> Any:
+    response = session.get(action='wikifunctions_run',
+                           function_call=json.dumps({
+                               'Z1K1': 'Z7',
+                               'Z7K1': wikifunction,
+                               wikifunction + 'K1': lemma,
+                           }),
+                           formatversion=2)
+    if not isinstance(response.get('wikifunctions_run', {}).get('data'), str):
+        raise ValueError('Invalid Wikifunctions API response')
+    inner_response = json.loads(response['wikifunctions_run']['data'])
+    # TODO check whether the Z22 represents success or failure?
+    response_value = inner_response['Z22K1']
+    if response_value == 'Z24':  # void
+        response_value = None
+    elif isinstance(response_value, list):
+        assert response_value[0] == 'Z6'  # list of strings
+        response_value = response_value[1:]
+    else:
+        assert isinstance(response_value, str)
+    return response_value
+
 @app.route('/healthz')
+@timing.untimed
 def health() -> RRV:
     return ''
 
+@app.route('/metrics')
+@timing.untimed
+def metrics_api() -> RRV:
+    return metrics.exposition()
+
 def authenticated_session(host: str) -> Optional[mwapi.Session]:
-    return oauth.mwapi_session(host=host)
+    # like oauth.mwapi_session(), but with timing
+    oauth2_session = oauth.oauth2_session()
+    if oauth2_session is None:
+        return None
+    return timing.TimedSession(
+        host=anonymous_sessions.api_host(host),
+        user_agent=user_agent,
+        session=oauth2_session,
+    )
 
-def anonymous_session(host: str) -> mwapi.Session:
-    return mwapi.Session(
-        host=host,
+def refresh_access_token_if_expiring(margin: float = 5 * 60) -> None:
+    """Refresh the OAuth access token now if it expires within the margin (in seconds).
+
+    Usually, the OAuth session refreshes an expired token by itself and stores
+    the new one in the Flask session, which only works in the request thread;
+    this lets requests made in other threads start with a token that is still valid."""
+    if 'OAUTH' not in app.config:
+        return
+    access_token = oauth.get_access_token()
+    if access_token is None or access_token.get('expires_at', math.inf) - margin > time.time():
+        return
+    oauth2_session = oauth.oauth2_session()
+    assert oauth2_session is not None
+    token = oauth2_session.refresh_token(oauth2_session.auto_refresh_url, **oauth2_session.auto_refresh_kwargs)
+    oauth2_session.token_updater(token)
+
+def access_token_session(host: str, access_token: str) -> mwapi.Session:
+    """Get a session authenticated with a bare OAuth access token.
+
+    Unlike authenticated_session(), this doesn’t need a request context,
+    but the token can’t be refreshed, so once it expires, API requests fail."""
+    requests_session = requests.Session()
+    requests_session.headers['Authorization'] = f'Bearer {access_token}'
+    return timing.TimedSession(
+        host=anonymous_sessions.api_host(host),
         user_agent=user_agent,
+        session=requests_session,
     )
 
+def anonymous_session(host: str) -> mwapi.Session:
+    return anonymous_sessions.session(host)
+
+# userinfo (name, groups etc.) by OAuth identity (see oauth_identity()),
+# so that not every page view of a logged-in user needs an extra API request
+userinfo_cache: TtlCache[str, Optional[dict]] = TtlCache(maxsize=1024, ttl=5 * 60, name='userinfo')
+
 def get_userinfo() -> Optional[dict]:
     if 'userinfo' not in flask.g:
-        flask.g.userinfo = query_userinfo()
+        flask.g.userinfo = userinfo_cache.get_or_compute(oauth_identity(), query_userinfo)
 
     return flask.g.userinfo
 
+def evict_userinfo() -> None:
+    """Forget the userinfo of the current user, so that it is queried again when next needed."""
+    userinfo_cache.pop(oauth_identity())
+    flask.g.pop('userinfo', None)
+
 def query_userinfo() -> Optional[dict]:
     if 'OAUTH' not in app.config:
         return None
@@ -1256,5 +1862,20 @@ def query_userinfo() -> Optional[dict]:
 @app.errorhandler(mwapi.errors.APIError)
 def handle_api_error(e: mwapi.errors.APIError) -> RRV:
     app.log_exception(e)
+    metrics.mwapi_errors.labels(e.code).inc()
     return flask.render_template('error-api.html',
                                  error=e), 500
+
+def precompile_templates() -> None:
+    """Load all Jinja templates into the environment’s cache.
+
+    With gunicorn’s preload_app, this happens once in the master process,
+    so the workers never need to compile (or load) any template themselves."""
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
+precompile_templates()
+
+if app.config.get('WARM_INDEX_CACHE', False):
+    # with gunicorn’s preload_app, this happens once in the master process, and the workers share the result
+    warm_index_templates_lists()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Microbenchmarks for matching lexemes against templates.
+
+Each sample in benchmark_data/lexemes/ is the entity data (as returned
+by Special:EntityData) of one lexeme, stored under the name of the
+template it belongs to. For each sample, the benchmarks time:
+
+- match_template_to_lexeme_data() for every template,
+  i. e. the work of the match API without grouping templates by statements,
+- match_templates_to_lexeme_data() (the match API itself,
+  i. e. with the templates grouped by statements),
+- match_lexeme_forms_to_template() with the sample’s template
+  (the main work of the edit page),
+- update_lexeme() with the form data of the edit page.
+
+Each sample is also benchmarked in an irregular variant (see irregular_sample()),
+with extra forms that are ambiguous or don’t match any template form,
+so that those code paths are covered even if all the samples are tidy.
+
+Timings depend on the machine, so the baseline is not committed:
+before a change, save a baseline of the unchanged code (--save-baseline,
+written to benchmark_data/baseline.json), then run the benchmarks again
+after the change on the same machine; the script fails if any benchmark
+got slower than that baseline by more than the threshold.
+
+The samples in the repository were constructed from the templates
+(their lexeme IDs are placeholders); to replace one with a real lexeme, run:
+
+    python3 benchmark_matching.py --fetch TEMPLATE_NAME LEXEME_ID"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import timeit
+from typing import Callable, cast
+
+import requests
+import werkzeug.datastructures
+
+import app
+from matching import match_lexeme_forms_to_template, match_template_to_lexeme_data, match_templates_to_lexeme_data, MatchedTemplateForm
+from templates import templates_without_redirects
+from wikibase_types import Lexeme
+
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_data')
+lexemes_directory = os.path.join(directory, 'lexemes')
+baseline_path = os.path.join(directory, 'baseline.json')
+
+
+def load_samples() -> dict[str, Lexeme]:
+    """Load the sample lexemes, by template name."""
+    samples = {}
+    for file_name in sorted(os.listdir(lexemes_directory)):
+        template_name, extension = os.path.splitext(file_name)
+        if extension != '.json':
+            continue
+        with open(os.path.join(lexemes_directory, file_name)) as f:
+            [lexeme_data] = json.load(f)['entities'].values()
+        samples[template_name] = lexeme_data
+    return samples
+
+
+def fetch_sample(template_name: str, lexeme_id: str) -> None:
+    if template_name not in templates_without_redirects:
+        sys.exit(f'no such template: {template_name}')
+    response = requests.get(
+        f'https://www.wikidata.org/wiki/Special:EntityData/{lexeme_id}.json',
+        headers={'User-Agent': app.user_agent},
+    )
+    response.raise_for_status()
+    with open(os.path.join(lexemes_directory, f'{template_name}.json'), 'w') as f:
+        json.dump(response.json(), f, ensure_ascii=False, indent=1)
+        f.write('\n')
+
+
+def irregular_sample(lexeme_data: Lexeme) -> Lexeme:
+    """Get a copy of the sample with extra forms that the template cannot match cleanly.
+
+    One form gets the grammatical features of the first two forms together
+    (so that it usually matches both of their template forms equally well, making it ambiguous),
+    and another form gets no grammatical features at all
+    (so that it usually matches no template form)."""
+    irregular_lexeme_data = cast(dict, copy.deepcopy(lexeme_data))
+    first_forms = irregular_lexeme_data['forms'][:2]
+    extra_forms = [
+        {**copy.deepcopy(first_forms[0]),
+         'grammaticalFeatures': list(dict.fromkeys(grammatical_feature
+                                                   for lexeme_form in first_forms
+                                                   for grammatical_feature in lexeme_form['grammaticalFeatures']))},
+        {**copy.deepcopy(first_forms[0]), 'grammaticalFeatures': []},
+    ]
+    for extra_form in extra_forms:
+        extra_form['id'] = f'{irregular_lexeme_data["id"]}-F{irregular_lexeme_data["nextFormId"]}'
+        irregular_lexeme_data['nextFormId'] += 1
+    irregular_lexeme_data['forms'] += extra_forms
+    return cast(Lexeme, irregular_lexeme_data)
+
+
+def edit_form_data(template_name: str, lexeme_data: Lexeme) -> werkzeug.datastructures.ImmutableMultiDict:
+    """Build the form data that submitting the edit page unchanged would send,
+    plus a representation for each template form without a lexeme form."""
+    template = templates_without_redirects[template_name]
+    language_code = template['language_code']
+    matched_template = match_lexeme_forms_to_template(lexeme_data['forms'], template)
+    form_representations = []
+    for index, template_form in enumerate(matched_template['forms']):
+        lexeme_forms = cast(MatchedTemplateForm, template_form).get('lexeme_forms', [])
+        if lexeme_forms:
+            form_representations.append('/'.join(lexeme_form['representations'][language_code]['value']
+                                                 for lexeme_form in lexeme_forms
+                                                 if language_code in lexeme_form['representations']))
+        else:
+            form_representations.append(f'added{index}')
+    return werkzeug.datastructures.ImmutableMultiDict([
+        ('form_representation', form_representation)
+        for form_representation in form_representations
+    ])
+
+
+def benchmarks(samples: dict[str, Lexeme]) -> dict[str, Callable[[], object]]:
+    functions: dict[str, Callable[[], object]] = {}
+    variants = [
+        (template_name, sample_name, lexeme_data)
+        for template_name, sample in samples.items()
+        for sample_name, lexeme_data in [(template_name, sample), (f'{template_name}+irregular', irregular_sample(sample))]
+    ]
+    for template_name, sample_name, lexeme_data in variants:
+        template = templates_without_redirects[template_name]
+
+        def match_all_templates(lexeme_data=lexeme_data):
+            for template in templates_without_redirects.values():
+                match_template_to_lexeme_data(template, lexeme_data)
+        functions[f'match_template_to_lexeme_data[{sample_name}]'] = match_all_templates
+
+        def match_templates(lexeme_data=lexeme_data):
+            match_templates_to_lexeme_data(lexeme_data)
+        functions[f'match_templates_to_lexeme_data[{sample_name}]'] = match_templates
+
+        def match_forms(lexeme_data=lexeme_data, template=template):
+            match_lexeme_forms_to_template(lexeme_data['forms'], template)
+        functions[f'match_lexeme_forms_to_template[{sample_name}]'] = match_forms
+
+        form_data = edit_form_data(template_name, lexeme_data)
+
+        def update_lexeme(lexeme_data=lexeme_data, template=template, form_data=form_data):
+            bound_template = match_lexeme_forms_to_template(lexeme_data['forms'], template)
+            bound_template['lexeme_id'] = lexeme_data['id']  # type: ignore
+            bound_template['lexeme_revision'] = str(lexeme_data['lastrevid'])  # type: ignore
+            lexeme_match = match_template_to_lexeme_data(template, lexeme_data)
+            app.update_lexeme(
+                lexeme_data,
+                bound_template,  # type: ignore
+                form_data,
+                template['language_code'],
+                missing_statements=lexeme_match['missing_statements'],
+            )
+        functions[f'update_lexeme[{sample_name}]'] = update_lexeme
+    return functions
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """Get the best time of one call of the function, in seconds."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the baseline for later runs on this machine instead of comparing against it')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative slowdown against the baseline that counts as a regression (default: 0.25)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-k', dest='filter', default='',
+                        help='only run benchmarks whose name contains this string')
+    parser.add_argument('--fetch', nargs=2, metavar=('TEMPLATE_NAME', 'LEXEME_ID'),
+                        help='download a real lexeme as the sample for the template, then exit')
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_sample(*args.fetch)
+        return 0
+
+    baseline: dict[str, float] = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    results: dict[str, float] = {}
+    regressions = []
+    for name, function in benchmarks(load_samples()).items():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(function, args.repeat)
+        line = f'{name:<70} {result * 1e6:12.1f} µs'
+        if name in baseline and not args.save_baseline:
+            change = result / baseline[name] - 1
+            line += f' {change:+8.1%}'
+            if change > args.threshold:
+                line += ' REGRESSION'
+                regressions.append(name)
+        print(line)
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Saved baseline to {baseline_path}')
+        return 0
+
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {", ".join(regressions)}',
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Measure how long it takes to render the pages of one template.
+
+By default, the template with the most forms is used. For each page type
+(the template page, the bulk mode page and, if there is a sample lexeme
+for the template in benchmark_data/lexemes/, the edit page), the page is
+requested repeatedly through the Flask test client, and the time spent
+rendering its Jinja template (from the Server-Timing header, see timing.py)
+and handling the whole request are reported.
+
+The time to compile all Jinja templates from source is reported as well,
+along with the time to load them from the bytecode cache instead."""
+
+import argparse
+import statistics
+import tempfile
+import time
+from typing import Optional
+
+import jinja2
+
+import app
+from benchmark_matching import load_samples
+from templates import templates_without_redirects
+from wikibase_types import Lexeme
+
+
+def largest_template_name() -> str:
+    return max(templates_without_redirects,
+               key=lambda template_name: len(templates_without_redirects[template_name]['forms']))
+
+
+def server_timing_duration(server_timing: str, name: str) -> Optional[float]:
+    """Get the duration of the named metric in a Server-Timing header, in seconds."""
+    for metric in server_timing.split(', '):
+        metric_name, *params = metric.split(';')
+        if metric_name == name:
+            for param in params:
+                if param.startswith('dur='):
+                    return float(param[len('dur='):]) / 1000
+    return None
+
+
+def measure_page(
+        url: str,
+        jinja_template_name: str,
+        repetitions: int,
+        lexeme_data: Optional[Lexeme] = None,
+) -> tuple[list[float], list[float]]:
+    """Request the page repeatedly (after one warmup request),
+    and get the render durations and the total durations."""
+    render_durations = []
+    total_durations = []
+    with app.app.test_client() as client:
+        for repetition in range(repetitions + 1):
+            if lexeme_data is not None:
+                # the edit page gets the lexeme data from the cache instead of Wikidata
+                app.cache_lexeme_data(lexeme_data['id'], 'www', lexeme_data, latest=True)
+            start = time.perf_counter()
+            response = client.get(url)
+            total = time.perf_counter() - start
+            if response.status_code != 200:
+                raise Exception(f'{url}: HTTP {response.status_code}')
+            if repetition == 0:
+                continue
+            render = server_timing_duration(response.headers['Server-Timing'], f'render-{jinja_template_name}')
+            assert render is not None, f'{jinja_template_name} was not rendered'
+            render_durations.append(render)
+            total_durations.append(total)
+    return render_durations, total_durations
+
+
+def measure_compile(repetitions: int) -> tuple[list[float], list[float]]:
+    """Compile all Jinja templates in a fresh environment repeatedly,
+    from source and with a bytecode cache, and get the durations."""
+    source_durations: list[float] = []
+    bytecode_durations: list[float] = []
+    with tempfile.TemporaryDirectory() as directory:
+        bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+        for bytecode in [False, True]:
+            for repetition in range(repetitions + (1 if bytecode else 0)):
+                environment = app.app.jinja_env.overlay(cache_size=0)
+                environment.bytecode_cache = bytecode_cache if bytecode else None
+                start = time.perf_counter()
+                for template_name in environment.list_templates():
+                    environment.get_template(template_name)
+                duration = time.perf_counter() - start
+                if bytecode and repetition == 0:
+                    continue  # this one filled the bytecode cache
+                (bytecode_durations if bytecode else source_durations).append(duration)
+    return source_durations, bytecode_durations
+
+
+def report(name: str, durations: list[float]) -> None:
+    print(f'{name}: median {statistics.median(durations) * 1000:.1f} ms, '
+          f'min {min(durations) * 1000:.1f} ms, '
+          f'max {max(durations) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--repetitions', type=int, default=10)
+    parser.add_argument('--template', help='the template to render (default: the one with the most forms)')
+    args = parser.parse_args()
+
+    template_name = args.template or largest_template_name()
+    template = templates_without_redirects[template_name]
+    print(f'{template_name} ({len(template["forms"])} forms)')
+
+    pages: list[tuple[str, str, str, Optional[Lexeme]]] = [
+        ('template', f'/template/{template_name}/', 'template.html', None),
+        ('bulk', f'/template/{template_name}/bulk/', 'bulk.html', None),
+    ]
+    lexeme_data = load_samples().get(template_name)
+    if lexeme_data is not None and 'test' not in template:
+        pages.append(('edit', f'/template/{template_name}/edit/{lexeme_data["id"]}', 'edit.html', lexeme_data))
+    else:
+        print('(no sample lexeme for this template, skipping the edit page)')
+
+    for page_name, url, jinja_template_name, page_lexeme_data in pages:
+        render_durations, total_durations = measure_page(url, jinja_template_name, args.repetitions, page_lexeme_data)
+        report(f'{page_name} render', render_durations)
+        report(f'{page_name} request', total_durations)
+
+    source_durations, bytecode_durations = measure_compile(args.repetitions)
+    report('compile from source', source_durations)
+    report('compile with bytecode cache', bytecode_durations)
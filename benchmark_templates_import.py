@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure how long a cold import of the templates module takes,
+with and without the bytecode compiled by compile_templates.py.
+
+Each import runs in a fresh interpreter process."""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from compile_templates import compile_templates
+
+
+IMPORT_TEMPLATES = '''
+import time
+start = time.perf_counter()
+import templates
+print(time.perf_counter() - start)
+'''
+
+
+def measure(env: dict[str, str], repetitions: int) -> list[float]:
+    durations = []
+    for _ in range(repetitions):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_TEMPLATES],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        durations.append(float(output))
+    return durations
+
+
+def report(name: str, durations: list[float]) -> None:
+    print(f'{name}: median {statistics.median(durations) * 1000:.1f} ms, '
+          f'min {min(durations) * 1000:.1f} ms, '
+          f'max {max(durations) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--repetitions', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as empty_pycache:
+        # look for bytecode in an empty directory and don’t write any,
+        # so that every import has to compile the source
+        report('source', measure(dict(
+            os.environ,
+            PYTHONPYCACHEPREFIX=empty_pycache,
+            PYTHONDONTWRITEBYTECODE='1',
+        ), args.repetitions))
+
+    if not compile_templates():
+        sys.exit('could not compile templates')
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    env.pop('PYTHONPYCACHEPREFIX', None)
+    report('bytecode', measure(env, args.repetitions))
@@ -0,0 +1,56 @@
+"""Helpers for processing many lexemes at once in bulk mode."""
+
+from collections.abc import Callable, Iterable
+import concurrent.futures
+import threading
+import time
+from typing import Optional, TypeVar
+
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class RateLimiter:
+    """Space out calls so that at most a certain number happen per minute.
+
+    Wikidata rate-limits edits per user, so bulk mode waits between
+    submissions instead of running into ratelimited API errors."""
+
+    def __init__(
+            self,
+            per_minute: float,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.interval = 60 / per_minute if per_minute > 0 else 0
+        self.clock = clock
+        self.sleep = sleep
+        self._next: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = self.clock()
+            if self._next is not None and self._next > now:
+                self.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+def prefetch(
+        executor: concurrent.futures.Executor,
+        fetch: Callable[[T], R],
+        items: Iterable[Optional[T]],
+) -> list[Optional[concurrent.futures.Future[R]]]:
+    """Start fetching something for each item concurrently.
+
+    Returns a list of futures in the same order as the items,
+    with None for any item that was None (nothing to fetch).
+    Any exception raised by fetch is only raised when the
+    corresponding future's result is requested, so that it
+    surfaces at the same point as with sequential processing."""
+    return [
+        executor.submit(fetch, item) if item is not None else None
+        for item in items
+    ]
@@ -0,0 +1,209 @@
+"""A local job store for asynchronous bulk mode.
+
+Large bulk mode submissions can take a long time, and processing them
+within the web request blocks one of the few web workers until every
+lexeme is done. Instead, the web request can enqueue the parsed lexemes
+as a job in this store, and a separate worker process (bulk_worker.py)
+processes the job and records the result of each line as soon as it is
+done, so that the job page can show the results while they come in.
+
+The store is a SQLite database, which is sufficient because all web
+workers and the bulk worker run in the same container: gunicorn starts
+the bulk worker next to the web workers (see gunicorn.conf.py).
+The database should therefore be on the container’s local disk,
+not on a network file system (SQLite’s WAL mode does not work there);
+this also means that jobs do not survive a restart of the webservice.
+
+To make the edits, the worker needs the user’s OAuth access token,
+so the store keeps that (but not the refresh token) until the job is done;
+the database file is only readable by its owner."""
+
+from collections.abc import Iterator
+import contextlib
+import json
+import os
+import secrets
+import sqlite3
+import time
+from typing import Optional, TypedDict
+
+import werkzeug.datastructures
+
+
+class BulkJob(TypedDict):
+    id: str
+    template_name: str
+    summary: str
+    access_token: Optional[str]  # only the access token itself, never the refresh token
+    status: str  # 'queued', 'running' or 'done'
+    num_lines: int
+    num_done: int
+
+
+class BulkJobStore:
+
+    def __init__(self, path: str):
+        self.path = path
+        # create the file without any permissions for others before SQLite opens it
+        # (SQLite creates the -wal and -shm files with the same permissions)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(path + suffix):
+                os.chmod(path + suffix, 0o600)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS job (
+                    id TEXT PRIMARY KEY,
+                    template_name TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    access_token TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS line (
+                    job_id TEXT NOT NULL REFERENCES job (id),
+                    line_index INTEGER NOT NULL,
+                    form_data TEXT NOT NULL,
+                    result TEXT,
+                    PRIMARY KEY (job_id, line_index)
+                );
+            ''')
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # autocommit mode, transactions are started explicitly where needed
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def create_job(
+            self,
+            template_name: str,
+            summary: str,
+            access_token: Optional[str],
+            lexemes: list[werkzeug.datastructures.MultiDict],
+    ) -> str:
+        job_id = secrets.token_urlsafe(24)
+        with self._connect() as connection:
+            connection.execute('BEGIN')
+            connection.execute(
+                'INSERT INTO job (id, template_name, summary, access_token, created) VALUES (?, ?, ?, ?, ?)',
+                (job_id, template_name, summary, access_token, time.time()),
+            )
+            connection.executemany(
+                'INSERT INTO line (job_id, line_index, form_data) VALUES (?, ?, ?)',
+                [
+                    (job_id, line_index, json.dumps(list(lexeme.items(multi=True))))
+                    for line_index, lexeme in enumerate(lexemes)
+                ],
+            )
+            connection.execute('COMMIT')
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[BulkJob]:
+        with self._connect() as connection:
+            row = connection.execute(
+                '''SELECT id, template_name, summary, access_token, status,
+                          (SELECT COUNT(*) FROM line WHERE job_id = job.id),
+                          (SELECT COUNT(*) FROM line WHERE job_id = job.id AND result IS NOT NULL)
+                   FROM job WHERE id = ?''',
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        id, template_name, summary, access_token, status, num_lines, num_done = row
+        return {
+            'id': id,
+            'template_name': template_name,
+            'summary': summary,
+            'access_token': access_token,
+            'status': status,
+            'num_lines': num_lines,
+            'num_done': num_done,
+        }
+
+    def get_results(self, job_id: str, offset: int = 0) -> list[dict]:
+        """Get the results of the finished lines of the job, starting at the offset.
+
+        Lines are processed in order, so the results form a prefix of the input."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                '''SELECT result FROM line
+                   WHERE job_id = ? AND line_index >= ? AND result IS NOT NULL
+                   ORDER BY line_index''',
+                (job_id, offset),
+            ).fetchall()
+        return [json.loads(result) for (result,) in rows]
+
+    def claim_job(self) -> Optional[BulkJob]:
+        """Mark the oldest queued job as running and return it, if there is one."""
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT id FROM job WHERE status = 'queued' ORDER BY created LIMIT 1",
+            ).fetchone()
+            if row is None:
+                connection.execute('ROLLBACK')
+                return None
+            (job_id,) = row
+            connection.execute("UPDATE job SET status = 'running' WHERE id = ?", (job_id,))
+            connection.execute('COMMIT')
+        return self.get_job(job_id)
+
+    def requeue_running_jobs(self) -> None:
+        """Mark any running jobs as queued again.
+
+        This should be called when the worker starts,
+        so that jobs interrupted by a worker restart are resumed
+        (only their pending lines are processed again)."""
+        with self._connect() as connection:
+            connection.execute("UPDATE job SET status = 'queued' WHERE status = 'running'")
+
+    def get_pending_lines(self, job_id: str) -> list[tuple[int, werkzeug.datastructures.ImmutableMultiDict]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                '''SELECT line_index, form_data FROM line
+                   WHERE job_id = ? AND result IS NULL
+                   ORDER BY line_index''',
+                (job_id,),
+            ).fetchall()
+        return [
+            (line_index, werkzeug.datastructures.ImmutableMultiDict(json.loads(form_data)))
+            for line_index, form_data in rows
+        ]
+
+    def set_result(self, job_id: str, line_index: int, result: dict) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE line SET result = ? WHERE job_id = ? AND line_index = ?',
+                (json.dumps(result), job_id, line_index),
+            )
+
+    def fail_job(self, job_id: str, error: str) -> None:
+        """Record the error as the result of each pending line of the job, and finish the job."""
+        pending_lines = self.get_pending_lines(job_id)
+        with self._connect() as connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'UPDATE line SET result = ? WHERE job_id = ? AND line_index = ?',
+                [
+                    (json.dumps({
+                        'error': error,
+                        'form_representations': form_data.getlist('form_representation'),
+                    }), job_id, line_index)
+                    for line_index, form_data in pending_lines
+                ],
+            )
+            connection.execute('COMMIT')
+        self.finish_job(job_id)
+
+    def finish_job(self, job_id: str) -> None:
+        """Mark the job as done and forget its access token."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE job SET status = 'done', access_token = NULL WHERE id = ?",
+                (job_id,),
+            )
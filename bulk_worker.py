@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""Process asynchronous bulk mode jobs.
+
+This runs in the webservice container, next to the web workers
+(gunicorn starts it, see gunicorn.conf.py; in local development, run it yourself),
+and processes the jobs that the web service enqueues in the job database
+configured in BULK.JOBS_DATABASE, one at a time, in the order they were created.
+Only one bulk worker may run per job database."""
+
+import sys
+import time
+
+from app import app, bulk_job_store, process_bulk_job
+
+if bulk_job_store is None:
+    sys.exit('Bulk jobs are not configured (BULK.JOBS_DATABASE and OAUTH must be set)')
+
+bulk_job_store.requeue_running_jobs()
+while True:
+    job = bulk_job_store.claim_job()
+    if job is None:
+        time.sleep(1)
+        continue
+    try:
+        process_bulk_job(bulk_job_store, job)
+    except Exception as error:
+        app.logger.exception(f'Error processing bulk job {job["id"]}')
+        # don’t let the remaining lines disappear without a result
+        bulk_job_store.fail_job(job['id'], f'Error processing the bulk job: {error}')
@@ -0,0 +1,197 @@
+"""In-process caches shared between the requests handled by one worker."""
+
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+import threading
+import time
+from typing import Generic, Optional, TypeVar
+
+import metrics
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class _InFlight(Generic[V]):
+    """A computation of a cache value that other threads can wait for."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: V | None = None
+        self.error: BaseException | None = None
+        self.invalidated = False
+
+
+class _LookupStats:
+    """Hit and miss counters of a cache, also exported as metrics if the cache has a name."""
+
+    def __init__(self, name: Optional[str]):
+        self.hits = 0
+        self.misses = 0
+        self._hit_metric = metrics.cache_lookups.labels(name, 'hit') if name else None
+        self._miss_metric = metrics.cache_lookups.labels(name, 'miss') if name else None
+
+    def _hit(self) -> None:
+        self.hits += 1
+        if self._hit_metric is not None:
+            self._hit_metric.inc()
+
+    def _miss(self) -> None:
+        self.misses += 1
+        if self._miss_metric is not None:
+            self._miss_metric.inc()
+
+
+class TtlCache(_LookupStats, Generic[K, V]):
+    """A thread-safe, bounded LRU cache whose entries expire after a fixed time.
+
+    Besides plain get/set, get_or_compute() coalesces concurrent lookups
+    of the same missing key, so that only one thread computes the value
+    (e.g. by making an API request) while the others wait for its result."""
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: float,
+            clock: Callable[[], float] = time.monotonic,
+            name: Optional[str] = None,
+    ):
+        super().__init__(name)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._in_flight: dict[K, _InFlight[V]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _get_locked(self, key: K) -> tuple[bool, V | None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _set_locked(self, key: K, value: V) -> None:
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            found, value = self._get_locked(key)
+            if found:
+                self._hit()
+                return value
+            self._miss()
+            return default
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._set_locked(key, value)
+
+    def pop(self, key: K) -> None:
+        """Remove the entry for the key, if any.
+
+        A computation for the key that is currently in flight
+        will still be returned to its callers, but not cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                in_flight.invalidated = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for in_flight in self._in_flight.values():
+                in_flight.invalidated = True
+
+    def get_or_compute(self, key: K, compute: Callable[[], V]) -> V:
+        with self._lock:
+            found, value = self._get_locked(key)
+            if found:
+                self._hit()
+                return value  # type: ignore
+            self._miss()
+            in_flight = self._in_flight.get(key)
+            owner = in_flight is None
+            if in_flight is None:
+                in_flight = _InFlight()
+                self._in_flight[key] = in_flight
+
+        if not owner:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.value  # type: ignore
+
+        try:
+            value = compute()
+        except BaseException as error:
+            in_flight.error = error
+            raise
+        else:
+            in_flight.value = value
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if in_flight.error is None and not in_flight.invalidated:
+                    self._set_locked(key, in_flight.value)  # type: ignore
+            in_flight.done.set()
+
+
+class SizedLruCache(_LookupStats, Generic[K]):
+    """A thread-safe LRU cache of strings, bounded by their total length.
+
+    Entries never expire, so this is only suitable for values that
+    never change for a given key, such as an entity at a fixed revision."""
+
+    def __init__(self, max_size: int, name: Optional[str] = None):
+        super().__init__(name)
+        self.max_size = max_size
+        self.size = 0
+        self._entries: OrderedDict[K, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: K) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._miss()
+                return None
+            self._entries.move_to_end(key)
+            self._hit()
+            return value
+
+    def set(self, key: K, value: str) -> None:
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, evicted_value = self._entries.popitem(last=False)
+                self.size -= len(evicted_value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
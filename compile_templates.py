@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Compile the template definitions to bytecode ahead of time.
+
+Importing templates.py is dominated by compiling its (very large)
+source to bytecode; evaluating the compiled definitions is cheap.
+Python normally caches the bytecode in __pycache__ on first import,
+but if it cannot write there (or PYTHONDONTWRITEBYTECODE is set),
+every process pays for the compilation again.
+
+This script writes the bytecode with a hash of the source
+instead of its modification time, so that it stays valid when the
+files are copied (e.g. into a container image) and is only ignored
+(and the source compiled again) if the source actually changed."""
+
+import compileall
+import os
+import py_compile
+import sys
+
+
+def compile_templates() -> bool:
+    directory = os.path.dirname(os.path.abspath(__file__))
+    invalidation_mode = py_compile.PycInvalidationMode.CHECKED_HASH
+    success = compileall.compile_file(
+        os.path.join(directory, 'templates.py'),
+        quiet=1,
+        invalidation_mode=invalidation_mode,
+    )
+    success &= compileall.compile_dir(
+        os.path.join(directory, 'entity_ids'),
+        quiet=1,
+        invalidation_mode=invalidation_mode,
+    )
+    return bool(success)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if compile_templates() else 1)
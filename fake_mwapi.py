@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""A local stand-in for the MediaWiki Action API of Wikidata and Wikifunctions.
+
+This server implements just enough of the API for the tool to work
+without Wikidata and Wikifunctions, so that it can be load-tested (see
+load_test.py) without sending requests to the production wikis.
+One request to meta.wikimedia.org per worker remains, though:
+toolforge_i18n loads the language info (autonyms and text directions)
+from there on first use, and that request is not routed through this server.
+It serves the sample lexemes in benchmark_data/lexemes/, reports made-up
+duplicates for any other lemma, and accepts (but does not store) edits.
+
+Start it with e.g.
+
+    python3 fake_mwapi.py --port 8081 --latency 50 --jitter 20 --error-rate 0.01
+
+and point the tool at it by adding the following to config.yaml:
+
+    MWAPI_HOST_OVERRIDE: http://localhost:8081
+
+The tool then sends requests for e.g. https://www.wikidata.org
+to http://localhost:8081/www.wikidata.org/w/api.php instead.
+Note that the tool only submits edits if OAuth is configured;
+otherwise, the edit and bulk endpoints only exercise the server
+up to the point where the edit would be made."""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Optional
+import zlib
+
+import flask
+
+
+lexemes_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_data', 'lexemes')
+
+csrf_token = 'fake-csrf-token+\\'
+
+
+def load_lexemes() -> dict[str, dict]:
+    """Load the sample lexemes, by lexeme ID."""
+    lexemes = {}
+    for file_name in sorted(os.listdir(lexemes_directory)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(lexemes_directory, file_name)) as f:
+            for lexeme_id, lexeme_data in json.load(f)['entities'].items():
+                lexemes[lexeme_id] = lexeme_data
+    return lexemes
+
+
+def fake_duplicate_ids(lemma: str) -> list[str]:
+    """Get between zero and two made-up lexeme IDs for the lemma.
+
+    The same lemma always gets the same IDs,
+    so that the results are stable across requests."""
+    checksum = zlib.crc32(lemma.encode('utf8'))
+    return [f'L8{(checksum + index) % 10**8:08d}' for index in range(checksum % 3)]
+
+
+def create_app(
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        seed: Optional[int] = None,
+) -> flask.Flask:
+    """Create the fake API server.
+
+    latency and jitter are in milliseconds; every request is delayed
+    by a random time within latency ± jitter. error_rate is the
+    probability with which a request fails with an internal API error."""
+    app = flask.Flask(__name__)
+    lexemes = load_lexemes()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    new_lexeme_ids = itertools.count(950000001)
+    revision_ids = itertools.count(2400000001)
+    counter_lock = threading.Lock()
+
+    def delay_and_maybe_fail() -> bool:
+        """Sleep for the configured latency, then return whether to fail the request."""
+        with rng_lock:
+            delay = max(latency + rng.uniform(-jitter, jitter), 0)
+            fail = rng.random() < error_rate
+        time.sleep(delay / 1000)
+        return fail
+
+    def api_error(code: str, info: str) -> flask.Response:
+        return flask.jsonify({'error': {'code': code, 'info': info}})
+
+    def param_list(params: dict[str, str], name: str) -> list[str]:
+        value = params.get(name, '')
+        return value.split('|') if value else []
+
+    def entity_labels(entity_id: str, languages: list[str]) -> dict[str, Any]:
+        return {
+            'id': entity_id,
+            'labels': {
+                language: {'language': language, 'value': f'{entity_id} ({language})'}
+                for language in languages
+            },
+        }
+
+    def wbsearchentities(params: dict[str, str]) -> dict[str, Any]:
+        search = params['search']
+        language = params.get('language', 'en')
+        results = []
+        for lexeme_id, lexeme_data in lexemes.items():
+            for lemma in lexeme_data['lemmas'].values():
+                if lemma['value'] == search:
+                    results.append((lexeme_id, lemma['language']))
+        results += [(lexeme_id, language) for lexeme_id in fake_duplicate_ids(search)]
+        return {
+            'search': [
+                {
+                    'id': lexeme_id,
+                    'concepturi': f'https://www.wikidata.org/entity/{lexeme_id}',
+                    'label': search,
+                    'description': f'{language}, fake lexeme',
+                    'match': {'type': 'label', 'language': match_language, 'text': search},
+                }
+                for lexeme_id, match_language in results
+            ],
+            'success': 1,
+        }
+
+    def query(params: dict[str, str]) -> dict[str, Any]:
+        query: dict[str, Any] = {}
+        meta = param_list(params, 'meta')
+        if 'tokens' in meta:
+            query['tokens'] = {'csrftoken': csrf_token}
+        if 'userinfo' in meta:
+            query['userinfo'] = {
+                'id': 1,
+                'name': 'Fake user',
+                'groups': ['*', 'user', 'autoconfirmed'],
+                'options': {},
+            }
+        titles = param_list(params, 'titles')
+        if titles:
+            prop = param_list(params, 'prop')
+            pages = []
+            for index, title in enumerate(titles):
+                page: dict[str, Any] = {'ns': 146 if title.startswith('Lexeme:') else 2, 'title': title}
+                if 'revisions' in prop and not title.startswith('Lexeme:'):
+                    # no user has opted into Wikifunctions via a user JS page
+                    page['missing'] = True
+                else:
+                    page['pageid'] = index + 1
+                    if 'pageprops' in prop:
+                        lexeme_data = lexemes.get(title[len('Lexeme:'):], {})
+                        page['pageprops'] = {
+                            'wbl-forms': str(len(lexeme_data.get('forms', [None] * 3))),
+                            'wbl-senses': str(len(lexeme_data.get('senses', [None]))),
+                        }
+                pages.append(page)
+            if params.get('formatversion') == '2':
+                query['pages'] = pages
+            else:
+                for page in pages:
+                    if page.pop('missing', False):
+                        page['missing'] = ''
+                query['pages'] = {str(page.get('pageid', -index - 1)): page for index, page in enumerate(pages)}
+        return {'batchcomplete': True, 'query': query}
+
+    def wbgetentities(params: dict[str, str]) -> dict[str, Any]:
+        entities: dict[str, Any] = {}
+        languages = param_list(params, 'languages') or ['en']
+        for entity_id in param_list(params, 'ids'):
+            if entity_id in lexemes:
+                entities[entity_id] = lexemes[entity_id]
+            elif entity_id.startswith('L'):
+                entities[entity_id] = {'id': entity_id, 'missing': ''}
+            else:
+                entities[entity_id] = entity_labels(entity_id, languages)
+        return {'entities': entities, 'success': 1}
+
+    def wbeditentity(params: dict[str, str]) -> flask.Response | dict[str, Any]:
+        if params.get('token') != csrf_token:
+            return api_error('badtoken', 'Invalid CSRF token.')
+        data = json.loads(params.get('data', '{}'))
+        with counter_lock:
+            lexeme_id = params.get('id') or f'L{next(new_lexeme_ids)}'
+            revision_id = next(revision_ids)
+        return {'entity': {**data, 'id': lexeme_id, 'lastrevid': revision_id}, 'success': 1}
+
+    def wikifunctions_run(params: dict[str, str]) -> dict[str, Any]:
+        function_call = json.loads(params['function_call'])
+        function_id = function_call['Z7K1']
+        # echo the first argument (usually the lemma) back as the result
+        argument = function_call.get(function_id + 'K1', '')
+        return {'wikifunctions_run': {'data': json.dumps({'Z1K1': 'Z22', 'Z22K1': argument})}}
+
+    actions = {
+        'wbsearchentities': wbsearchentities,
+        'query': query,
+        'wbgetentities': wbgetentities,
+        'wbeditentity': wbeditentity,
+        'wikifunctions_run': wikifunctions_run,
+    }
+
+    @app.route('/<wiki_host>/w/api.php', methods=['GET', 'POST'])
+    def api(wiki_host: str) -> flask.Response | dict[str, Any]:
+        params = {**flask.request.args.to_dict(), **flask.request.form.to_dict()}
+        if delay_and_maybe_fail():
+            return api_error('internal_api_error_DBQueryError', 'Simulated error (see fake_mwapi.py --error-rate).')
+        action = actions.get(params.get('action', ''))
+        if action is None:
+            return api_error('badvalue', f'Unrecognized value for parameter "action": {params.get("action")}.')
+        return action(params)
+
+    @app.route('/<wiki_host>/wiki/Special:EntityData/<entity_id>.json')
+    def entity_data(wiki_host: str, entity_id: str) -> flask.Response | tuple[str, int] | dict[str, Any]:
+        if delay_and_maybe_fail():
+            return 'Simulated error (see fake_mwapi.py --error-rate).', 503
+        if entity_id not in lexemes:
+            return f'No entity with ID {entity_id}.', 404
+        return {'entities': {entity_id: lexemes[entity_id]}}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='mean delay of every request, in milliseconds (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='maximum random deviation from the latency, in milliseconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests that fail with an API error (default: 0)')
+    parser.add_argument('--seed', type=int, help='seed for the random latencies and errors')
+    args = parser.parse_args()
+    app = create_app(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
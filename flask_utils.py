@@ -1,4 +1,18 @@
 import flask.json
+import functools
+import gzip
+import hashlib
+from typing import cast, Optional
+import werkzeug
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    try:
+        import brotlicffi as brotli  # type: ignore
+    except ImportError:
+        brotli = None
+
 
 class SetJSONProvider(flask.json.provider.DefaultJSONProvider):
     @staticmethod
@@ -6,3 +20,53 @@ class SetJSONProvider(flask.json.provider.DefaultJSONProvider):
         if isinstance(o, set):
             return sorted(o)
         return super().default(o)
+
+
+class PrecomputedJSON:
+    """A JSON response body that is serialized once and then served many times.
+
+    The body is served with a strong ETag (so that clients can revalidate
+    with If-None-Match and get a 304 response), and, if the client accepts it,
+    compressed with brotli (if available) or gzip.
+    The compressed versions are computed when they are first requested."""
+
+    def __init__(self, app: flask.Flask, data, cache_control: str = 'public, max-age=3600'):
+        # serialize exactly like flask.jsonify(data) would
+        self.body = cast(flask.Response, app.json.response(data)).get_data()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.cache_control = cache_control
+
+    @functools.cached_property
+    def gzip_body(self) -> bytes:
+        return gzip.compress(self.body, mtime=0)
+
+    @functools.cached_property
+    def br_body(self) -> bytes:
+        assert brotli is not None
+        return brotli.compress(self.body)
+
+    def content_encoding(self, request: flask.Request) -> Optional[str]:
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def response(self, request: flask.Request) -> werkzeug.Response:
+        content_encoding = self.content_encoding(request)
+        if content_encoding == 'br':
+            body = self.br_body
+        elif content_encoding == 'gzip':
+            body = self.gzip_body
+        else:
+            body = self.body
+        response = flask.Response(body, mimetype='application/json')
+        if content_encoding is not None:
+            response.headers['Content-Encoding'] = content_encoding
+            # each representation needs its own strong ETag
+            response.set_etag(f'{self.etag}-{content_encoding}')
+        else:
+            response.set_etag(self.etag)
+        response.headers['Cache-Control'] = self.cache_control
+        response.vary.add('Accept-Encoding')
+        return response.make_conditional(request)
@@ -1,4 +1,10 @@
+import gc
+import glob
 import logging
+import os
+import subprocess
+import sys
+import tempfile
 from gunicorn import glogging
 
 class CustomGunicornLogger(glogging.Logger):
@@ -28,3 +34,75 @@ workers = 4
 
 # from app import app
 wsgi_app = 'app:app'
+
+# import the app (including the templates, translations etc.) once in the master process,
+# so that the workers share those pages of memory copy-on-write instead of each importing their own copy
+preload_app = True
+
+# compile templates.py (and entity_ids) to bytecode before the app is imported, see compile_templates.py;
+# the Toolforge build service has no hook to run this when the image is built, so it runs when the webservice starts,
+# and the master and the bulk worker (which imports the app again, see start_bulk_worker) load the bytecode from there
+if subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compile_templates.py')]).returncode != 0:
+    logging.getLogger('gunicorn.error').warning('Could not compile the templates to bytecode, they will be compiled on import')
+
+# a garbage collection in a worker would write to the GC headers of all the objects inherited from the master,
+# copying the pages they live in; to avoid this, collections are disabled in the master while the app is imported,
+# and all objects that exist when forking are moved into the permanent generation, which is never collected
+# (see <https://docs.python.org/3/library/gc.html#gc.freeze>)
+gc.disable()
+
+def when_ready(server):
+    # the app has been imported, freeze it and collect normally again in the master,
+    # which keeps running (and allocating) for as long as the server does;
+    # objects created after this point are frozen before each fork (see pre_fork)
+    gc.freeze()
+    gc.enable()
+    start_bulk_worker(server)
+
+# the bulk worker (see bulk_worker.py) runs in the same container as the web workers,
+# because the job database is a SQLite file on the container’s local disk (see bulk_jobs.py);
+# it is started by the master after the app was imported, and stopped when the master exits
+bulk_worker = None
+
+def start_bulk_worker(server):
+    global bulk_worker
+    from app import bulk_job_store
+    if bulk_job_store is None:
+        return  # bulk jobs are not configured
+    bulk_worker = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_worker.py')])
+    server.log.info('Started bulk worker (pid: %s)', bulk_worker.pid)
+
+def on_exit(server):
+    if bulk_worker is None:
+        return
+    bulk_worker.terminate()
+    try:
+        bulk_worker.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        bulk_worker.kill()
+        bulk_worker.wait()
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(bulk_worker.pid)
+
+def pre_fork(server, worker):
+    # the master may have made API requests while importing the app (e.g. to prefetch labels);
+    # close those connections, the workers must not share them
+    from session_pool import anonymous_sessions
+    anonymous_sessions.clear()
+    gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
+
+# each worker (including the bulk worker) keeps its metrics in files in this directory,
+# so that /metrics can report the metrics of all workers (see metrics.py);
+# this must be set before the app (and with it prometheus_client) is imported
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    for metrics_file in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(metrics_file)  # left over from a previous run
+else:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='lexeme-forms-metrics-')
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
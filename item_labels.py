@@ -0,0 +1,270 @@
+from collections.abc import Iterable, Mapping
+import concurrent.futures
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+import weakref
+
+import mwapi  # type: ignore
+
+from session_pool import anonymous_session
+
+logger = logging.getLogger(__name__)
+
+Label = dict[str, str]  # {'language': ..., 'value': ...}, as in the API response
+LabelKey = tuple[str, str, str]  # (wiki, item ID, language)
+
+
+class ItemLabelCache:
+    """Labels of items by wiki, item ID and language, optionally persisted in a file.
+
+    Items without a label in the language (or that don’t exist) are cached as well,
+    so that they are not requested again and again. Labels are fetched
+    for 50 items per request, with several requests in parallel.
+
+    Entries are kept for the TTL and then refreshed in a background thread;
+    until the refresh is done, the stale label is still used,
+    so that only labels that were never fetched have to be waited for.
+    Changes are saved to the file in the background, after a short delay,
+    merged with any entries that other processes saved in the meantime."""
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            ttl: float = 7 * 24 * 60 * 60,
+            concurrency: int = 4,
+            clock: Callable[[], float] = time.time,
+            save_delay: float = 10,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.clock = clock
+        self.save_delay = save_delay
+        self._entries: dict[LabelKey, tuple[float, Optional[Label]]] = {}  # key to (time fetched, label)
+        self._api_languages: dict[str, str] = {}  # language to the language requested from the API, if different
+        self._reset_threads()
+        _caches.add(self)
+
+    def _reset_threads(self) -> None:
+        """Reset the state shared with the background threads.
+
+        This is also called in a child process after a fork (e.g. a gunicorn worker
+        forked from the master, which may have fetched labels while importing the app):
+        the child does not inherit the threads, so it must not wait for them to finish
+        a save or refresh, nor for a lock that one of them held while forking."""
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._save_scheduled = False
+
+    def configure(self, path: Optional[str] = None, ttl: Optional[float] = None, concurrency: Optional[int] = None) -> None:
+        if path is not None:
+            self.path = path
+        if ttl is not None:
+            self.ttl = float(ttl)
+        if concurrency is not None:
+            self.concurrency = int(concurrency)
+
+    def load(self) -> None:
+        """Load the entries from the cache file, if there is one.
+
+        Entries that are already in memory are only replaced by newer ones."""
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            logger.warning('Could not load labels from %s', self.path, exc_info=True)
+            return
+        with self._lock:
+            for wiki, item_id, language, fetched, label in rows:
+                entry = self._entries.get((wiki, item_id, language))
+                if entry is None or entry[0] < fetched:
+                    self._entries[(wiki, item_id, language)] = (fetched, label)
+
+    def save(self) -> None:
+        """Write the entries to the cache file, if one is configured.
+
+        The file is locked while the entries are merged with those already in it
+        (which other processes may have saved) and then replaced atomically."""
+        if self.path is None:
+            return
+        try:
+            with open(f'{self.path}.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file is closed
+                self.load()
+                with self._lock:
+                    rows = sorted([*key, fetched, label] for key, (fetched, label) in self._entries.items())
+                # write to a temporary file first, so that other processes never read a partial file
+                temporary_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(temporary_path, 'w') as f:
+                    json.dump(rows, f, ensure_ascii=False, indent=1)
+                os.replace(temporary_path, self.path)
+        except OSError:
+            logger.warning('Could not save labels to %s', self.path, exc_info=True)
+
+    def _schedule_save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if self._save_scheduled:
+                return
+            self._save_scheduled = True
+        timer = threading.Timer(self.save_delay, self._scheduled_save)
+        timer.daemon = True
+        timer.start()
+
+    def _scheduled_save(self) -> None:
+        with self._lock:
+            self._save_scheduled = False
+        self.save()
+
+    def is_stale(self, wiki: str, item_id: str, language: str) -> bool:
+        with self._lock:
+            entry = self._entries.get((wiki, item_id, language))
+        return entry is None or entry[0] + self.ttl <= self.clock()
+
+    def fetch(
+            self,
+            wiki: str,
+            item_ids_by_language: Mapping[str, Iterable[str]],
+            api_languages: Optional[Mapping[str, str]] = None,
+            session: Optional[mwapi.Session] = None,
+    ) -> None:
+        """Fetch the labels of the given items in the given languages from the wiki.
+
+        Each request covers 50 items in one or more languages,
+        and the requests are made in parallel.
+        Labels are requested in the API language for the language
+        (by default, the language itself), with language fallback,
+        but cached under the language."""
+        with self._lock:
+            self._api_languages.update(api_languages or {})
+            api_languages = dict(self._api_languages)
+        keys = list(dict.fromkeys(
+            (item_id, language)
+            for language, item_ids in item_ids_by_language.items()
+            for item_id in item_ids
+        ))
+        chunks = [keys[i:i + 50] for i in range(0, len(keys), 50)]
+        if not chunks:
+            return
+        if session is None:
+            session = anonymous_session(f'https://{wiki}.wikidata.org')
+
+        def fetch_chunk(chunk: list[tuple[str, str]]) -> None:
+            response = session.get(action='wbgetentities',
+                                   ids=list(dict.fromkeys(item_id for item_id, language in chunk)),
+                                   props=['labels'],
+                                   languages=list(dict.fromkeys(api_languages.get(language, language) for item_id, language in chunk)),
+                                   languagefallback=True,
+                                   formatversion=2)
+            fetched = self.clock()
+            with self._lock:
+                for item_id, language in chunk:
+                    item = response['entities'].get(item_id, {})
+                    label = item.get('labels', {}).get(api_languages.get(language, language))
+                    self._entries[(wiki, item_id, language)] = (fetched, label)
+
+        if len(chunks) == 1:
+            fetch_chunk(chunks[0])
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks))) as executor:
+            futures = [executor.submit(fetch_chunk, chunk) for chunk in chunks]
+            for future in futures:
+                future.result()  # raise the first error, if any
+
+    def prefetch(
+            self,
+            wiki: str,
+            item_ids_by_language: Mapping[str, Iterable[str]],
+            api_languages: Optional[Mapping[str, str]] = None,
+            session: Optional[mwapi.Session] = None,
+    ) -> None:
+        """Load the cache file and fetch any labels of the given items that are missing or stale.
+
+        This is meant to be called once at startup, so that later labels() calls
+        find the labels in the cache. Errors are logged, not raised:
+        any missing labels will be fetched again when they are needed."""
+        self.load()
+        stale_item_ids_by_language = {
+            language: [item_id for item_id in item_ids if self.is_stale(wiki, item_id, language)]
+            for language, item_ids in item_ids_by_language.items()
+        }
+        if not any(stale_item_ids_by_language.values()):
+            return
+        try:
+            self.fetch(wiki, stale_item_ids_by_language, api_languages=api_languages, session=session)
+        except Exception:
+            logger.warning('Could not prefetch labels', exc_info=True)
+        # save even after an error, to keep the labels of the chunks that were fetched successfully
+        self.save()
+
+    def _refresh_stale(self) -> None:
+        try:
+            with self._lock:
+                keys = list(self._entries)
+            stale_item_ids: dict[str, dict[str, list[str]]] = {}  # by wiki and language
+            for wiki, item_id, language in keys:
+                if self.is_stale(wiki, item_id, language):
+                    stale_item_ids.setdefault(wiki, {}).setdefault(language, []).append(item_id)
+            for wiki, item_ids_by_language in stale_item_ids.items():
+                self.fetch(wiki, item_ids_by_language)
+            self.save()
+        except Exception:
+            logger.warning('Could not refresh labels', exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def labels(
+            self,
+            wiki: str,
+            item_ids: Iterable[str],
+            language: str,
+            api_language: Optional[str] = None,
+            session: Optional[mwapi.Session] = None,
+    ) -> dict[str, Optional[Label]]:
+        """Get the labels of the given items.
+
+        Items without a label in the language map to None."""
+        item_ids = list(dict.fromkeys(item_ids))
+        with self._lock:
+            entries = {
+                item_id: self._entries[(wiki, item_id, language)]
+                for item_id in item_ids
+                if (wiki, item_id, language) in self._entries
+            }
+        missing_item_ids = [item_id for item_id in item_ids if item_id not in entries]
+        if missing_item_ids:
+            # not prefetched, so we have to wait for them after all
+            self.fetch(wiki, {language: missing_item_ids},
+                       api_languages={language: api_language} if api_language else None,
+                       session=session)
+            self._schedule_save()
+            with self._lock:
+                entries = {item_id: self._entries[(wiki, item_id, language)] for item_id in item_ids}
+        now = self.clock()
+        if any(fetched + self.ttl <= now for fetched, label in entries.values()):
+            with self._lock:
+                refresh = not self._refreshing
+                self._refreshing = True
+            if refresh:
+                threading.Thread(target=self._refresh_stale, daemon=True).start()
+        return {item_id: entry[1] for item_id, entry in entries.items()}
+
+
+_caches: weakref.WeakSet[ItemLabelCache] = weakref.WeakSet()
+
+
+def _reset_threads_after_fork() -> None:
+    for cache in list(_caches):
+        cache._reset_threads()
+
+
+os.register_at_fork(after_in_child=_reset_threads_after_fork)
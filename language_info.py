@@ -1,36 +1,65 @@
+from collections.abc import Iterable
 import re
-from typing import Optional
+import time
+from typing import Callable, Optional
 
 import mwapi  # type: ignore
-import toolforge
 
-_labels: dict[str, str] = {}
+from item_labels import ItemLabelCache
+
+item_based_language_code = re.compile(r'([a-z]+)-x-(Q[1-9][0-9]*)')
+
+
+class LabelCache:
+    """Labels for item-based language codes, optionally persisted in a file.
+
+    The label of an item-based language code abc-x-Q123
+    is the label of the item Q123 in the language abc;
+    the labels are kept in an ItemLabelCache (see there for the details)."""
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            ttl: float = 7 * 24 * 60 * 60,
+            clock: Callable[[], float] = time.time,
+    ):
+        self.items = ItemLabelCache(path=path, ttl=ttl, clock=clock)
+
+    def configure(self, path: Optional[str] = None, ttl: Optional[float] = None) -> None:
+        self.items.configure(path=path, ttl=ttl)
+
+    def load(self) -> None:
+        """Load the labels from the cache file, if there is one."""
+        self.items.load()
+
+    def prefetch(self, codes: Iterable[str], session: Optional[mwapi.Session] = None) -> None:
+        """Load the cache file and fetch any labels for the codes that are missing or stale.
+
+        This is meant to be called once at startup, so that later label() calls
+        find all the labels in the cache. Errors are logged, not raised:
+        any missing labels will be fetched again when they are needed."""
+        item_ids_by_language: dict[str, list[str]] = {}
+        for code in codes:
+            if match := item_based_language_code.fullmatch(code):
+                language, item_id = match.group(1, 2)
+                item_ids_by_language.setdefault(language, []).append(item_id)
+        self.items.prefetch('www', item_ids_by_language, session=session)
+
+    def label(self, code: str) -> Optional[str]:
+        match = item_based_language_code.fullmatch(code)
+        if match is None:
+            return None
+        language, item_id = match.group(1, 2)
+        label = self.items.labels('www', [item_id], language)[item_id]
+        return label['value'] if label is not None else None
+
+
+labels = LabelCache()
 
-_user_agent = toolforge.set_user_agent('lexeme-forms', email='mail@lucaswerkmeister.de')
 
 def label(code: str) -> Optional[str]:
     """Get the label for an item-based language code.
 
     Expects a language code in the format abc-x-Q123
     and return Q123’s label for the abc language code."""
-    try:
-        return _labels[code]
-    except KeyError:
-        pass
-    match = re.fullmatch(r'([a-z]+)-x-(Q[1-9][0-9]*)', code)
-    if match is None:
-        return None
-    language, item_id = match.group(1, 2)
-    session = mwapi.Session(
-        'https://www.wikidata.org',
-        user_agent=_user_agent,
-    )
-    response = session.get(action='wbgetentities',
-                           ids=[item_id],
-                           props=['labels'],
-                           languages=[language],
-                           languagefallback=True,
-                           formatversion=2)
-    label = response['entities'][item_id].get('labels', {}).get(language, {}).get('value')
-    _labels[code] = label
-    return label
+    return labels.label(code)
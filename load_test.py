@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Load test for a running instance of the tool.
+
+Sends many concurrent requests to the index, template, duplicates,
+edit and bulk endpoints of the tool, and reports the latency
+percentiles (p50, p95, p99) and throughput of each endpoint.
+
+To avoid sending requests to Wikidata and Wikifunctions, run the tool
+against the local stand-in API server in fake_mwapi.py, e.g.:
+
+    python3 fake_mwapi.py --latency 50 --jitter 20 &
+    TOOL_MWAPI_HOST_OVERRIDE=http://localhost:8081 gunicorn app:app &
+    python3 load_test.py --base-url http://localhost:8000
+
+The edit and bulk endpoints are driven with the sample lexemes
+in benchmark_data/lexemes/, which the stand-in server knows about.
+The tool still needs network access for one request per worker
+to meta.wikimedia.org, where toolforge_i18n loads the language info."""
+
+import argparse
+import concurrent.futures
+from dataclasses import dataclass, field
+import html.parser
+import json
+import math
+import os
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+
+
+lexemes_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_data', 'lexemes')
+
+
+@dataclass
+class Sample:
+    template_name: str
+    lexeme_id: str
+    language_code: str
+    lemma: str
+
+
+def load_samples() -> list[Sample]:
+    samples = []
+    for file_name in sorted(os.listdir(lexemes_directory)):
+        template_name, extension = os.path.splitext(file_name)
+        if extension != '.json':
+            continue
+        with open(os.path.join(lexemes_directory, file_name)) as f:
+            [lexeme_data] = json.load(f)['entities'].values()
+        [lemma] = lexeme_data['lemmas'].values()
+        samples.append(Sample(template_name, lexeme_data['id'], lemma['language'], lemma['value']))
+    return samples
+
+
+class FormInputsParser(html.parser.HTMLParser):
+    """Collect the names and values of the inputs of the (first) form of a page."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.inputs: list[tuple[str, str]] = []
+        self.in_form = False
+        self.done = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        if self.done:
+            return
+        if tag == 'form':
+            self.in_form = True
+        elif tag == 'input' and self.in_form:
+            attributes = dict(attrs)
+            if attributes.get('name') and attributes.get('type') != 'checkbox':
+                self.inputs.append((attributes['name'], attributes.get('value') or ''))  # type: ignore
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'form' and self.in_form:
+            self.in_form = False
+            self.done = True
+
+
+def form_inputs(page: str) -> list[tuple[str, str]]:
+    parser = FormInputsParser()
+    parser.feed(page)
+    return parser.inputs
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Get the p-th percentile (nearest-rank method) of the sorted values."""
+    if not sorted_values:
+        return math.nan
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class Result:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0
+
+
+class LoadTest:
+    """The scenarios of the load test.
+
+    Each scenario sends one request to the tool, using the given
+    iteration number to vary the request. The requests.Session is
+    per thread, so that each thread has its own tool session
+    (and CSRF token), which the edit and bulk scenarios set up once."""
+
+    def __init__(self, base_url: str, samples: list[Sample], bulk_lines: int, cookie: Optional[str]):
+        self.base_url = base_url.rstrip('/')
+        self.samples = samples
+        self.bulk_lines = bulk_lines
+        self.cookie = cookie
+        self._local = threading.local()
+        self._num_forms: dict[str, int] = {}
+
+    def session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers['User-Agent'] = 'lexeme-forms load_test.py'
+            if self.cookie:
+                session.headers['Cookie'] = self.cookie
+            self._local.forms = {}
+        return session
+
+    def sample(self, iteration: int) -> Sample:
+        return self.samples[iteration % len(self.samples)]
+
+    def prepared_form(self, url: str) -> list[tuple[str, str]]:
+        """Get the inputs of the form on the page, loading it once per thread."""
+        session = self.session()
+        inputs = self._local.forms.get(url)
+        if inputs is None:
+            response = session.get(url)
+            response.raise_for_status()
+            inputs = self._local.forms[url] = form_inputs(response.text)
+        return inputs
+
+    def num_forms(self, template_name: str) -> int:
+        num_forms = self._num_forms.get(template_name)
+        if num_forms is None:
+            response = self.session().get(f'{self.base_url}/api/v1/template/{template_name}')
+            response.raise_for_status()
+            num_forms = self._num_forms[template_name] = len(response.json()['forms'])
+        return num_forms
+
+    def index(self, iteration: int) -> requests.Response:
+        return self.session().get(f'{self.base_url}/')
+
+    def template(self, iteration: int) -> requests.Response:
+        return self.session().get(f'{self.base_url}/template/{self.sample(iteration).template_name}/')
+
+    def duplicates(self, iteration: int) -> requests.Response:
+        sample = self.sample(iteration)
+        # a different lemma each time, so that the tool’s duplicates cache does not hide the API requests
+        return self.session().get(f'{self.base_url}/api/v1/duplicates/www/{sample.language_code}/{sample.lemma}{iteration}')
+
+    def edit(self, iteration: int) -> requests.Response:
+        sample = self.sample(iteration)
+        url = f'{self.base_url}/template/{sample.template_name}/edit/{sample.lexeme_id}'
+        data = self.prepared_form(url)
+        return self.session().post(url, data=data, allow_redirects=False)
+
+    def bulk(self, iteration: int) -> requests.Response:
+        sample = self.sample(iteration)
+        url = f'{self.base_url}/template/{sample.template_name}/bulk/'
+        data = [(name, value) for name, value in self.prepared_form(url) if name != 'lexemes']
+        num_forms = self.num_forms(sample.template_name)
+        lines = [
+            '|'.join(f'{sample.lemma}{iteration}x{line}' for _ in range(num_forms))
+            for line in range(self.bulk_lines)
+        ]
+        data.append(('lexemes', '\n'.join(lines)))
+        return self.session().post(url, data=data, allow_redirects=False)
+
+    def scenarios(self) -> dict[str, Callable[[int], requests.Response]]:
+        return {
+            'index': self.index,
+            'template': self.template,
+            'duplicates': self.duplicates,
+            'edit': self.edit,
+            'bulk': self.bulk,
+        }
+
+
+def run_scenario(scenario: Callable[[int], requests.Response], num_requests: int, concurrency: int) -> Result:
+    result = Result()
+    lock = threading.Lock()
+
+    def run(iteration: int) -> None:
+        start = time.perf_counter()
+        try:
+            response = scenario(iteration)
+            error = response.status_code >= 400
+        except requests.RequestException:
+            error = True
+        latency = time.perf_counter() - start
+        with lock:
+            result.latencies.append(latency)
+            if error:
+                result.errors += 1
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(run, iteration) for iteration in range(num_requests)]:
+            future.result()
+    result.elapsed = time.perf_counter() - start
+    result.latencies.sort()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--requests', type=int, default=200, help='number of requests per scenario (default: 200)')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of concurrent requests (default: 8)')
+    parser.add_argument('--bulk-lines', type=int, default=10, help='number of lexemes per bulk mode request (default: 10)')
+    parser.add_argument('--cookie', help='Cookie header to send, e.g. the session cookie of a logged-in user')
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help='scenarios to run (default: all of index, template, duplicates, edit, bulk)')
+    args = parser.parse_args()
+
+    load_test = LoadTest(args.base_url, load_samples(), args.bulk_lines, args.cookie)
+    scenarios = load_test.scenarios()
+    for name in args.scenarios:
+        if name not in scenarios:
+            sys.exit(f'no such scenario: {name}')
+
+    print(f'{"scenario":<12} {"requests":>8} {"errors":>6} {"p50":>9} {"p95":>9} {"p99":>9} {"throughput":>12}')
+    for name, scenario in scenarios.items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        result = run_scenario(scenario, args.requests, args.concurrency)
+        p50, p95, p99 = (percentile(result.latencies, p) * 1000 for p in (50, 95, 99))
+        throughput = len(result.latencies) / result.elapsed
+        print(f'{name:<12} {len(result.latencies):>8} {result.errors:>6} '
+              f'{p50:>7.1f}ms {p95:>7.1f}ms {p99:>7.1f}ms {throughput:>8.1f} rq/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,9 @@
-import copy
-from typing import cast, TypedDict
+import json
+import threading
+from typing import cast, Optional, TypedDict
 
 from entity_ids.property_ids import *  # noqa: F403
-from templates import Template, TemplateForm
+from templates import Template, TemplateForm, templates_without_redirects
 from wikibase_types import Lexeme, LexemeForm, Statement, Statements
 
 
@@ -48,10 +49,100 @@ properties_exclusive = {
 }
 
 
-def match_template_to_lexeme_data(template: Template, lexeme_data: Lexeme) -> OverallMatch:
+# statements are matched by a key of (property ID, snak type, item ID of the value (if the snak type is “value”)):
+# so far, we only compare the main snak (ignoring qualifiers and references),
+# and only support entity ID values, because that’s all the templates use
+type StatementKey = tuple[str, str, Optional[str]]
+
+# the statements of a template entity (template or template form), compiled for matching:
+# the statements with their keys (by property ID, in order), the set of all keys,
+# and the properties that are exclusive (see properties_exclusive)
+type CompiledStatements = tuple[dict[str, list[tuple[StatementKey, Statement]]], frozenset[StatementKey], frozenset[str]]
+
+# the statements of a lexeme entity (lexeme or lexeme form), normalized for matching:
+# by property ID, the statements with their keys (in order), and the first statement for each key
+type LexemeStatements = dict[str, tuple[list[tuple[StatementKey, Statement]], dict[StatementKey, Statement]]]
+
+
+def statement_key(property_id: str, statement: Statement) -> StatementKey:
+    mainsnak = statement['mainsnak']
+    if mainsnak['snaktype'] == 'value':
+        value = mainsnak['datavalue']['value']
+        return (property_id, 'value', value.get('id') if isinstance(value, dict) else None)
+    return (property_id, mainsnak['snaktype'], None)
+
+
+def compile_statements(test: bool, statements: Statements) -> CompiledStatements:
+    properties_exclusive_for_template_entity = properties_exclusive['test' if test else 'www']
+    keyed_statements = {
+        property_id: [(statement_key(property_id, statement), statement) for statement in property_statements]
+        for property_id, property_statements in statements.items()
+    }
+    return (
+        keyed_statements,
+        frozenset(key for property_statements in keyed_statements.values() for key, statement in property_statements),
+        frozenset(property_id for property_id in statements if properties_exclusive_for_template_entity[property_id]),
+    )
+
+
+def template_entity_compiled_statements(test: bool, template_entity: Template | TemplateForm) -> CompiledStatements:
+    """Get the compiled statements of the template entity.
+
+    For templates from the registry (and their forms), these are only compiled once (see below)."""
+    statements = template_entity['statements']
+    compiled = compiled_statements.get((id(statements), test))
+    if compiled is not None and compiled[0] is statements:
+        return compiled[1]
+    return compile_statements(test, statements)
+
+
+def normalize_lexeme_statements(lexeme_entity: Lexeme | LexemeForm) -> LexemeStatements:
+    lexeme_statements: LexemeStatements = {}
+    for property_id, statements in lexeme_entity.get('claims', {}).items():
+        keyed_statements = [(statement_key(property_id, statement), statement) for statement in statements]
+        first_statements: dict[StatementKey, Statement] = {}
+        for key, statement in keyed_statements:
+            first_statements.setdefault(key, statement)
+        lexeme_statements[property_id] = (keyed_statements, first_statements)
+    return lexeme_statements
+
+
+def match_templates_to_lexeme_data(lexeme_data: Lexeme) -> dict[str, OverallMatch]:
+    """Match all templates against the given lexeme data.
+
+    The result is the same as calling match_template_to_lexeme_data()
+    for every template in templates_without_redirects, but the statements
+    are only matched once for all templates with equal statements
+    (see template_statements_groups below), and the templates share the
+    resulting statement dicts, which must therefore not be modified."""
+    lexeme_statements = normalize_lexeme_statements(lexeme_data)
+    statement_matches: dict[int, tuple[Statements, Statements, Statements]] = {}
+    matches: dict[str, OverallMatch] = {}
+    for template_name, template in templates_without_redirects.items():
+        group = template_statements_groups[template_name]
+        statement_match = statement_matches.get(group)
+        if statement_match is None:
+            statement_match = match_template_entity_to_lexeme_entity('test' in template, template, lexeme_data, lexeme_statements)
+            statement_matches[group] = statement_match
+        matched_statements, missing_statements, conflicting_statements = statement_match
+        matches[template_name] = {
+            'language': template['language_item_id'] == lexeme_data['language'],
+            'lexical_category': template['lexical_category_item_id'] == lexeme_data['lexicalCategory'],
+            'matched_statements': matched_statements,
+            'missing_statements': missing_statements,
+            'conflicting_statements': conflicting_statements,
+        }
+    return matches
+
+
+def match_template_to_lexeme_data(
+        template: Template,
+        lexeme_data: Lexeme,
+        lexeme_statements: Optional[LexemeStatements] = None,
+) -> OverallMatch:
     language_matches = template['language_item_id'] == lexeme_data['language']
     lexical_category_matches = template['lexical_category_item_id'] == lexeme_data['lexicalCategory']
-    matched_statements, missing_statements, conflicting_statements = match_template_entity_to_lexeme_entity('test' in template, template, lexeme_data)
+    matched_statements, missing_statements, conflicting_statements = match_template_entity_to_lexeme_entity('test' in template, template, lexeme_data, lexeme_statements)
 
     return {
         'language': language_matches,
@@ -66,54 +157,161 @@ def match_template_entity_to_lexeme_entity(  # may be template + lexeme or templ
         test: bool,
         template_entity: Template | TemplateForm,
         lexeme_entity: Lexeme | LexemeForm,
+        lexeme_statements: Optional[LexemeStatements] = None,
 ) -> tuple[Statements, Statements, Statements]:
+    """Match the statements of the template entity against those of the lexeme entity.
+
+    The lexeme statements can be passed in already normalized,
+    if the same lexeme entity is matched against several template entities."""
     matched_statements: Statements = {}
     missing_statements: Statements = {}
     conflicting_statements: Statements = {}
 
-    properties_exclusive_for_template_entity = properties_exclusive['test' if test else 'www']
-    for property_id in template_entity.get('statements', {}):
-        property_exclusive = properties_exclusive_for_template_entity[property_id]
-
-        for template_statement in template_entity['statements'][property_id]:
-            found_matching_statement = False
-            for lexeme_statement in lexeme_entity.get('claims', {}).get(property_id, []):
-                if match_statement(template_statement, lexeme_statement):
-                    found_matching_statement = True
-                    matched_statements.setdefault(property_id, [])\
-                                      .append(lexeme_statement)
-                    break
-
-            if not found_matching_statement:
+    if 'statements' not in template_entity:
+        return matched_statements, missing_statements, conflicting_statements
+    keyed_template_statements, template_keys, exclusive_properties = template_entity_compiled_statements(test, template_entity)
+    if lexeme_statements is None:
+        lexeme_statements = normalize_lexeme_statements(lexeme_entity)
+
+    for property_id, template_property_statements in keyed_template_statements.items():
+        keyed_lexeme_statements, first_lexeme_statements = lexeme_statements.get(property_id, ([], {}))
+
+        for key, template_statement in template_property_statements:
+            # the first lexeme statement with the same key matches
+            lexeme_statement = first_lexeme_statements.get(key)
+            if lexeme_statement is not None:
+                matched_statements.setdefault(property_id, [])\
+                                  .append(lexeme_statement)
+            else:
                 missing_statements.setdefault(property_id, [])\
                                   .append(template_statement)
 
-        if property_exclusive:
-            for lexeme_statement in lexeme_entity.get('claims', {}).get(property_id, []):
-                if lexeme_statement not in matched_statements.get(property_id, []):
-                    conflicting_statements.setdefault(property_id, [])\
-                                          .append(lexeme_statement)
+        if property_id in exclusive_properties:
+            for key, lexeme_statement in keyed_lexeme_statements:
+                # a lexeme statement conflicts unless it was matched (or is equal to a matched statement)
+                if key in template_keys:
+                    first_lexeme_statement = first_lexeme_statements[key]
+                    if lexeme_statement is first_lexeme_statement or lexeme_statement == first_lexeme_statement:
+                        continue
+                conflicting_statements.setdefault(property_id, [])\
+                                      .append(lexeme_statement)
 
     return matched_statements, missing_statements, conflicting_statements
 
 
 def match_statement(template_statement: Statement, lexeme_statement: Statement) -> bool:
-    # so far, we only compare the main snak (ignoring qualifiers and references),
-    # and only support entity ID values, because that’s all the templates use
-    if lexeme_statement['mainsnak']['snaktype'] == 'value':
-        if template_statement['mainsnak']['snaktype'] != 'value':
-            return False
-        template_statement_value_id = template_statement['mainsnak']['datavalue']['value']['id']
-        lexeme_statement_value_id = lexeme_statement['mainsnak']['datavalue']['value']['id']
-        return template_statement_value_id == lexeme_statement_value_id
-    else:
-        return lexeme_statement['mainsnak']['snaktype'] == template_statement['mainsnak']['snaktype']
+    property_id = lexeme_statement['mainsnak']['property']
+    return statement_key(property_id, template_statement) == statement_key(property_id, lexeme_statement)
+
+
+def _compile_registry_statements() -> dict[tuple[int, bool], tuple[Statements, CompiledStatements]]:
+    compiled: dict[tuple[int, bool], tuple[Statements, CompiledStatements]] = {}
+    for template in templates_without_redirects.values():
+        test = 'test' in template
+        for template_entity in [template, *template['forms']]:
+            if 'statements' in template_entity:
+                statements = template_entity['statements']
+                compiled[(id(statements), test)] = (statements, compile_statements(test, statements))
+    return compiled
+
+
+# compiled statements of all templates and template forms in the registry, by (id(statements), test);
+# the statements are also kept in the value, so that the ID cannot be reused for a different object
+compiled_statements = _compile_registry_statements()
+
+
+def _group_templates_by_statements() -> dict[str, int]:
+    groups: dict[tuple[str, bool], int] = {}
+    template_groups: dict[str, int] = {}
+    for template_name, template in templates_without_redirects.items():
+        key = (json.dumps(template.get('statements', {}), sort_keys=True), 'test' in template)
+        template_groups[template_name] = groups.setdefault(key, len(groups))
+    return template_groups
+
+
+# a group number for each template in the registry, by template name, such that templates
+# with equal statements (on the same wiki) have the same number and thus the same statement match;
+# many templates share their statements (e.g. a grammatical gender), so there are far fewer groups than templates
+template_statements_groups = _group_templates_by_statements()
+
+
+# grammatical features are matched as bitmasks: each grammatical feature item ID
+# used in a template form is assigned a bit (grammatical_feature_bit()),
+# and the grammatical features of template forms and lexeme forms are encoded as ints with those bits set
+grammatical_feature_bits: dict[str, int] = {}
+_grammatical_feature_bits_lock = threading.Lock()
+
+# the bitmask of all grammatical features of a template form,
+# and the bitmask of those grammatical features that are not optional
+type TemplateFormFeatures = tuple[int, int]
+
+
+def grammatical_feature_bit(item_id: str) -> int:
+    bit = grammatical_feature_bits.get(item_id)
+    if bit is None:
+        with _grammatical_feature_bits_lock:
+            bit = grammatical_feature_bits.setdefault(item_id, len(grammatical_feature_bits))
+    return bit
+
+
+def template_form_features(template_form: TemplateForm) -> TemplateFormFeatures:
+    features = 0
+    for grammatical_feature_item_id in template_form['grammatical_features_item_ids']:
+        features |= 1 << grammatical_feature_bit(grammatical_feature_item_id)
+    optional_features = 0
+    for grammatical_feature_item_id in template_form.get('grammatical_features_item_ids_optional', set()):
+        optional_features |= 1 << grammatical_feature_bit(grammatical_feature_item_id)
+    return features, features & ~optional_features
+
+
+def template_forms_features(template: Template) -> list[TemplateFormFeatures]:
+    """Get the features of each form of the template.
+
+    For templates from the registry, these are only computed once (see below)."""
+    precomputed = templates_forms_features.get(id(template))
+    if precomputed is not None and precomputed[0] is template:
+        return precomputed[1]
+    return [template_form_features(template_form) for template_form in template['forms']]
+
+
+def lexeme_form_features(lexeme_form: LexemeForm) -> int:
+    """Encode the grammatical features of the lexeme form as a bitmask.
+
+    Grammatical features that are not used in any template form
+    cannot contribute to a match, and are therefore ignored."""
+    features = 0
+    for grammatical_feature_item_id in lexeme_form.get('grammaticalFeatures', []):
+        bit = grammatical_feature_bits.get(grammatical_feature_item_id)
+        if bit is not None:
+            features |= 1 << bit
+    return features
+
+
+# features of the forms of all templates in the registry, by id(template);
+# the template is also kept in the value, so that the ID cannot be reused for a different object
+# (derived templates, e. g. with changed forms, are different objects and get their features computed)
+templates_forms_features: dict[int, tuple[Template, list[TemplateFormFeatures]]] = {
+    id(template): (template, [template_form_features(template_form) for template_form in template['forms']])
+    for template in templates_without_redirects.values()
+}
 
 
 def match_lexeme_forms_to_template(lexeme_forms: list, template: Template) -> MatchedTemplate:
-    template = cast(MatchedTemplate, copy.deepcopy(template))
+    forms_features = template_forms_features(template)
+    # the lexeme forms are only added to shallow copies of the template and its forms,
+    # the rest of the template (e. g. the statements) stays shared with the original template
+    template = cast(MatchedTemplate, {
+        **template,
+        'forms': [dict(template_form) for template_form in template['forms']],
+    })
     for lexeme_form in lexeme_forms:
-        best_template_forms = match_lexeme_form_to_template_forms('test' in template, lexeme_form, template['forms'])
+        best_template_forms = best_template_forms_for_lexeme_form(
+            'test' in template,
+            lexeme_form,
+            lexeme_form_features(lexeme_form),
+            template['forms'],
+            forms_features,
+        )
         if len(best_template_forms) == 1:
             best_template_form = cast(MatchedTemplateForm, best_template_forms[0])
             best_template_form.setdefault('lexeme_forms', []).append(lexeme_form)
@@ -125,37 +323,69 @@ def match_lexeme_forms_to_template(lexeme_forms: list, template: Template) -> Ma
 
 
 def match_lexeme_form_to_template_forms(test: bool, lexeme_form: LexemeForm, template_forms: list[TemplateForm]) -> list[TemplateForm]:
+    # make sure the template forms’ features have bits before encoding the lexeme form’s features
+    forms_features = [template_form_features(template_form) for template_form in template_forms]
+    return best_template_forms_for_lexeme_form(
+        test,
+        lexeme_form,
+        lexeme_form_features(lexeme_form),
+        template_forms,
+        forms_features,
+    )
+
+
+def best_template_forms_for_lexeme_form(
+        test: bool,
+        lexeme_form: LexemeForm,
+        lexeme_features: int,
+        template_forms: list[TemplateForm],
+        template_forms_features: list[TemplateFormFeatures],
+) -> list[TemplateForm]:
     best_template_forms = []
     best_matching_features = 0
-    for template_form in template_forms:
-        matching_features = match_lexeme_form_to_template_form(test, lexeme_form, template_form)
+    lexeme_statements = None  # normalized when first needed
+    for template_form, template_features in zip(template_forms, template_forms_features):
+        if template_features[1] & ~lexeme_features:
+            continue  # missing required grammatical features, cheap check to skip most template forms
+        if lexeme_statements is None and 'statements' in template_form:
+            lexeme_statements = normalize_lexeme_statements(lexeme_form)
+        matching_features = match_lexeme_form_features_to_template_form(test, lexeme_form, lexeme_features, template_form, template_features, lexeme_statements)
         if matching_features > best_matching_features:
             best_matching_features = matching_features
             best_template_forms = [template_form]
         elif matching_features == best_matching_features and best_matching_features > 0:
             best_template_forms.append(template_form)
-    if not best_template_forms and len(template_forms) == 1 and matchable_features(template_form) == 0:
+    if not best_template_forms and len(template_forms) == 1 and matchable_features(template_forms[0]) == 0:
         # as a special exception, in a template with a single featureless form, a lexeme form is allowed to match with no matching features
         return [template_forms[0]]
     return best_template_forms
 
 
 def match_lexeme_form_to_template_form(test: bool, lexeme_form: LexemeForm, template_form: TemplateForm) -> int:
-    matching_features = 0
+    # make sure the template form’s features have bits before encoding the lexeme form’s features
+    template_features = template_form_features(template_form)
+    return match_lexeme_form_features_to_template_form(test, lexeme_form, lexeme_form_features(lexeme_form), template_form, template_features)
 
-    for grammatical_feature_item_id in template_form['grammatical_features_item_ids']:
-        if grammatical_feature_item_id in lexeme_form['grammaticalFeatures']:
-            matching_features += 1
-        elif grammatical_feature_item_id in template_form.get('grammatical_features_item_ids_optional', set()):
-            pass
-        else:
-            return 0
 
-    matched_statements, missing_statements, conflicting_statements = match_template_entity_to_lexeme_entity(test, template_form, lexeme_form)
-    if missing_statements or conflicting_statements:
+def match_lexeme_form_features_to_template_form(
+        test: bool,
+        lexeme_form: LexemeForm,
+        lexeme_features: int,
+        template_form: TemplateForm,
+        template_features: TemplateFormFeatures,
+        lexeme_statements: Optional[LexemeStatements] = None,
+) -> int:
+    features, required_features = template_features
+    if required_features & ~lexeme_features:
         return 0
-    else:
-        matching_features += sum(len(statements) for statements in matched_statements.values())
+    matching_features = (features & lexeme_features).bit_count()
+
+    if 'statements' in template_form:
+        matched_statements, missing_statements, conflicting_statements = match_template_entity_to_lexeme_entity(test, template_form, lexeme_form, lexeme_statements)
+        if missing_statements or conflicting_statements:
+            return 0
+        else:
+            matching_features += sum(len(statements) for statements in matched_statements.values())
 
     return matching_features
 
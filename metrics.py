@@ -0,0 +1,102 @@
+"""Prometheus metrics of the tool, served at /metrics.
+
+gunicorn runs several worker processes, and a scrape of /metrics only
+reaches one of them; to report the metrics of all workers together,
+gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR, so that each worker
+keeps its metric values in memory-mapped files in that directory,
+and /metrics aggregates the files of all workers (see the
+“multiprocess mode” of prometheus_client). Without that variable,
+e.g. in local development, the metrics only cover the current process."""
+
+import os
+import time
+
+import flask
+import prometheus_client
+from prometheus_client import multiprocess
+import werkzeug
+
+
+request_duration = prometheus_client.Histogram(
+    'lexeme_forms_request_duration_seconds',
+    'Time spent handling requests, by route (until the response headers are sent).',
+    ['route', 'method'],
+)
+requests_total = prometheus_client.Counter(
+    'lexeme_forms_requests',
+    'Requests handled, by route and response status.',
+    ['route', 'method', 'status'],
+)
+mwapi_request_duration = prometheus_client.Histogram(
+    'lexeme_forms_mwapi_request_duration_seconds',
+    'Time spent on MediaWiki API requests, by host and action.',
+    ['host', 'action'],
+)
+mwapi_errors = prometheus_client.Counter(
+    'lexeme_forms_mwapi_errors',
+    'MediaWiki API errors that ended a request with an error page, by error code.',
+    ['code'],
+)
+bulk_lines = prometheus_client.Counter(
+    'lexeme_forms_bulk_lines',
+    'Bulk mode lines processed within web requests (not as bulk jobs), by result (done, duplicates or error).',
+    ['result'],
+)
+# the pool counters are gauges rather than counters because a worker may discard its sessions (see SessionPool.clear)
+mwapi_pool_requests = prometheus_client.Gauge(
+    'lexeme_forms_mwapi_pool_requests',
+    'Requests sent through the pooled anonymous API sessions of the live workers, by host.',
+    ['host'],
+    multiprocess_mode='livesum',
+)
+mwapi_pool_connections = prometheus_client.Gauge(
+    'lexeme_forms_mwapi_pool_connections',
+    'Connections opened by the pooled anonymous API sessions of the live workers, by host.',
+    ['host'],
+    multiprocess_mode='livesum',
+)
+mwapi_pool_reused_connections = prometheus_client.Gauge(
+    'lexeme_forms_mwapi_pool_reused_connections',
+    'Requests of the pooled anonymous API sessions of the live workers that reused a kept-alive connection, by host.',
+    ['host'],
+    multiprocess_mode='livesum',
+)
+cache_lookups = prometheus_client.Counter(
+    'lexeme_forms_cache_lookups',
+    'Lookups in the in-process caches, by cache and result (hit or miss).',
+    ['cache', 'result'],
+)
+
+
+def route() -> str:
+    """Get the route of the current request, as a metric label."""
+    url_rule = flask.request.url_rule
+    return url_rule.rule if url_rule is not None else '(no route)'
+
+
+def exposition() -> flask.Response:
+    """Render the metrics in the Prometheus text exposition format."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return flask.Response(
+        prometheus_client.generate_latest(registry),
+        content_type=prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
+
+def init_app(app: flask.Flask) -> None:
+
+    @app.before_request
+    def start_request_metrics() -> None:
+        flask.g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request_metrics(response: werkzeug.Response) -> werkzeug.Response:
+        start = flask.g.get('metrics_start')
+        if start is not None:
+            request_duration.labels(route(), flask.request.method).observe(time.perf_counter() - start)
+            requests_total.labels(route(), flask.request.method, str(response.status_code)).inc()
+        return response
@@ -0,0 +1,150 @@
+"""Shared, pooled mwapi sessions for anonymous API requests.
+
+Creating a new mwapi.Session for every API call also creates a new
+requests.Session, and therefore a new connection (including a TLS
+handshake) to the target host. The pool in this module instead keeps
+one session per host for the lifetime of the worker process, so that
+subsequent anonymous requests can reuse kept-alive connections.
+
+Only anonymous sessions may be pooled: authenticated sessions carry
+per-user credentials and must never be shared between requests."""
+
+import threading
+from typing import Optional, TypedDict
+
+import mwapi  # type: ignore
+import requests.adapters
+import requests.utils
+
+import metrics
+from timing import TimedSession
+
+
+class SessionPoolStats(TypedDict):
+    requests: int
+    connections: int
+    reused_connections: int
+
+
+class SessionPool:
+    """A thread-safe pool of anonymous mwapi sessions, keyed by host."""
+
+    def __init__(
+            self,
+            user_agent: Optional[str] = None,
+            pool_connections: int = requests.adapters.DEFAULT_POOLSIZE,
+            pool_maxsize: int = requests.adapters.DEFAULT_POOLSIZE,
+            host_override: str | None = None,
+    ):
+        self.user_agent = user_agent
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.host_override = host_override
+        self._sessions: dict[str, TimedSession] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+            self,
+            pool_connections: int | None = None,
+            pool_maxsize: int | None = None,
+            host_override: str | None = None,
+            user_agent: str | None = None,
+    ) -> None:
+        """Change the pool sizes, the host override or the user agent.
+
+        Only sessions created afterwards are affected,
+        so this should be called before the first session is used."""
+        if user_agent is not None:
+            self.user_agent = user_agent
+        if pool_connections is not None:
+            self.pool_connections = int(pool_connections)
+        if pool_maxsize is not None:
+            self.pool_maxsize = int(pool_maxsize)
+        if host_override is not None:
+            self.host_override = host_override.rstrip('/')
+
+    def api_host(self, host: str) -> str:
+        """Get the host that API requests for the given host should be sent to.
+
+        This is the host itself, unless a host override is configured
+        (e.g. the local stand-in server in fake_mwapi.py); in that case,
+        the domain of the original host becomes the first path component,
+        so that the server can still tell the wikis apart."""
+        if self.host_override is None:
+            return host
+        return self.host_override + '/' + host.split('://', 1)[-1]
+
+    def session(self, host: str) -> mwapi.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = TimedSession(
+                    host=self.api_host(host),
+                    # without a configured user agent, use the default one of requests (see toolforge.set_user_agent)
+                    user_agent=self.user_agent or requests.utils.default_user_agent(),
+                    session=self._requests_session(),
+                )
+                self._sessions[host] = session
+            return session
+
+    def _requests_session(self) -> requests.Session:
+        requests_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        requests_session.mount('https://', adapter)
+        requests_session.mount('http://', adapter)
+        return requests_session
+
+    def stats(self) -> dict[str, SessionPoolStats]:
+        """Get the connection reuse counters for each host.
+
+        The counters are taken from the underlying urllib3 connection
+        pools: every request that did not need a new connection
+        reused a kept-alive one."""
+        with self._lock:
+            sessions = dict(self._sessions)
+        stats: dict[str, SessionPoolStats] = {}
+        for host, session in sessions.items():
+            num_requests = 0
+            num_connections = 0
+            for adapter in set(session.session.adapters.values()):
+                pool_manager = getattr(adapter, 'poolmanager', None)
+                if pool_manager is None:
+                    continue
+                for key in pool_manager.pools.keys():
+                    connection_pool = pool_manager.pools.get(key)
+                    if connection_pool is None:
+                        continue
+                    num_requests += connection_pool.num_requests
+                    num_connections += connection_pool.num_connections
+            stats[host] = {
+                'requests': num_requests,
+                'connections': num_connections,
+                'reused_connections': max(num_requests - num_connections, 0),
+            }
+        return stats
+
+    def update_metrics(self) -> None:
+        """Copy the connection reuse counters (see stats()) into the Prometheus metrics."""
+        for host, stats in self.stats().items():
+            metrics.mwapi_pool_requests.labels(host).set(stats['requests'])
+            metrics.mwapi_pool_connections.labels(host).set(stats['connections'])
+            metrics.mwapi_pool_reused_connections.labels(host).set(stats['reused_connections'])
+
+    def clear(self) -> None:
+        """Close and forget all pooled sessions."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.session.close()
+
+
+# the user agent is configured by app.py
+anonymous_sessions = SessionPool()
+
+
+def anonymous_session(host: str) -> mwapi.Session:
+    """Get the shared anonymous session for the given host."""
+    return anonymous_sessions.session(host)
@@ -0,0 +1,38 @@
+document.addEventListener('DOMContentLoaded', function() {
+    'use strict';
+
+    const main = document.getElementsByTagName('main')[0],
+          jobId = main.dataset.jobId,
+          baseUrl = document.querySelector('link[rel=index]').href,
+          resultsList = document.getElementById('bulk-job-results'),
+          runningMessage = document.getElementById('bulk-job-running'),
+          pollInterval = 2000;
+    let numResults = parseInt(main.dataset.numResults, 10);
+    if (!runningMessage) {
+        return; // job already done
+    }
+
+    function poll() {
+        fetch(`${baseUrl}/api/v1/bulk_job/${jobId}?offset=${numResults}`, {
+            headers: {
+                Accept: 'application/json'
+            }
+        })
+            .then(r => r.json())
+            .then(response => {
+                resultsList.insertAdjacentHTML('beforeend', response.html);
+                numResults += response.num_results;
+                if (response.done) {
+                    runningMessage.remove();
+                } else {
+                    setTimeout(poll, pollInterval);
+                }
+            })
+            .catch(e => {
+                console.error(e);
+                setTimeout(poll, pollInterval * 5);
+            });
+    }
+
+    setTimeout(poll, pollInterval);
+});
@@ -36,6 +36,35 @@ document.addEventListener('DOMContentLoaded', function() {
         wikifunctionsMessageError.style.display = 'none';
     }
 
+    /**
+     * Call the callback with each JSON line of the response body as it arrives.
+     */
+    function readLines(response, callback) {
+        const reader = response.body.getReader(),
+              decoder = new TextDecoder();
+        let buffer = '';
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                buffer += decoder.decode(value, { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line) {
+                        callback(JSON.parse(line));
+                    }
+                }
+                if (done) {
+                    if (buffer) {
+                        callback(JSON.parse(buffer));
+                    }
+                    return;
+                }
+                return read();
+            });
+        }
+        return read();
+    }
+
     const buttons = [];
     for (const functionName of functionNames) {
         const button = document.createElement('button');
@@ -56,24 +85,41 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!lemma) {
                 return;
             }
+            let failed = false;
+            function fillInput(line) {
+                const { form_index: i, error } = line;
+                let { value } = line;
+                if (error !== undefined) {
+                    failed = true;
+                    console.error(error);
+                    return;
+                }
+                if (value === null) {
+                    return;
+                } else if (Array.isArray(value)) {
+                    value = value.join('/');
+                }
+                if (formRepresentationInputs[i] && !formRepresentationInputs[i].value) {
+                    formRepresentationInputs[i].value = value;
+                }
+            }
             setAllButtonsDisabled(true);
             hideAllMessages();
             wikifunctionsMessageGenerating.style.display = 'inline';
-            fetch(`${baseUrl}/api/v1/wikifunctions/${templateName}/${lemma}/${functionName}`)
-                .then(r => r.json())
-                .then(response => {
-                    for (let i = 0; i < response.length; i++) {
-                        let value = response[i];
-                        if (value === null ) {
-                            continue;
-                        } else if (Array.isArray(value)) {
-                            value = value.join('/');
-                        }
-                        if (formRepresentationInputs[i] && !formRepresentationInputs[i].value) {
-                            formRepresentationInputs[i].value = value;
-                        }
+            // the streaming response has one line per form, in the order the function calls finish,
+            // so that the inputs can be filled as soon as each value is available
+            fetch(`${baseUrl}/api/v1/wikifunctions/${templateName}/${lemma}/${functionName}?stream=1`)
+                .then(r => {
+                    if (!r.ok) {
+                        throw new Error(`HTTP ${r.status}`);
                     }
+                    return readLines(r, fillInput);
+                })
+                .then(() => {
                     hideAllMessages();
+                    if (failed) {
+                        wikifunctionsMessageError.style.display = 'inline';
+                    }
                 })
                 .catch(e => {
                     hideAllMessages();
@@ -1,3 +1,5 @@
+from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Dict, List, Literal, NotRequired, Optional, Set, TypedDict, overload
 
 from entity_ids import *  # noqa: F403
@@ -22770,10 +22772,10 @@ _internal_templates: Dict[str, str | list[str] | _InternalTemplate] = {
 # rewrite _internal_templates ('language' as one dict entry with a dict value)
 # into templates ('language_item_id' and 'language_code' as separate dict entries)
 # (using **language_English directly doesn’t work yet, python/mypy#9408)
-templates: Dict[str, str | list[str] | Template] = {}
+_templates: Dict[str, str | list[str] | Template] = {}
 for _template_name, _internal_template in _internal_templates.items():
     if not isinstance(_internal_template, dict):
-        templates[_template_name] = _internal_template
+        _templates[_template_name] = _internal_template
         continue
     _template: Template = {
         'label': _internal_template['label'],
@@ -22792,15 +22794,22 @@ for _template_name, _internal_template in _internal_templates.items():
         _template['wikifunctions_intro'] = _internal_template['wikifunctions_intro']
     if 'statements' in _internal_template:
         _template['statements'] = _internal_template['statements']
-    templates[_template_name] = _template
+    _templates[_template_name] = _template
 
 
-templates_without_redirects = {
+_templates_without_redirects = {
     template_name: template
-    for template_name, template in templates.items()
+    for template_name, template in _templates.items()
     if isinstance(template, dict)
 }
 
 
-for template_name, template in templates_without_redirects.items():
+for template_name, template in _templates_without_redirects.items():
     template['@template_name'] = template_name
+
+
+# the registry never changes after this module is imported, so only read-only views of it are exported;
+# this also keeps the tool from accidentally modifying it in a gunicorn worker,
+# which would copy the memory pages that the worker shares with the master (see gunicorn.conf.py)
+templates: Mapping[str, str | list[str] | Template] = MappingProxyType(_templates)
+templates_without_redirects: Mapping[str, Template] = MappingProxyType(_templates_without_redirects)
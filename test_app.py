@@ -1,13 +1,19 @@
 import copy
 import flask
+import gzip
 from html.parser import HTMLParser
+import jinja2
 import json
+import mwapi  # type: ignore
 import pytest
 import re
+import threading
+import time
 from toolforge_i18n import lang_mw_to_bcp47
 import werkzeug
 
 import app as lexeme_forms
+import bulk_jobs
 import matching
 from templates import templates_without_redirects
 
@@ -295,6 +301,68 @@ def test_get_duplicates_api_html_empty(monkeypatch):
     assert response.get_data(as_text=True) == ''
 
 
+def test_get_duplicates_cached(monkeypatch):
+    calls = []
+
+    def query_duplicates(wiki, language_code, lemma):
+        calls.append((wiki, language_code, lemma))
+        return [{'id': 'L1'}]
+    monkeypatch.setattr(lexeme_forms, 'query_duplicates', query_duplicates)
+    lexeme_forms.duplicates_cache.clear()
+    # decomposed and precomposed form of the same lemma
+    assert lexeme_forms.get_duplicates('www', 'de', 'Sa\u0308ge') == [{'id': 'L1'}]
+    assert lexeme_forms.get_duplicates('www', 'de', 'S\u00e4ge') == [{'id': 'L1'}]
+    assert calls == [('www', 'de', 'S\u00e4ge')]
+    lexeme_forms.duplicates_cache.clear()
+
+def test_get_duplicates_evicted(monkeypatch):
+    calls = []
+
+    def query_duplicates(wiki, language_code, lemma):
+        calls.append((wiki, language_code, lemma))
+        return []
+    monkeypatch.setattr(lexeme_forms, 'query_duplicates', query_duplicates)
+    lexeme_forms.duplicates_cache.clear()
+    lexeme_forms.get_duplicates('www', 'en', 'noun')
+    lexeme_forms.evict_duplicates('www', {'en': {'language': 'en', 'value': 'noun'}})
+    lexeme_forms.get_duplicates('www', 'en', 'noun')
+    assert len(calls) == 2
+    lexeme_forms.duplicates_cache.clear()
+
+
+def test_get_lexeme_data_cached(monkeypatch):
+    calls = []
+
+    def query_lexeme_data(lexeme_id, wiki, revision=None):
+        calls.append((lexeme_id, wiki, revision))
+        return {'id': lexeme_id, 'lastrevid': 123, 'forms': []}
+    monkeypatch.setattr(lexeme_forms, 'query_lexeme_data', query_lexeme_data)
+    lexeme_forms.lexeme_revisions_cache.clear()
+    lexeme_forms.latest_lexeme_revisions_cache.clear()
+    lexeme_data = lexeme_forms.get_lexeme_data('L1', 'www')
+    lexeme_data['forms'].append('modified by caller')
+    assert lexeme_forms.get_lexeme_data('L1', 'www') == {'id': 'L1', 'lastrevid': 123, 'forms': []}
+    assert lexeme_forms.get_lexeme_data('L1', 'www', '123') == {'id': 'L1', 'lastrevid': 123, 'forms': []}
+    assert calls == [('L1', 'www', None)]
+    lexeme_forms.get_lexeme_data('L1', 'test')
+    lexeme_forms.get_lexeme_data('L1', 'www', '122')
+    assert calls == [('L1', 'www', None), ('L1', 'test', None), ('L1', 'www', '122')]
+    lexeme_forms.lexeme_revisions_cache.clear()
+    lexeme_forms.latest_lexeme_revisions_cache.clear()
+
+def test_get_lexeme_data_missing_not_cached(monkeypatch):
+    calls = []
+
+    def query_lexeme_data(lexeme_id, wiki, revision=None):
+        calls.append((lexeme_id, wiki, revision))
+        return {'id': lexeme_id, 'missing': ''}
+    monkeypatch.setattr(lexeme_forms, 'query_lexeme_data', query_lexeme_data)
+    lexeme_forms.latest_lexeme_revisions_cache.clear()
+    lexeme_forms.get_lexeme_data('L1', 'www')
+    lexeme_forms.get_lexeme_data('L1', 'www')
+    assert len(calls) == 2
+
+
 minimal_template = {
     '@template_name': 'minimal-template',
     'language_code': 'en',
@@ -423,6 +491,17 @@ def test_add_form_data_to_template_no_template_modification():
     assert template is not new_template
     assert 'lexeme_id' not in template
 
+def test_add_form_data_to_template_no_form_modification():
+    form_data = werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun')])
+    template = templates_without_redirects['english-noun']
+    new_template = lexeme_forms.add_form_data_to_template(form_data, template)
+    assert new_template['forms'][0]['value'] == 'noun'
+    assert 'value' not in template['forms'][0]
+    # forms without a new value, and the rest of the template, are shared rather than copied
+    assert new_template['forms'][1] is template['forms'][1]
+    assert new_template['forms'][0]['grammatical_features_item_ids'] is template['forms'][0]['grammatical_features_item_ids']
+    assert new_template['@attribution'] is template['@attribution']
+
 def test_current_url_index(monkeypatch):
     monkeypatch.setitem(lexeme_forms.app.config, 'APPLICATION_ROOT', '/')
     with lexeme_forms.app.test_request_context('/'):
@@ -822,6 +901,129 @@ def test_build_summary_generated_via():
         summary = lexeme_forms.build_summary(template, form_data)
     assert summary == '[[toolforge:lexeme-forms/template/foo/|foo]], generated via [[toolforge:other/bar|other tool, bar]]'
 
+class FakeEditSession:
+    def __init__(self, bad_tokens=()):
+        self.tokens = iter(['token1', 'token2', 'token3'])
+        self.bad_tokens = set(bad_tokens)
+        self.token_requests = 0
+        self.edit_tokens = []
+
+    def get(self, action, meta):
+        assert (action, meta) == ('query', 'tokens')
+        self.token_requests += 1
+        return {'query': {'tokens': {'csrftoken': next(self.tokens)}}}
+
+    def post(self, action, token, **kwargs):
+        assert action == 'wbeditentity'
+        self.edit_tokens.append(token)
+        if token in self.bad_tokens:
+            raise mwapi.errors.APIError('badtoken', 'Invalid CSRF token.', None)
+        return {'entity': {'id': 'L%d' % len(self.edit_tokens)}}
+
+class FakeOAuth:
+
+    def __init__(self, access_token='token'):
+        self.access_token = access_token
+
+    def has_access_token(self):
+        return True
+
+    def get_access_token(self):
+        return {'access_token': self.access_token}
+
+def fake_query_userinfo(monkeypatch, groups_sequence):
+    calls = []
+
+    def query_userinfo():
+        calls.append(None)
+        return {'id': 1, 'name': 'Test user', 'groups': groups_sequence[min(len(calls), len(groups_sequence)) - 1]}
+
+    monkeypatch.setitem(lexeme_forms.app.config, 'OAUTH', {})
+    monkeypatch.setattr(lexeme_forms, 'oauth', FakeOAuth(), raising=False)
+    monkeypatch.setattr(lexeme_forms, 'query_userinfo', query_userinfo)
+    lexeme_forms.userinfo_cache.clear()
+    return calls
+
+def test_get_userinfo_cached(monkeypatch):
+    calls = fake_query_userinfo(monkeypatch, [['*', 'user']])
+    for _ in range(2):
+        with lexeme_forms.app.test_request_context():
+            assert lexeme_forms.get_userinfo()['name'] == 'Test user'
+            assert lexeme_forms.get_userinfo()['name'] == 'Test user'
+    assert len(calls) == 1
+    lexeme_forms.oauth.access_token = 'other token'  # another user
+    with lexeme_forms.app.test_request_context():
+        lexeme_forms.get_userinfo()
+    assert len(calls) == 2
+    lexeme_forms.userinfo_cache.clear()
+
+def test_get_userinfo_evicted(monkeypatch):
+    calls = fake_query_userinfo(monkeypatch, [['*', 'user']])
+    with lexeme_forms.app.test_request_context():
+        lexeme_forms.get_userinfo()
+        lexeme_forms.evict_userinfo()
+        lexeme_forms.get_userinfo()
+    assert len(calls) == 2
+    lexeme_forms.userinfo_cache.clear()
+
+def test_bulk_denied_refreshes_userinfo(monkeypatch):
+    calls = fake_query_userinfo(monkeypatch, [['*', 'user'], ['*', 'user', 'autoconfirmed']])
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/template/english-noun/bulk/')
+    assert len(calls) == 2
+    assert '<textarea' in response.get_data(as_text=True)
+    lexeme_forms.userinfo_cache.clear()
+
+def test_bulk_denied(monkeypatch):
+    calls = fake_query_userinfo(monkeypatch, [['*', 'user']])
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/template/english-noun/bulk/')
+    assert len(calls) == 2
+    assert '<textarea' not in response.get_data(as_text=True)
+    lexeme_forms.userinfo_cache.clear()
+
+def test_submit_lexeme_csrf_token_cached(monkeypatch):
+    session = FakeEditSession()
+    monkeypatch.setattr(lexeme_forms, 'authenticated_session', lambda host: session)
+    lexeme_forms.csrf_tokens_cache.clear()
+    template = templates_without_redirects['english-noun']
+    lexeme_forms.submit_lexeme(template, {'forms': []}, 'summary')
+    lexeme_forms.submit_lexeme(template, {'forms': []}, 'summary')
+    assert session.token_requests == 1
+    assert session.edit_tokens == ['token1', 'token1']
+    lexeme_forms.csrf_tokens_cache.clear()
+
+def test_submit_lexeme_latest_revision_evicted(monkeypatch):
+    session = FakeEditSession()
+    monkeypatch.setattr(lexeme_forms, 'authenticated_session', lambda host: session)
+    lexeme_forms.latest_lexeme_revisions_cache.set(('www', 'L1'), '123')
+    template = templates_without_redirects['english-noun']
+    lexeme_forms.submit_lexeme(template, {'id': 'L1', 'forms': []}, 'summary')
+    assert lexeme_forms.latest_lexeme_revisions_cache.get(('www', 'L1')) is None
+    lexeme_forms.csrf_tokens_cache.clear()
+
+def test_submit_lexeme_csrf_token_badtoken(monkeypatch):
+    session = FakeEditSession(bad_tokens=['token1'])
+    monkeypatch.setattr(lexeme_forms, 'authenticated_session', lambda host: session)
+    lexeme_forms.csrf_tokens_cache.clear()
+    template = templates_without_redirects['english-noun']
+    lexeme_id, lexeme_uri = lexeme_forms.submit_lexeme(template, {'forms': []}, 'summary')
+    assert lexeme_id == 'L2'
+    assert session.token_requests == 2
+    assert session.edit_tokens == ['token1', 'token2']
+    lexeme_forms.csrf_tokens_cache.clear()
+
+def test_submit_lexeme_csrf_token_badtoken_twice(monkeypatch):
+    session = FakeEditSession(bad_tokens=['token1', 'token2'])
+    monkeypatch.setattr(lexeme_forms, 'authenticated_session', lambda host: session)
+    lexeme_forms.csrf_tokens_cache.clear()
+    template = templates_without_redirects['english-noun']
+    with pytest.raises(mwapi.errors.APIError):
+        lexeme_forms.submit_lexeme(template, {'forms': []}, 'summary')
+    assert session.edit_tokens == ['token1', 'token2']
+    lexeme_forms.csrf_tokens_cache.clear()
+
+
 @pytest.mark.parametrize('uri, hash, expected', [
     ('https://example.com/', None, 'https://example.com/'),
     ('https://example.com/', 'abc', 'https://example.com/#abc'),
@@ -851,6 +1053,41 @@ def test_get_template_api_redirect():
     assert response.status_code == 307
     assert response.headers['location'].endswith('/api/v1/template/dutch-noun-feminine')
 
+def test_get_all_templates_api_unchanged():
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/template/')
+    with lexeme_forms.app.app_context():
+        expected = flask.jsonify(dict(lexeme_forms.templates)).get_data()
+    assert response.get_data() == expected
+
+def test_get_template_api_list():
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/template/portuguese-adjective')
+    assert response.status_code == 200
+    templates = json.loads(response.get_data(as_text=True))
+    assert isinstance(templates, list)
+    assert all('@attribution' in template for template in templates)
+
+def test_get_template_api_etag():
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/template/german-noun-feminine')
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        assert 'max-age' in response.headers['Cache-Control']
+        response = client.get('/api/v1/template/german-noun-feminine', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+def test_get_template_api_gzip():
+    with lexeme_forms.app.test_client() as client:
+        plain = client.get('/api/v1/template/german-noun-feminine')
+        response = client.get('/api/v1/template/german-noun-feminine', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
 def test_get_template_api_missing():
     with lexeme_forms.app.test_client() as client:
         response = client.get('/api/v1/template/german-noun')
@@ -862,6 +1099,137 @@ def test_get_template_api_missing():
     # the previous statement should not have thrown an exception
 
 
+def test_match_templates_to_lexeme_id_unchanged(monkeypatch):
+    lexeme_data = {
+        'language': 'Q188',
+        'lexicalCategory': 'Q1084',
+        'claims': {
+            'P5185': [{
+                'mainsnak': {'snaktype': 'value', 'property': 'P5185', 'datatype': 'wikibase-item', 'datavalue': {'type': 'wikibase-entityid', 'value': {'entity-type': 'item', 'id': 'Q1775461'}}},
+                'type': 'statement',
+                'rank': 'normal',
+            }],
+        },
+    }
+    monkeypatch.setattr(lexeme_forms, 'get_lexeme_data', lambda lexeme_id, wiki: lexeme_data)
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/match_template_to_lexeme/www/L1')
+    assert response.status_code == 200
+    with lexeme_forms.app.app_context():
+        expected = flask.jsonify({
+            template_name: matching.match_template_to_lexeme_data(template, lexeme_data)
+            for template_name, template in templates_without_redirects.items()
+        })
+    assert response.get_data() == expected.get_data()
+
+
+class FakeEntitiesSession:
+    def __init__(self, missing_ids=()):
+        self.missing_ids = set(missing_ids)
+        self.calls = []
+
+    def get(self, action, ids):
+        assert action == 'wbgetentities'
+        self.calls.append(ids)
+        entities = {}
+        for lexeme_id in ids:
+            if lexeme_id in self.missing_ids:
+                entities[lexeme_id] = {'id': lexeme_id, 'missing': ''}
+            else:
+                entities[lexeme_id] = {
+                    'id': lexeme_id,
+                    'lastrevid': 1,
+                    'language': 'Q1860',
+                    'lexicalCategory': 'Q1084',
+                    'claims': {},
+                    'forms': [
+                        {'id': f'{lexeme_id}-F1', 'grammaticalFeatures': ['Q110786'], 'claims': {}},
+                        {'id': f'{lexeme_id}-F2', 'grammaticalFeatures': ['Q146786'], 'claims': {}},
+                        {'id': f'{lexeme_id}-F3', 'grammaticalFeatures': [], 'claims': {}},
+                    ],
+                }
+        return {'entities': entities}
+
+@pytest.fixture
+def fake_entities_session(monkeypatch):
+    session = FakeEntitiesSession(missing_ids=['L2'])
+    monkeypatch.setattr(lexeme_forms, 'anonymous_session', lambda host: session)
+    lexeme_forms.lexeme_revisions_cache.clear()
+    lexeme_forms.latest_lexeme_revisions_cache.clear()
+    yield session
+    lexeme_forms.lexeme_revisions_cache.clear()
+    lexeme_forms.latest_lexeme_revisions_cache.clear()
+
+def test_match_templates_to_lexeme_ids(fake_entities_session):
+    lexeme_ids = [f'L{i}' for i in range(1, 121)]
+    with lexeme_forms.app.test_client() as client:
+        response = client.post('/api/v1/match_template_to_lexemes/www', json={
+            'lexeme_ids': lexeme_ids,
+            'template_names': ['english-noun'],
+        })
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [len(ids) for ids in fake_entities_session.calls] == [50, 50, 20]
+    assert [result['lexeme_id'] for result in results] == lexeme_ids
+    assert results[1] == {'lexeme_id': 'L2', 'error': 'missing'}
+    match = results[0]['matches']['english-noun']
+    assert match['language'] and match['lexical_category']
+    assert match['forms'] == [['L1-F1'], ['L1-F2']]
+    assert match['ambiguous_lexeme_forms'] == []
+    assert match['unmatched_lexeme_forms'] == ['L1-F3']
+
+def test_match_templates_to_lexeme_ids_cached(fake_entities_session):
+    with lexeme_forms.app.test_client() as client:
+        client.post('/api/v1/match_template_to_lexemes/www', json={'lexeme_ids': ['L1', 'L3']})
+        client.post('/api/v1/match_template_to_lexemes/www', json={'lexeme_ids': ['L1', 'L3', 'L4']})
+    assert fake_entities_session.calls == [['L1', 'L3'], ['L4']]
+
+def test_match_templates_to_lexeme_ids_all_templates(fake_entities_session):
+    with lexeme_forms.app.test_client() as client:
+        response = client.post('/api/v1/match_template_to_lexemes/www', json={'lexeme_ids': ['L1']})
+    [result] = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert result['matches'].keys() == templates_without_redirects.keys()
+    assert result['matches']['english-noun']['forms'] == [['L1-F1'], ['L1-F2']]
+    assert 'forms' not in result['matches']['german-noun-feminine']
+
+class ErrorSession:
+
+    def get(self, **kwargs):
+        raise mwapi.errors.APIError('maxlag', 'Waiting for a database server.', None)
+
+def test_metrics_api_error(monkeypatch):
+    monkeypatch.setattr(lexeme_forms, 'anonymous_session', lambda host: ErrorSession())
+    lexeme_forms.duplicates_cache.clear()
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/duplicates/www/en/test_metrics_api_error')
+        assert response.status_code == 500
+        response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
+    metrics_text = response.get_data(as_text=True)
+    assert 'lexeme_forms_mwapi_errors_total{code="maxlag"}' in metrics_text
+    assert 'lexeme_forms_requests_total{method="GET",route="/api/v1/duplicates/<any(www,test):wiki>/<language_code>/<path:lemma>",status="500"}' in metrics_text
+
+@pytest.mark.parametrize('body', [
+    None,
+    {},
+    {'lexeme_ids': 'L1'},
+    {'lexeme_ids': ['Q1']},
+    {'lexeme_ids': ['L1'], 'template_names': ['no-such-template']},
+    {'lexeme_ids': ['L1'], 'template_names': [1]},
+    {'lexeme_ids': ['L1'], 'template_names': 1},
+    {'lexeme_ids': ['L1'], 'template_names': None},
+    {'lexeme_ids': ['L1'], 'template_names': 'english-noun'},
+    {'lexeme_ids': ['L1'] * 501},
+])
+def test_match_templates_to_lexeme_ids_bad_request(body):
+    with lexeme_forms.app.test_client() as client:
+        response = client.post('/api/v1/match_template_to_lexemes/www', json=body)
+    assert response.status_code == 400
+    json.loads(response.get_data(as_text=True))
+
+
 def test_update_lexeme_add_dwarves_dwarrows():
     lexeme_data = {
         'lemmas': {'en': {'language': 'en', 'value': 'dwarf'}},
@@ -1362,6 +1730,134 @@ def test_integration_edit(template_name):
         assert form['lexeme_forms'][0]['representations'][template['language_code']]['value'] == str(index)
 
 
+def test_process_bulk_lexemes_order(monkeypatch):
+    def find_duplicates(template, form_data):
+        lemma = form_data.getlist('form_representation')[0]
+        time.sleep(0.01 * (5 - int(lemma)))  # later lines finish first
+        return ['duplicate'] if lemma == '2' else []
+    monkeypatch.setattr(lexeme_forms, 'find_duplicates', find_duplicates)
+    monkeypatch.setattr(lexeme_forms, 'get_lexeme_data', lambda lexeme_id, wiki: {'language': 'Q1860', 'lexicalCategory': 'Q1084'})
+    template = templates_without_redirects['english-noun']
+    lexemes = [
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', str(index)), ('form_representation', str(index) + 's')])
+        for index in range(5)
+    ]
+    lexemes.append(werkzeug.datastructures.ImmutableMultiDict([('lexeme_id', 'L123'), ('form_representation', 'x'), ('form_representation', 'xs')]))
+    with lexeme_forms.app.test_request_context():
+        results = lexeme_forms.process_bulk_lexemes(template, lexemes, werkzeug.datastructures.ImmutableMultiDict())
+    assert len(results) == 6
+    assert results[2] == {'duplicates': ['duplicate'], 'form_representations': ['2', '2s']}
+    for index in [0, 1, 3, 4]:
+        assert results[index]['lexeme_data']['lemmas'] == {'en': {'language': 'en', 'value': str(index)}}
+    assert results[5]['lexeme_data']['id'] == 'L123'
+
+
+def test_process_bulk_job(monkeypatch, tmp_path):
+    def find_duplicates(template, form_data):
+        if form_data.getlist('form_representation')[0] == 'error':
+            flask.abort(400)
+        return []
+    monkeypatch.setattr(lexeme_forms, 'find_duplicates', find_duplicates)
+    store = bulk_jobs.BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', None, [
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun'), ('form_representation', 'nouns')]),
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'error'), ('form_representation', 'errors')]),
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'thing'), ('form_representation', 'things')]),
+    ])
+    job = store.claim_job()
+    lexeme_forms.process_bulk_job(store, job)
+    job = store.get_job(job_id)
+    assert job['status'] == 'done'
+    results = store.get_results(job_id)
+    assert len(results) == 3
+    assert results[0]['lexeme_data']['lemmas'] == {'en': {'language': 'en', 'value': 'noun'}}
+    assert 'error' in results[1]
+    assert results[1]['form_representations'] == ['error', 'errors']
+    assert results[2]['lexeme_data']['lemmas'] == {'en': {'language': 'en', 'value': 'thing'}}
+
+
+def test_process_bulk_job_with_access_token(monkeypatch, tmp_path):
+    sessions = {}
+
+    def access_token_session(host, access_token):
+        return sessions.setdefault((host, access_token), FakeEditSession())
+    monkeypatch.setitem(lexeme_forms.app.config, 'OAUTH', {})
+    monkeypatch.setitem(lexeme_forms.app.config, 'BULK', {'edits_per_minute': 60000})
+    monkeypatch.setattr(lexeme_forms, 'find_duplicates', lambda template, form_data: [])
+    monkeypatch.setattr(lexeme_forms, 'access_token_session', access_token_session)
+    store = bulk_jobs.BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', 'token', [
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun'), ('form_representation', 'nouns')]),
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'thing'), ('form_representation', 'things')]),
+    ])
+    job = store.claim_job()
+    lexeme_forms.csrf_tokens_cache.clear()
+    assert not flask.has_request_context()
+    lexeme_forms.process_bulk_job(store, job)
+    lexeme_forms.csrf_tokens_cache.clear()
+    assert list(sessions) == [('https://www.wikidata.org', 'token')]
+    assert sessions['https://www.wikidata.org', 'token'].edit_tokens == ['token1', 'token1']
+    assert [result['lexeme_id'] for result in store.get_results(job_id)] == ['L1', 'L2']
+    assert store.get_job(job_id)['access_token'] is None
+
+def test_process_bulk_job_same_lemma_twice(monkeypatch, tmp_path):
+    session = FakeEditSession()
+    monkeypatch.setitem(lexeme_forms.app.config, 'OAUTH', {})
+    monkeypatch.setitem(lexeme_forms.app.config, 'BULK', {'edits_per_minute': 60000})
+    monkeypatch.setattr(lexeme_forms, 'find_duplicates', lambda template, form_data: [])  # as prefetched before either line was created
+    monkeypatch.setattr(lexeme_forms, 'access_token_session', lambda host, access_token: session)
+    store = bulk_jobs.BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', 'token', [
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun'), ('form_representation', 'nouns')]),
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun'), ('form_representation', 'nouns')]),
+    ])
+    lexeme_forms.csrf_tokens_cache.clear()
+    lexeme_forms.process_bulk_job(store, store.claim_job())
+    lexeme_forms.csrf_tokens_cache.clear()
+    results = store.get_results(job_id)
+    assert results[0]['lexeme_id'] == 'L1'
+    assert results[1] == {
+        'duplicates': [{
+            'id': 'L1',
+            'uri': results[0]['lexeme_uri'],
+            'label': 'noun',
+            'description': templates_without_redirects['english-noun']['label'],
+            'forms_count': '2',
+            'senses_count': '0',
+        }],
+        'form_representations': ['noun', 'nouns'],
+    }
+    assert len(session.edit_tokens) == 1  # only one lexeme was created
+
+def test_bulk_job_api(monkeypatch, tmp_path):
+    store = bulk_jobs.BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(lexeme_forms, 'bulk_job_store', store)
+    job_id = store.create_job('english-noun', 'summary', None, [
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'noun'), ('form_representation', 'nouns')]),
+        werkzeug.datastructures.ImmutableMultiDict([('form_representation', 'thing'), ('form_representation', 'things')]),
+    ])
+    store.set_result(job_id, 0, {'lexeme_data': {'lemmas': {'en': {'language': 'en', 'value': 'noun'}}}, 'lexeme_id': 'L1', 'lexeme_uri': 'https://www.wikidata.org/entity/L1'})
+    with lexeme_forms.app.test_client() as client:
+        response = client.get(f'/template/english-noun/bulk/job/{job_id}')
+        assert response.status_code == 200
+        assert 'https://www.wikidata.org/entity/L1' in response.get_data(as_text=True)
+        assert 'bulk-job-running' in response.get_data(as_text=True)
+
+        response = client.get(f'/api/v1/bulk_job/{job_id}?offset=1')
+        assert not response.json['done']
+        assert response.json['num_results'] == 0
+
+        store.set_result(job_id, 1, {'error': 'some <error>', 'form_representations': ['thing', 'things']})
+        store.finish_job(job_id)
+        response = client.get(f'/api/v1/bulk_job/{job_id}?offset=1')
+        assert response.json['done']
+        assert response.json['num_results'] == 1
+        assert 'some &lt;error&gt;' in response.json['html']
+
+        response = client.get('/api/v1/bulk_job/no-such-job')
+        assert response.status_code == 404
+
+
 def test_bulk_error_no_xss(monkeypatch):
     monkeypatch.setattr(lexeme_forms, 'can_use_bulk_mode', lambda *args, **kwargs: True)
     monkeypatch.setattr(lexeme_forms, 'csrf_token_matches', lambda *args, **kwargs: True)
@@ -1419,3 +1915,184 @@ def test_index_ids_distinct():
     response_text = response.get_data(as_text=True)
 
     UniqueIdsHtmlParser().feed(response_text)
+
+def test_index_templates_list_cached(monkeypatch):
+    calls = []
+
+    def language_name_with_code(language_code):
+        calls.append(language_code)
+        return language_code
+
+    monkeypatch.setattr(lexeme_forms, 'language_name_with_code', language_name_with_code)
+    monkeypatch.setattr(lexeme_forms, 'index_templates_lists', {})
+    with lexeme_forms.app.test_client() as client:
+        first_response = client.get('/?uselang=en').get_data(as_text=True)
+        num_calls = len(calls)
+        second_response = client.get('/?uselang=en').get_data(as_text=True)
+    assert num_calls > 0
+    assert len(calls) == num_calls
+    assert first_response == second_response
+    assert '/template/english-noun/' in first_response
+    assert '/template/english-noun/bulk/' in first_response  # no OAuth configured, so bulk mode is allowed
+
+def test_index_templates_list_by_interface_language(monkeypatch):
+    monkeypatch.setattr(lexeme_forms, 'language_name_with_code', lambda language_code: language_code)
+    monkeypatch.setattr(lexeme_forms, 'index_templates_lists', {})
+    with lexeme_forms.app.test_client() as client:
+        client.get('/?uselang=en')
+        client.get('/?uselang=de')
+        client.get('/?uselang=qqx')
+    assert set(lexeme_forms.index_templates_lists) == {
+        ('en', False, True, ''),
+        ('de', False, True, ''),
+        ('en', True, True, ''),
+    }
+
+def test_warm_index_templates_lists(monkeypatch):
+    monkeypatch.setattr(lexeme_forms, 'language_name_with_code', lambda language_code: language_code)
+    monkeypatch.setattr(lexeme_forms, 'index_templates_lists', {})
+    monkeypatch.setattr(lexeme_forms.i18n, 'translations', {
+        language_code: lexeme_forms.i18n.translations[language_code]
+        for language_code in ['en', 'de']
+    })
+    lexeme_forms.warm_index_templates_lists()
+    assert set(lexeme_forms.index_templates_lists) == {
+        ('en', False, False, ''),
+        ('en', False, True, ''),
+        ('de', False, False, ''),
+        ('de', False, True, ''),
+    }
+
+class FakeWikifunctionsSession:
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, action, function_call, formatversion):
+        assert action == 'wikifunctions_run'
+        function_call = json.loads(function_call)
+        function_id = function_call['Z7K1']
+        with self.lock:
+            self.calls.append(function_id)
+        time.sleep(self.delay)
+        lemma = function_call[function_id + 'K1']
+        return {'wikifunctions_run': {'data': json.dumps({'Z1K1': 'Z22', 'Z22K1': f'{function_id}({lemma})'})}}
+
+@pytest.fixture
+def fake_wikifunctions_session(monkeypatch):
+    session = FakeWikifunctionsSession(delay=0.1)
+    monkeypatch.setattr(lexeme_forms, 'authenticated_session', lambda host: session)
+    lexeme_forms.wikifunctions_cache.clear()
+    yield session
+    lexeme_forms.wikifunctions_cache.clear()
+
+def test_wikifunctions_api(fake_wikifunctions_session):
+    template = templates_without_redirects['breton-noun-with-mutation-ktp']
+    wikifunctions = [form.get('wikifunctions', {}).get('-où') for form in template['forms']]
+    start = time.monotonic()
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où')
+    duration = time.monotonic() - start
+    assert response.status_code == 200
+    assert response.json == [
+        f'{wikifunction}(kador)' if wikifunction else None
+        for wikifunction in wikifunctions
+    ]
+    distinct_wikifunctions = {wikifunction for wikifunction in wikifunctions if wikifunction}
+    assert sorted(fake_wikifunctions_session.calls) == sorted(distinct_wikifunctions)
+    assert duration < 0.1 * len(distinct_wikifunctions)  # concurrently, not one after the other
+
+def test_wikifunctions_api_cached(fake_wikifunctions_session):
+    with lexeme_forms.app.test_client() as client:
+        first_response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où')
+        num_calls = len(fake_wikifunctions_session.calls)
+        second_response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où')
+    assert first_response.json == second_response.json
+    assert len(fake_wikifunctions_session.calls) == num_calls
+
+def test_wikifunctions_api_stream(fake_wikifunctions_session):
+    template = templates_without_redirects['breton-noun-with-mutation-ktp']
+    wikifunctions = [form.get('wikifunctions', {}).get('-où') for form in template['forms']]
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où?stream=1')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(lines, key=lambda line: line['form_index']) == [
+        {'form_index': form_index, 'value': f'{wikifunction}(kador)'}
+        for form_index, wikifunction in enumerate(wikifunctions)
+        if wikifunction
+    ]
+
+def test_wikifunctions_api_stream_error(fake_wikifunctions_session, monkeypatch):
+    def get(action, function_call, formatversion):
+        raise mwapi.errors.APIError('wikilambda-functioncall-error', 'error', None)
+    monkeypatch.setattr(fake_wikifunctions_session, 'get', get)
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où?stream=1')
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines
+    assert all('error' in line and 'value' not in line for line in lines)
+
+def test_templates_precompiled():
+    loaded_templates = {template.name for template in lexeme_forms.app.jinja_env.cache.values()}
+    assert set(lexeme_forms.app.jinja_env.list_templates()) <= loaded_templates
+    assert isinstance(lexeme_forms.app.jinja_env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+
+def test_wikifunctions_api_token_refreshed_in_thread(fake_wikifunctions_session, monkeypatch):
+    get = fake_wikifunctions_session.get
+
+    def get_with_token_update(*args, **kwargs):
+        # like the token_updater of an OAuth session whose token expired
+        flask.session['oauth_access_token'] = {'access_token': 'refreshed'}
+        return get(*args, **kwargs)
+    monkeypatch.setattr(fake_wikifunctions_session, 'get', get_with_token_update)
+    with lexeme_forms.app.test_client() as client:
+        response = client.get('/api/v1/wikifunctions/breton-noun-with-mutation-ktp/kador/-où')
+        assert response.status_code == 200
+        with client.session_transaction() as session:
+            assert session['oauth_access_token'] == {'access_token': 'refreshed'}
+
+class FakeOAuth2Session:
+
+    auto_refresh_url = 'https://meta.wikimedia.org/w/rest.php/oauth2/access_token'
+    auto_refresh_kwargs = {'client_id': 'id', 'client_secret': 'secret'}
+
+    def __init__(self, oauth):
+        self.oauth = oauth
+        self.refresh_calls = []
+
+    def refresh_token(self, token_url, **kwargs):
+        self.refresh_calls.append((token_url, kwargs))
+        return {'access_token': 'refreshed', 'expires_at': time.time() + 4 * 60 * 60}
+
+    def token_updater(self, token):
+        self.oauth.access_token = token
+
+class FakeExpiringOAuth:
+
+    def __init__(self, expires_at):
+        self.access_token = {'access_token': 'token', 'expires_at': expires_at}
+        self.session = FakeOAuth2Session(self)
+
+    def get_access_token(self):
+        return self.access_token
+
+    def oauth2_session(self):
+        return self.session
+
+@pytest.mark.parametrize('expires_in, refreshed', [
+    (-60, True),
+    (60, True),
+    (60 * 60, False),
+])
+def test_refresh_access_token_if_expiring(monkeypatch, expires_in, refreshed):
+    oauth = FakeExpiringOAuth(time.time() + expires_in)
+    monkeypatch.setitem(lexeme_forms.app.config, 'OAUTH', {})
+    monkeypatch.setattr(lexeme_forms, 'oauth', oauth, raising=False)
+    lexeme_forms.refresh_access_token_if_expiring()
+    assert bool(oauth.session.refresh_calls) == refreshed
+    assert (oauth.access_token['access_token'] == 'refreshed') == refreshed
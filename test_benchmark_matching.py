@@ -0,0 +1,26 @@
+import benchmark_matching
+
+
+def test_samples_match_their_templates():
+    for template_name, lexeme_data in benchmark_matching.load_samples().items():
+        template = benchmark_matching.templates_without_redirects[template_name]
+        match = benchmark_matching.match_template_to_lexeme_data(template, lexeme_data)
+        assert match['language'] and match['lexical_category'], template_name
+        assert not match['conflicting_statements'], template_name
+
+
+def test_irregular_samples_have_ambiguous_and_unmatched_forms():
+    ambiguous_lexeme_forms = 0
+    for template_name, lexeme_data in benchmark_matching.load_samples().items():
+        template = benchmark_matching.templates_without_redirects[template_name]
+        matched_template = benchmark_matching.match_lexeme_forms_to_template(benchmark_matching.irregular_sample(lexeme_data)['forms'], template)
+        assert matched_template.get('unmatched_lexeme_forms'), template_name
+        ambiguous_lexeme_forms += len(matched_template.get('ambiguous_lexeme_forms', []))
+    assert ambiguous_lexeme_forms
+
+
+def test_benchmarks_run():
+    functions = benchmark_matching.benchmarks(benchmark_matching.load_samples())
+    assert functions
+    for function in functions.values():
+        function()
@@ -0,0 +1,20 @@
+import benchmark_render
+
+
+def test_server_timing_duration():
+    server_timing = 'mwapi-query;dur=12.5;desc="2x", render-template.html;dur=3.0;desc="1x", total;dur=20.0'
+    assert benchmark_render.server_timing_duration(server_timing, 'render-template.html') == 0.003
+    assert benchmark_render.server_timing_duration(server_timing, 'total') == 0.02
+    assert benchmark_render.server_timing_duration(server_timing, 'render-edit.html') is None
+
+
+def test_measure_page():
+    template_name = benchmark_render.largest_template_name()
+    render_durations, total_durations = benchmark_render.measure_page(f'/template/{template_name}/bulk/', 'bulk.html', 2)
+    assert len(render_durations) == len(total_durations) == 2
+    assert all(render < total for render, total in zip(render_durations, total_durations))
+
+
+def test_measure_compile():
+    source_durations, bytecode_durations = benchmark_render.measure_compile(1)
+    assert len(source_durations) == len(bytecode_durations) == 1
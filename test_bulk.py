@@ -0,0 +1,57 @@
+import concurrent.futures
+
+import pytest
+
+from bulk import RateLimiter, prefetch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    rate_limiter = RateLimiter(per_minute=30, clock=clock, sleep=clock.sleep)
+    rate_limiter.wait()
+    rate_limiter.wait()
+    clock.now += 1
+    rate_limiter.wait()
+    assert clock.sleeps == [2, 1]
+
+
+def test_rate_limiter_unlimited():
+    clock = FakeClock()
+    rate_limiter = RateLimiter(per_minute=0, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        rate_limiter.wait()
+    assert clock.sleeps == []
+
+
+def test_prefetch_order():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = prefetch(executor, lambda item: item * 2, [1, None, 3, 4])
+        results = [future.result() if future is not None else None for future in futures]
+    assert results == [2, None, 6, 8]
+
+
+def test_prefetch_error_deferred():
+    def fetch(item):
+        if item == 2:
+            raise ValueError(item)
+        return item
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = prefetch(executor, fetch, [1, 2, 3])
+        assert futures[0].result() == 1
+        with pytest.raises(ValueError):
+            futures[1].result()
+        assert futures[2].result() == 3
@@ -0,0 +1,105 @@
+import os
+import stat
+
+import werkzeug.datastructures
+
+from bulk_jobs import BulkJobStore
+
+
+def lexeme(*form_representations):
+    return werkzeug.datastructures.ImmutableMultiDict([
+        ('form_representation', form_representation)
+        for form_representation in form_representations
+    ])
+
+
+def test_create_job(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', 'token', [lexeme('a', 'as'), lexeme('b', 'bs')])
+    job = store.get_job(job_id)
+    assert job == {
+        'id': job_id,
+        'template_name': 'english-noun',
+        'summary': 'summary',
+        'access_token': 'token',
+        'status': 'queued',
+        'num_lines': 2,
+        'num_done': 0,
+    }
+
+
+def test_get_job_missing(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    assert store.get_job('no such job') is None
+
+
+def test_claim_job(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    assert store.claim_job() is None
+    job_id_1 = store.create_job('english-noun', 'summary', None, [lexeme('a', 'as')])
+    job_id_2 = store.create_job('english-noun', 'summary', None, [lexeme('b', 'bs')])
+    job = store.claim_job()
+    assert job is not None
+    assert job['id'] == job_id_1
+    assert job['status'] == 'running'
+    job = store.claim_job()
+    assert job is not None
+    assert job['id'] == job_id_2
+    assert store.claim_job() is None
+
+
+def test_requeue_running_jobs(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', None, [lexeme('a', 'as')])
+    store.claim_job()
+    store.requeue_running_jobs()
+    job = store.claim_job()
+    assert job is not None
+    assert job['id'] == job_id
+
+
+def test_pending_lines_and_results(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', None, [lexeme('a', 'as'), lexeme('b', 'bs'), lexeme('c', 'cs')])
+    pending_lines = store.get_pending_lines(job_id)
+    assert [line_index for line_index, form_data in pending_lines] == [0, 1, 2]
+    assert pending_lines[1][1].getlist('form_representation') == ['b', 'bs']
+
+    store.set_result(job_id, 0, {'lexeme_id': 'L1'})
+    store.set_result(job_id, 1, {'lexeme_id': 'L2'})
+    assert [line_index for line_index, form_data in store.get_pending_lines(job_id)] == [2]
+    assert store.get_results(job_id) == [{'lexeme_id': 'L1'}, {'lexeme_id': 'L2'}]
+    assert store.get_results(job_id, offset=1) == [{'lexeme_id': 'L2'}]
+    assert store.get_job(job_id)['num_done'] == 2
+
+
+def test_finish_job(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', 'token', [lexeme('a', 'as')])
+    store.finish_job(job_id)
+    job = store.get_job(job_id)
+    assert job['status'] == 'done'
+    assert job['access_token'] is None
+
+
+def test_fail_job(tmp_path):
+    store = BulkJobStore(str(tmp_path / 'jobs.sqlite3'))
+    job_id = store.create_job('english-noun', 'summary', 'token', [lexeme('a', 'as'), lexeme('b', 'bs')])
+    store.set_result(job_id, 0, {'lexeme_id': 'L1'})
+    store.fail_job(job_id, 'some error')
+    job = store.get_job(job_id)
+    assert job['status'] == 'done'
+    assert job['access_token'] is None
+    assert store.get_results(job_id) == [
+        {'lexeme_id': 'L1'},
+        {'error': 'some error', 'form_representations': ['b', 'bs']},
+    ]
+
+
+def test_database_only_readable_by_owner(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    store = BulkJobStore(path)
+    store.create_job('english-noun', 'summary', 'token', [lexeme('a', 'as')])
+    for suffix in ['', '-wal', '-shm']:
+        if os.path.exists(path + suffix):
+            assert stat.S_IMODE(os.stat(path + suffix).st_mode) == 0o600, suffix
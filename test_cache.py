@@ -0,0 +1,156 @@
+import threading
+
+import pytest
+
+from cache import SizedLruCache, TtlCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_set():
+    cache = TtlCache(maxsize=10, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_expiry():
+    clock = FakeClock()
+    cache = TtlCache(maxsize=10, ttl=60, clock=clock)
+    cache.set('a', 1)
+    clock.now = 59
+    assert cache.get('a') == 1
+    clock.now = 60
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TtlCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')  # a is now more recently used than b
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_pop():
+    cache = TtlCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.pop('a')
+    cache.pop('b')
+    assert cache.get('a') is None
+
+
+def test_get_or_compute():
+    cache = TtlCache(maxsize=10, ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(True)
+        return 'value'
+
+    assert cache.get_or_compute('a', compute) == 'value'
+    assert cache.get_or_compute('a', compute) == 'value'
+    assert len(calls) == 1
+
+
+def test_get_or_compute_error_not_cached():
+    cache = TtlCache(maxsize=10, ttl=60)
+
+    def compute():
+        raise ValueError('error')
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute('a', compute)
+    assert cache.get_or_compute('a', lambda: 'value') == 'value'
+
+
+def test_get_or_compute_coalesces_concurrent_lookups():
+    cache = TtlCache(maxsize=10, ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(True)
+        started.set()
+        release.wait()
+        return 'value'
+
+    def lookup():
+        results.append(cache.get_or_compute('a', compute))
+
+    owner = threading.Thread(target=lookup)
+    owner.start()
+    started.wait()
+    waiters = [threading.Thread(target=lookup) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    release.set()
+    owner.join()
+    for waiter in waiters:
+        waiter.join()
+
+    assert len(calls) == 1
+    assert results == ['value'] * 6
+
+
+def test_pop_during_compute_not_cached():
+    cache = TtlCache(maxsize=10, ttl=60)
+
+    def compute():
+        cache.pop('a')
+        return 'stale value'
+
+    assert cache.get_or_compute('a', compute) == 'stale value'
+    assert cache.get('a') is None
+
+
+def test_sized_lru_get_set():
+    cache = SizedLruCache(max_size=100)
+    assert cache.get('a') is None
+    cache.set('a', 'abc')
+    assert cache.get('a') == 'abc'
+    assert cache.size == 3
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_sized_lru_evicts_least_recently_used():
+    cache = SizedLruCache(max_size=10)
+    cache.set('a', 'aaaa')
+    cache.set('b', 'bbbb')
+    cache.get('a')
+    cache.set('c', 'cccc')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
+    assert cache.get('c') == 'cccc'
+    assert cache.size == 8
+
+
+def test_sized_lru_replace():
+    cache = SizedLruCache(max_size=10)
+    cache.set('a', 'aaaa')
+    cache.set('a', 'aa')
+    assert cache.size == 2
+    assert len(cache) == 1
+
+
+def test_sized_lru_too_large():
+    cache = SizedLruCache(max_size=10)
+    cache.set('a', 'aaaa')
+    cache.set('b', 'b' * 11)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
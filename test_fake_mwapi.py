@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+import fake_mwapi
+
+
+@pytest.fixture
+def client():
+    return fake_mwapi.create_app().test_client()
+
+
+def test_wbgetentities(client):
+    response = client.get('/www.wikidata.org/w/api.php', query_string={
+        'action': 'wbgetentities',
+        'ids': 'L900000006|L1|Q1084',
+        'languages': 'en',
+        'format': 'json',
+    })
+    entities = response.json['entities']
+    assert entities['L900000006']['lemmas']['en']['value'] == 'dog'
+    assert 'missing' in entities['L1']
+    assert entities['Q1084']['labels']['en']['value'] == 'Q1084 (en)'
+
+
+def test_entity_data(client):
+    response = client.get('/www.wikidata.org/wiki/Special:EntityData/L900000006.json?revision=2300000006')
+    assert response.json['entities']['L900000006']['lastrevid'] == 2300000006
+    assert client.get('/www.wikidata.org/wiki/Special:EntityData/L1.json').status_code == 404
+
+
+def test_wbsearchentities(client):
+    response = client.get('/www.wikidata.org/w/api.php', query_string={
+        'action': 'wbsearchentities',
+        'search': 'dog',
+        'language': 'en',
+        'type': 'lexeme',
+    })
+    results = response.json['search']
+    assert results[0]['id'] == 'L900000006'
+    assert all(result['label'] == 'dog' for result in results)
+    assert results == client.get('/www.wikidata.org/w/api.php', query_string={
+        'action': 'wbsearchentities',
+        'search': 'dog',
+        'language': 'en',
+        'type': 'lexeme',
+    }).json['search']
+
+
+def test_query_pageprops(client):
+    response = client.get('/www.wikidata.org/w/api.php', query_string={
+        'action': 'query',
+        'titles': 'Lexeme:L900000006',
+        'prop': 'pageprops',
+        'ppprop': 'wbl-forms|wbl-senses',
+    })
+    [page] = response.json['query']['pages'].values()
+    assert page['title'] == 'Lexeme:L900000006'
+    assert page['pageprops']['wbl-forms'] == '2'
+
+
+def test_query_revisions(client):
+    response = client.get('/www.wikifunctions.org/w/api.php', query_string={
+        'action': 'query',
+        'titles': 'User:Fake user/wikidata-lexeme-forms-opt-into-wikifunctions.js',
+        'prop': 'revisions',
+        'formatversion': '2',
+    })
+    [page] = response.json['query']['pages']
+    assert page['missing'] is True
+
+
+def test_query_userinfo_and_tokens(client):
+    response = client.get('/www.wikidata.org/w/api.php', query_string={
+        'action': 'query',
+        'meta': 'userinfo|tokens',
+    })
+    query = response.json['query']
+    assert 'autoconfirmed' in query['userinfo']['groups']
+    assert query['tokens']['csrftoken'] == fake_mwapi.csrf_token
+
+
+def test_wbeditentity(client):
+    response = client.post('/www.wikidata.org/w/api.php', data={
+        'action': 'wbeditentity',
+        'new': 'lexeme',
+        'data': json.dumps({'lemmas': {'en': {'language': 'en', 'value': 'cat'}}}),
+        'token': fake_mwapi.csrf_token,
+    })
+    entity = response.json['entity']
+    assert entity['id'].startswith('L')
+    assert entity['lemmas']['en']['value'] == 'cat'
+
+
+def test_wbeditentity_badtoken(client):
+    response = client.post('/www.wikidata.org/w/api.php', data={
+        'action': 'wbeditentity',
+        'id': 'L900000006',
+        'data': '{}',
+        'token': '+\\',
+    })
+    assert response.json['error']['code'] == 'badtoken'
+
+
+def test_wikifunctions_run(client):
+    response = client.get('/www.wikifunctions.org/w/api.php', query_string={
+        'action': 'wikifunctions_run',
+        'function_call': json.dumps({'Z1K1': 'Z7', 'Z7K1': 'Z12345', 'Z12345K1': 'dog'}),
+    })
+    assert json.loads(response.json['wikifunctions_run']['data'])['Z22K1'] == 'dog'
+
+
+def test_error_rate():
+    client = fake_mwapi.create_app(error_rate=1).test_client()
+    response = client.get('/www.wikidata.org/w/api.php', query_string={'action': 'query', 'meta': 'tokens'})
+    assert response.json['error']['code'] == 'internal_api_error_DBQueryError'
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+from item_labels import ItemLabelCache
+
+class FakeLabelsSession:
+
+    def __init__(self, delay=0, missing=frozenset()):
+        self.delay = delay
+        self.missing = missing
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+        time.sleep(self.delay)
+        return {'entities': {
+            item_id: {
+                'id': item_id,
+                'labels': {language: {'language': language, 'value': f'{item_id} in {language}'} for language in kwargs['languages']},
+            } if item_id not in self.missing else {
+                'id': item_id,
+                'labels': {},
+            }
+            for item_id in kwargs['ids']
+        }}
+
+def test_labels_cached():
+    session = FakeLabelsSession()
+    cache = ItemLabelCache()
+    assert cache.labels('www', ['Q110786', 'Q146786'], 'en', session=session) == {
+        'Q110786': {'language': 'en', 'value': 'Q110786 in en'},
+        'Q146786': {'language': 'en', 'value': 'Q146786 in en'},
+    }
+    assert cache.labels('www', ['Q110786'], 'en', session=session) == {
+        'Q110786': {'language': 'en', 'value': 'Q110786 in en'},
+    }
+    assert len(session.calls) == 1
+
+def test_labels_by_wiki_and_language():
+    session = FakeLabelsSession()
+    cache = ItemLabelCache()
+    cache.labels('www', ['Q1'], 'en', session=session)
+    cache.labels('www', ['Q1'], 'de', session=session)
+    cache.labels('test', ['Q1'], 'en', session=session)
+    assert len(session.calls) == 3
+
+def test_labels_missing_cached():
+    session = FakeLabelsSession(missing={'Q2'})
+    cache = ItemLabelCache()
+    assert cache.labels('www', ['Q1', 'Q2'], 'en', session=session)['Q2'] is None
+    assert cache.labels('www', ['Q2'], 'en', session=session) == {'Q2': None}
+    assert len(session.calls) == 1
+
+def test_labels_api_language():
+    session = FakeLabelsSession()
+    cache = ItemLabelCache()
+    cache.labels('www', ['Q1'], 'bn-x-Q6747180', api_language='bn', session=session)
+    assert session.calls[0]['languages'] == ['bn']
+
+def test_labels_stale_refreshed_in_background(monkeypatch):
+    now = [0.0]
+    session = FakeLabelsSession()
+    cache = ItemLabelCache(ttl=10, clock=lambda: now[0])
+    cache.labels('www', ['Q1'], 'en', session=session)
+    refreshed = threading.Event()
+    monkeypatch.setattr(cache, '_refresh_stale', refreshed.set)
+    now[0] = 20
+    assert cache.labels('www', ['Q1'], 'en', session=session) == {
+        'Q1': {'language': 'en', 'value': 'Q1 in en'},  # the stale label is still returned
+    }
+    assert len(session.calls) == 1
+    assert refreshed.wait(timeout=5)
+
+def test_labels_chunks_concurrent():
+    session = FakeLabelsSession(delay=0.1)
+    cache = ItemLabelCache(concurrency=4)
+    item_ids = [f'Q{i}' for i in range(1, 151)]
+    start = time.monotonic()
+    labels = cache.labels('www', item_ids, 'en', session=session)
+    duration = time.monotonic() - start
+    assert sorted(len(call['ids']) for call in session.calls) == [50, 50, 50]
+    assert labels['Q150'] == {'language': 'en', 'value': 'Q150 in en'}
+    assert duration < 0.1 * 3  # concurrently, not one after the other
+
+def test_prefetch_persisted(tmp_path):
+    path = str(tmp_path / 'labels.json')
+    session = FakeLabelsSession(missing={'Q2'})
+    ItemLabelCache(path=path).prefetch('www', {'en': ['Q1', 'Q2'], 'de': ['Q1']}, session=session)
+    assert len(session.calls) == 1  # both languages in one request
+    cache = ItemLabelCache(path=path)
+    cache.prefetch('www', {'en': ['Q1', 'Q2'], 'de': ['Q1']}, session=session)
+    assert len(session.calls) == 1
+    assert cache.labels('www', ['Q1', 'Q2'], 'en', session=session) == {
+        'Q1': {'language': 'en', 'value': 'Q1 in en'},
+        'Q2': None,
+    }
+    assert len(session.calls) == 1
+
+def test_labels_saved_in_background(tmp_path):
+    path = tmp_path / 'labels.json'
+    cache = ItemLabelCache(path=str(path), save_delay=0.1)
+    cache.labels('www', ['Q1'], 'en', session=FakeLabelsSession())
+    assert not path.exists()  # not saved during the request
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    cache = ItemLabelCache(path=str(path))
+    cache.load()
+    assert cache.labels('www', ['Q1'], 'en', session=FakeLabelsSession(missing={'Q1'})) == {
+        'Q1': {'language': 'en', 'value': 'Q1 in en'},
+    }
+
+def test_save_merges_other_processes_entries(tmp_path):
+    path = str(tmp_path / 'labels.json')
+    session = FakeLabelsSession()
+    cache1 = ItemLabelCache(path=path)
+    cache2 = ItemLabelCache(path=path)
+    cache1.fetch('www', {'en': ['Q1']}, session=session)
+    cache2.fetch('www', {'en': ['Q2']}, session=session)
+    cache1.save()
+    cache2.save()
+    cache3 = ItemLabelCache(path=path)
+    cache3.load()
+    assert not cache3.is_stale('www', 'Q1', 'en')
+    assert not cache3.is_stale('www', 'Q2', 'en')
+
+def test_fetch_mixed_languages_chunked():
+    session = FakeLabelsSession()
+    cache = ItemLabelCache()
+    cache.fetch('www', {'en': [f'Q{i}' for i in range(1, 121)], 'de': ['Q1']}, session=session)
+    assert [len(call['ids']) for call in session.calls] == [50, 50, 21]
+    assert session.calls[2]['languages'] == ['en', 'de']
+
+def test_prefetch_error_logged(caplog):
+    class ErrorSession:
+        def get(self, **kwargs):
+            raise ConnectionError('no network')
+    cache = ItemLabelCache()
+    cache.prefetch('www', {'en': ['Q1']}, session=ErrorSession())
+    assert 'Could not prefetch labels' in caplog.text
+    assert cache.is_stale('www', 'Q1', 'en')
+
+def test_threads_reset_after_fork():
+    cache = ItemLabelCache()
+    cache._refreshing = True
+    cache._save_scheduled = True
+    with cache._lock:  # as if a background thread held the lock while forking
+        pid = os.fork()
+        if pid == 0:
+            reset = not cache._refreshing and not cache._save_scheduled and cache._lock.acquire(blocking=False)
+            os._exit(0 if reset else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert cache._refreshing and cache._save_scheduled  # unchanged in the parent
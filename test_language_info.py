@@ -1,7 +1,8 @@
 import pytest
+import threading
 from typing import Optional
 
-from language_info import label
+from language_info import LabelCache, label
 
 @pytest.mark.parametrize('code, expected', [
     ('bn-x-Q6747180', 'মানভূমী বাংলা'),
@@ -17,3 +18,67 @@ from language_info import label
 ])
 def test_label(code: str, expected: Optional[str]):
     assert label(code) == expected
+
+class FakeLabelsSession:
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'entities': {
+            item_id: {
+                'id': item_id,
+                'labels': {language: {'language': language, 'value': f'{item_id} in {language}'} for language in kwargs['languages']},
+            }
+            for item_id in kwargs['ids']
+        }}
+
+def test_prefetch_chunks():
+    session = FakeLabelsSession()
+    cache = LabelCache()
+    codes = [f'en-x-Q{i}' for i in range(1, 121)] + ['de-x-Q1', 'en', 'en-x-Q1']
+    cache.prefetch(codes, session=session)
+    assert [len(call['ids']) for call in session.calls] == [50, 50, 21]
+    assert cache.label('en-x-Q7') == 'Q7 in en'
+    assert cache.label('de-x-Q1') == 'Q1 in de'
+    assert cache.label('en') is None
+    assert len(session.calls) == 3
+
+def test_persisted(tmp_path):
+    path = str(tmp_path / 'labels.json')
+    session = FakeLabelsSession()
+    LabelCache(path=path).prefetch(['en-x-Q1'], session=session)
+    cache = LabelCache(path=path)
+    cache.prefetch(['en-x-Q1'], session=session)
+    assert len(session.calls) == 1
+    assert cache.label('en-x-Q1') == 'Q1 in en'
+
+def test_stale_prefetched(tmp_path):
+    path = str(tmp_path / 'labels.json')
+    now = [0.0]
+    session = FakeLabelsSession()
+    LabelCache(path=path, ttl=10, clock=lambda: now[0]).prefetch(['en-x-Q1'], session=session)
+    now[0] = 20
+    LabelCache(path=path, ttl=10, clock=lambda: now[0]).prefetch(['en-x-Q1'], session=session)
+    assert len(session.calls) == 2
+
+def test_stale_refreshed_in_background(monkeypatch):
+    now = [0.0]
+    cache = LabelCache(ttl=10, clock=lambda: now[0])
+    cache.prefetch(['en-x-Q1'], session=FakeLabelsSession())
+    refreshed = threading.Event()
+    monkeypatch.setattr(cache.items, '_refresh_stale', refreshed.set)
+    assert cache.label('en-x-Q1') == 'Q1 in en'
+    assert not refreshed.is_set()
+    now[0] = 20
+    assert cache.label('en-x-Q1') == 'Q1 in en'  # the stale label is still returned
+    assert refreshed.wait(timeout=5)
+
+def test_load(tmp_path):
+    path = str(tmp_path / 'labels.json')
+    LabelCache(path=path).prefetch(['en-x-Q1'], session=FakeLabelsSession())
+    cache = LabelCache(path=path)
+    cache.load()
+    assert not cache.items.is_stale('www', 'Q1', 'en')
+    assert cache.label('en-x-Q1') == 'Q1 in en'
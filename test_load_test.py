@@ -0,0 +1,31 @@
+import pytest
+
+from load_test import form_inputs, percentile
+
+
+@pytest.mark.parametrize('p, expected', [
+    (50, 5),
+    (95, 10),
+    (99, 10),
+    (1, 1),
+])
+def test_percentile(p, expected):
+    assert percentile([float(value) for value in range(1, 11)], p) == expected
+
+
+def test_form_inputs():
+    page = '''
+    <input name="outside">
+    <form method="post">
+      <input name="_csrf_token" type="hidden" value="abc">
+      <input name="form_representation" value="dog">
+      <input name="form_representation">
+      <input type="checkbox" name="no_duplicate">
+    </form>
+    <form><input name="second_form" value="x"></form>
+    '''
+    assert form_inputs(page) == [
+        ('_csrf_token', 'abc'),
+        ('form_representation', 'dog'),
+        ('form_representation', ''),
+    ]
@@ -1,3 +1,5 @@
+import pytest
+
 import matching
 import templates
 
@@ -94,6 +96,38 @@ def test_properties_exclusive_covers_template_claims_properties():
     assert not missing_property_ids
 
 
+def test_statement_key():
+    assert matching.statement_key('P1', templates.statement('P1', 'Q1')) == ('P1', 'value', 'Q1')
+    assert matching.statement_key('P1', templates.statement('P1', 'novalue')) == ('P1', 'novalue', None)
+    assert matching.statement_key('P1', templates.statement('P1', 'somevalue')) == ('P1', 'somevalue', None)
+
+def test_compiled_statements_registry():
+    template = templates.templates_without_redirects['german-noun-feminine']
+    compiled = matching.template_entity_compiled_statements(False, template)
+    assert compiled is matching.compiled_statements[(id(template['statements']), False)][1]
+    keyed_statements, keys, exclusive_properties = compiled
+    assert keys == {('P5185', 'value', 'Q1775415')}
+    assert exclusive_properties == {'P5185'}
+
+def test_match_template_entity_to_lexeme_entity_same_objects():
+    template_statement = templates.statement('P5185', 'Q1775415')
+    matching_statement = {**templates.statement('P5185', 'Q1775415'), 'id': 'L1$1'}
+    duplicate_statement = {**templates.statement('P5185', 'Q1775415'), 'id': 'L1$2'}
+    other_statement = {**templates.statement('P5185', 'Q1775461'), 'id': 'L1$3'}
+    template_entity = {'statements': {'P5185': [template_statement]}}
+    lexeme_entity = {'claims': {'P5185': [matching_statement, duplicate_statement, other_statement]}}
+    matched, missing, conflicting = matching.match_template_entity_to_lexeme_entity(False, template_entity, lexeme_entity)
+    assert matched['P5185'][0] is matching_statement
+    assert missing == {}
+    # only the first matching statement is matched, other statements for an exclusive property conflict
+    assert [statement['id'] for statement in conflicting['P5185']] == ['L1$2', 'L1$3']
+    assert matching.match_template_entity_to_lexeme_entity(
+        False,
+        template_entity,
+        lexeme_entity,
+        matching.normalize_lexeme_statements(lexeme_entity),
+    ) == (matched, missing, conflicting)
+
 def test_match_lexeme_forms_to_template():
     singular_lexeme_form = {'id': 'singular', 'grammaticalFeatures': ['Q1']}
     plural_lexeme_form_1 = {'id': 'plural', 'grammaticalFeatures': ['Q2']}
@@ -112,6 +146,7 @@ def test_match_lexeme_forms_to_template():
     plural_template_form = {'grammatical_features_item_ids': ['Q2']}
     template = {'forms': [singular_template_form, plural_template_form]}
 
+    template_forms = template['forms']
     template = matching.match_lexeme_forms_to_template(lexeme_forms, template)
 
     # original not modified
@@ -121,6 +156,7 @@ def test_match_lexeme_forms_to_template():
     plural_template_form = template['forms'][1]
 
     # modified copy has expected data
+    assert singular_template_form['grammatical_features_item_ids'] is template_forms[0]['grammatical_features_item_ids']
     assert singular_template_form['lexeme_forms'] == [singular_lexeme_form]
     assert plural_template_form['lexeme_forms'] == [plural_lexeme_form_1, plural_lexeme_form_2]
     assert template['ambiguous_lexeme_forms'] == [singular_plural_lexeme_form]
@@ -237,6 +273,49 @@ def test_match_lexeme_form_to_template_forms_optional_grammatical_feature():
     best_template_forms = matching.match_lexeme_form_to_template_forms(False, lexeme_form, template_forms)
     assert best_template_forms == [template_form_optional_feature_present]
 
+def test_template_form_features():
+    template_form = {
+        'grammatical_features_item_ids': ['Q1', 'Q2'],
+        'grammatical_features_item_ids_optional': set(['Q2']),
+    }
+    features, required_features = matching.template_form_features(template_form)
+    q1 = 1 << matching.grammatical_feature_bit('Q1')
+    q2 = 1 << matching.grammatical_feature_bit('Q2')
+    assert features == q1 | q2
+    assert required_features == q1
+
+def test_lexeme_form_features_ignores_unknown_features():
+    matching.template_form_features({'grammatical_features_item_ids': ['Q1']})
+    assert 'Q123456789' not in matching.grammatical_feature_bits
+    features = matching.lexeme_form_features({'grammaticalFeatures': ['Q1', 'Q123456789']})
+    assert features == 1 << matching.grammatical_feature_bit('Q1')
+
+@pytest.mark.parametrize('template_name', ['english-noun', 'german-verb', 'czech-adjective'])
+def test_match_lexeme_forms_to_template_precomputed_features(template_name):
+    template = templates.templates_without_redirects[template_name]
+    lexeme_forms = [
+        {'id': f'F{index}', 'grammaticalFeatures': template_form['grammatical_features_item_ids'][:-1 if index % 3 == 0 else None]}
+        for index, template_form in enumerate(template['forms'])
+    ]
+    anonymous_template = {**template}
+    del anonymous_template['@template_name']
+    assert matching.template_forms_features(template) is matching.templates_forms_features[id(template)][1]
+    assert matching.match_lexeme_forms_to_template(lexeme_forms, template) == {
+        **matching.match_lexeme_forms_to_template(lexeme_forms, anonymous_template),
+        '@template_name': template_name,
+    }
+
+def test_template_forms_features_derived_template():
+    template = templates.templates_without_redirects['english-noun']
+    derived_template = {
+        **template,
+        'forms': [{**template_form, 'grammatical_features_item_ids': ['Q1']} for template_form in template['forms']],
+    }
+    assert derived_template['@template_name'] == template['@template_name']
+    assert len(derived_template['forms']) == len(template['forms'])
+    features = 1 << matching.grammatical_feature_bit('Q1')
+    assert matching.template_forms_features(derived_template) == [(features, features)] * len(template['forms'])
+
 def test_match_lexeme_form_to_template_forms_one_featureless_form():
     lexeme_form = {'id': 'L1-F1'}
     template_forms = [{'grammatical_features_item_ids': []}]
@@ -376,3 +455,21 @@ def test_match_lexeme_form_to_template_form_optional_feature_present():
         'grammatical_features_item_ids_optional': set(['Q2'])
     }
     assert matching.match_lexeme_form_to_template_form(False, lexeme_form, template_form) == 2
+
+
+def test_template_statements_groups():
+    groups = matching.template_statements_groups
+    assert set(groups) == set(templates.templates_without_redirects)
+    assert len(set(groups.values())) < len(groups)
+    for template_name, template in templates.templates_without_redirects.items():
+        for other_template_name, other_template in templates.templates_without_redirects.items():
+            if groups[template_name] == groups[other_template_name]:
+                assert template.get('statements', {}) == other_template.get('statements', {})
+                assert ('test' in template) == ('test' in other_template)
+
+def test_match_templates_to_lexeme_data():
+    matches = matching.match_templates_to_lexeme_data(lexeme_data_german_noun_neuter)
+
+    assert list(matches.keys()) == list(templates.templates_without_redirects.keys())
+    for template_name, template in templates.templates_without_redirects.items():
+        assert matches[template_name] == matching.match_template_to_lexeme_data(template, lexeme_data_german_noun_neuter)
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import flask
+import prometheus_client
+
+from cache import TtlCache
+import metrics
+
+
+def sample_value(name, labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_cache_lookups():
+    labels_hit = {'cache': 'test_cache_lookups', 'result': 'hit'}
+    labels_miss = {'cache': 'test_cache_lookups', 'result': 'miss'}
+    cache: TtlCache[str, str] = TtlCache(maxsize=10, ttl=60, name='test_cache_lookups')
+    cache.get('a')
+    cache.set('a', 'A')
+    cache.get('a')
+    cache.get_or_compute('a', lambda: 'B')
+    assert sample_value('lexeme_forms_cache_lookups_total', labels_hit) == 2
+    assert sample_value('lexeme_forms_cache_lookups_total', labels_miss) == 1
+
+
+def test_request_metrics():
+    app = flask.Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route('/test_request_metrics/<name>')
+    def view(name):
+        return name
+
+    @app.route('/metrics')
+    def metrics_api():
+        return metrics.exposition()
+
+    client = app.test_client()
+    client.get('/test_request_metrics/a')
+    client.get('/test_request_metrics/b')
+    labels = {'route': '/test_request_metrics/<name>', 'method': 'GET'}
+    assert sample_value('lexeme_forms_requests_total', {**labels, 'status': '200'}) == 2
+    assert sample_value('lexeme_forms_request_duration_seconds_count', labels) == 2
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain')
+    assert 'lexeme_forms_requests_total{method="GET",route="/test_request_metrics/<name>",status="200"} 2.0' in response.get_data(as_text=True)
+
+
+def test_multiprocess(tmp_path):
+    env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)}
+    increment = 'import metrics; metrics.bulk_lines.labels("done").inc(3)'
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', increment], env=env, check=True)
+    expose = 'import flask, metrics\nwith flask.Flask(__name__).app_context(): print(metrics.exposition().get_data(as_text=True))'
+    output = subprocess.run([sys.executable, '-c', expose], env=env, check=True, capture_output=True, text=True).stdout
+    assert 'lexeme_forms_bulk_lines_total{result="done"} 6.0' in output
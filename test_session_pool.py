@@ -0,0 +1,105 @@
+import threading
+
+import prometheus_client
+import requests.utils
+
+from session_pool import SessionPool
+
+
+def test_session_same_host():
+    pool = SessionPool('test user agent')
+    assert pool.session('https://www.wikidata.org') is pool.session('https://www.wikidata.org')
+
+
+def test_session_different_hosts():
+    pool = SessionPool('test user agent')
+    assert pool.session('https://www.wikidata.org') is not pool.session('https://test.wikidata.org')
+
+
+def test_session_user_agent():
+    pool = SessionPool('test user agent')
+    session = pool.session('https://www.wikidata.org')
+    assert session.headers['User-Agent'] == 'test user agent'
+
+
+def test_session_default_user_agent():
+    pool = SessionPool()
+    session = pool.session('https://www.wikidata.org')
+    assert session.headers['User-Agent'] == requests.utils.default_user_agent()
+
+
+def test_session_configure_user_agent():
+    pool = SessionPool()
+    pool.configure(user_agent='configured user agent')
+    session = pool.session('https://www.wikidata.org')
+    assert session.headers['User-Agent'] == 'configured user agent'
+
+
+def test_session_pool_sizes():
+    pool = SessionPool('test user agent')
+    pool.configure(pool_connections='3', pool_maxsize=7)
+    session = pool.session('https://www.wikidata.org')
+    adapter = session.session.get_adapter('https://www.wikidata.org')
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 7
+
+
+def test_session_threads():
+    pool = SessionPool('test user agent')
+    sessions = []
+
+    def get_session():
+        sessions.append(pool.session('https://www.wikidata.org'))
+
+    threads = [threading.Thread(target=get_session) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sessions) == 10
+    assert all(session is sessions[0] for session in sessions)
+
+
+def test_stats_unused():
+    pool = SessionPool('test user agent')
+    pool.session('https://www.wikidata.org')
+    assert pool.stats() == {
+        'https://www.wikidata.org': {
+            'requests': 0,
+            'connections': 0,
+            'reused_connections': 0,
+        },
+    }
+
+
+def test_update_metrics():
+    pool = SessionPool('test user agent')
+    pool.session('https://test-update-metrics.example')
+    pool.update_metrics()
+    for name in ['requests', 'connections', 'reused_connections']:
+        assert prometheus_client.REGISTRY.get_sample_value(
+            f'lexeme_forms_mwapi_pool_{name}',
+            {'host': 'https://test-update-metrics.example'},
+        ) == 0
+
+
+def test_clear():
+    pool = SessionPool('test user agent')
+    session = pool.session('https://www.wikidata.org')
+    pool.clear()
+    assert pool.stats() == {}
+    assert pool.session('https://www.wikidata.org') is not session
+
+
+def test_session_host_override():
+    pool = SessionPool('test user agent')
+    pool.configure(host_override='http://localhost:8081/')
+    assert pool.api_host('https://www.wikidata.org') == 'http://localhost:8081/www.wikidata.org'
+    session = pool.session('https://www.wikidata.org')
+    assert session.api_url == 'http://localhost:8081/www.wikidata.org/w/api.php'
+
+
+def test_session_no_host_override():
+    pool = SessionPool('test user agent')
+    assert pool.api_host('https://www.wikidata.org') == 'https://www.wikidata.org'
@@ -1,7 +1,9 @@
+import importlib.util
 import mwapi  # type: ignore
 import pytest
 
 import app
+import compile_templates
 from language import lang_lex2int
 import templates
 from wikibase_types import Statements
@@ -122,6 +124,13 @@ def test_statements_dict():
     }
 
 
+def test_templates_read_only():
+    with pytest.raises(TypeError):
+        templates.templates['new-template'] = 'english-noun'  # type: ignore
+    with pytest.raises(TypeError):
+        del templates.templates_without_redirects['english-noun']  # type: ignore
+
+
 def test_entities_exist():
     entity_ids = set()
 
@@ -605,3 +614,15 @@ def assert_templates_match(a_template, b_template):
         assert a_form.get('grammatical_features_item_ids_optional') == b_form.get('grammatical_features_item_ids_optional')
         assert a_form.get('optional') == b_form.get('optional')
         assert a_form.get('statements') == b_form.get('statements')
+
+
+def test_compile_templates():
+    assert compile_templates.compile_templates()
+    pyc_path = importlib.util.cache_from_source(templates.__file__)
+    with open(pyc_path, 'rb') as f:
+        header = f.read(16)
+    assert header[:4] == importlib.util.MAGIC_NUMBER
+    flags = int.from_bytes(header[4:8], 'little')
+    assert flags == 0b11  # hash-based, checked
+    with open(templates.__file__, 'rb') as f:
+        assert header[8:16] == importlib.util.source_hash(f.read())
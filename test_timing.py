@@ -0,0 +1,73 @@
+import flask
+import pytest
+
+import timing
+
+
+class FakeResponse:
+
+    def json(self):
+        return {'query': {'userinfo': {'id': 1, 'name': 'Fake user'}}}
+
+
+class FakeRequestsSession:
+
+    def request(self, method, url, **kwargs):
+        return FakeResponse()
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    timing.init_app(app)
+
+    @app.route('/api')
+    def api():
+        session = timing.TimedSession('https://www.wikidata.org', session=FakeRequestsSession())
+        session.get(action='query', meta='userinfo')
+        session.get(action='query', meta='userinfo')
+        return flask.render_template_string('{{ 1 + 1 }}')
+
+    @app.route('/healthz')
+    @timing.untimed
+    def health():
+        return ''
+
+    return app
+
+
+@pytest.mark.parametrize('params, expected', [
+    ({'action': 'wbgetentities', 'ids': 'L1'}, 'mwapi-wbgetentities'),
+    ({'action': 'query', 'meta': 'userinfo'}, 'mwapi-query-userinfo'),
+    ({'action': 'query', 'meta': 'tokens|userinfo'}, 'mwapi-query-tokens-userinfo'),
+    ({'action': 'query', 'prop': ['revisions']}, 'mwapi-query-revisions'),
+    (None, 'mwapi-unknown'),
+])
+def test_mwapi_timing_name(params, expected):
+    assert timing.mwapi_timing_name(params) == expected
+
+
+def test_server_timing():
+    timings = timing.RequestTimings()
+    timings.record('mwapi-wbgetentities', 0.01)
+    timings.record('mwapi-wbgetentities', 0.0025)
+    assert timings.server_timing(0.1) == 'mwapi-wbgetentities;dur=12.5;desc="2x", total;dur=100.0'
+
+
+def test_timed_outside_request():
+    with timing.timed('test'):
+        pass  # no error without a request context
+
+
+def test_request_timings(app):
+    response = app.test_client().get('/api')
+    metrics = response.headers['Server-Timing'].split(', ')
+    assert metrics[0].startswith('mwapi-query-userinfo;dur=')
+    assert metrics[0].endswith(';desc="2x"')
+    assert metrics[1].startswith('render-string;dur=')
+    assert metrics[2].startswith('total;dur=')
+
+
+def test_untimed(app):
+    response = app.test_client().get('/healthz')
+    assert 'Server-Timing' not in response.headers
@@ -0,0 +1,19 @@
+import os
+
+import worker_memory
+
+
+def test_memory_usage_self():
+    usage = worker_memory.memory_usage()
+    assert usage['rss'] > 0
+    assert 0 < usage['uss'] <= usage['pss'] <= usage['rss']
+
+
+def test_child_pids():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    try:
+        assert pid in worker_memory.child_pids(os.getpid())
+    finally:
+        os.waitpid(pid, 0)
@@ -0,0 +1,153 @@
+"""Timing of the upstream API calls and template rendering of each request.
+
+Every mwapi call made through a TimedSession, and every template
+rendered with flask.render_template(), is recorded (count and total
+duration, by API action or template name) for the current request.
+At the end of the request, the timings are sent to the client in a
+Server-Timing header (visible in the browser developer tools),
+and logged as one JSON line per request.
+
+Calls outside of a request context (e.g. in the bulk mode prefetch
+threads) are not recorded; neither is anything that happens while
+a streamed response body is generated, after the headers were sent."""
+
+from collections.abc import Callable, Iterator
+import contextlib
+import json
+import logging
+import sys
+import time
+from typing import Any, TypeVar
+
+import flask
+import jinja2
+import mwapi  # type: ignore
+import werkzeug
+
+import metrics
+
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+logger = logging.getLogger('lexeme_forms.timing')
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class RequestTimings:
+    """The timings of one request, by name (e.g. mwapi-wbgetentities)."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.counts: dict[str, int] = {}
+        self.durations: dict[str, float] = {}
+        self.render_starts: list[float] = []
+
+    def record(self, name: str, duration: float) -> None:
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.durations[name] = self.durations.get(name, 0) + duration
+
+    def server_timing(self, total: float) -> str:
+        metrics = [
+            f'{name};dur={self.durations[name] * 1000:.1f};desc="{count}x"'
+            for name, count in self.counts.items()
+        ]
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def current_timings() -> RequestTimings | None:
+    if not flask.has_request_context():
+        return None
+    return flask.g.get('timings')
+
+
+@contextlib.contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the duration of the block under the given name, if in a timed request."""
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, time.perf_counter() - start)
+
+
+def mwapi_timing_name(params: dict[str, Any] | None) -> str:
+    """Get the timing name of an API request, such as mwapi-query-userinfo.
+
+    For action=query, the meta and prop parameters are included,
+    since they determine what the request actually does."""
+    params = params or {}
+    parts = ['mwapi', str(params.get('action', 'unknown'))]
+    if params.get('action') == 'query':
+        for key in ('meta', 'prop'):
+            value = params.get(key)
+            if value:
+                parts.append(value if isinstance(value, str) else '-'.join(value))
+    return '-'.join(part.replace('|', '-') for part in parts)
+
+
+class TimedSession(mwapi.Session):
+    """An mwapi session that records the duration of each API request,
+    both for the current request and in the metrics."""
+
+    def _request(self, method, params=None, files=None, auth=None):
+        # _request() is used by both request() and continuation()
+        action = str((params or {}).get('action', 'unknown'))
+        with timed(mwapi_timing_name(params)), metrics.mwapi_request_duration.labels(self.host, action).time():
+            return super()._request(method, params=params, files=files, auth=auth)
+
+
+def untimed(view: F) -> F:
+    """Exclude the view function from timing and timing logs (e.g. for health checks)."""
+    view._untimed = True  # type: ignore
+    return view
+
+
+def init_app(app: flask.Flask) -> None:
+
+    @app.before_request
+    def start_timings() -> None:
+        view = app.view_functions.get(flask.request.endpoint or '')
+        if getattr(view, '_untimed', False):
+            return
+        flask.g.timings = RequestTimings()
+
+    @app.after_request
+    def finish_timings(response: werkzeug.Response) -> werkzeug.Response:
+        timings = current_timings()
+        if timings is None:
+            return response
+        total = time.perf_counter() - timings.start
+        response.headers['Server-Timing'] = timings.server_timing(total)
+        logger.info(json.dumps({
+            'method': flask.request.method,
+            'route': flask.request.url_rule.rule if flask.request.url_rule else None,
+            'endpoint': flask.request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+            'timings': {
+                name: {'count': count, 'duration_ms': round(timings.durations[name] * 1000, 1)}
+                for name, count in timings.counts.items()
+            },
+        }))
+        return response
+
+    def template_started(sender: flask.Flask, template: jinja2.Template, context: dict[str, Any], **extra: Any) -> None:
+        timings = current_timings()
+        if timings is not None:
+            timings.render_starts.append(time.perf_counter())
+
+    def template_finished(sender: flask.Flask, template: jinja2.Template, context: dict[str, Any], **extra: Any) -> None:
+        timings = current_timings()
+        if timings is not None and timings.render_starts:
+            timings.record(f'render-{template.name or "string"}', time.perf_counter() - timings.render_starts.pop())
+
+    flask.before_render_template.connect(template_started, app, weak=False)
+    flask.template_rendered.connect(template_finished, app, weak=False)
@@ -18,6 +18,7 @@ _variables = {
     'bulk-first-field-not-lexeme-id': ['num_forms', 'num_fields', 'first_field', 'line_number'],
     'bulk-first-field-lexeme-id': ['num_forms', 'num_fields', 'first_field', 'line_number'],
     'bulk-wrong-number-of-fields': ['num_forms', 'num_fields', 'line_number'],
+    'bulk-line-error': ['error'],
     'edit-ambiguous-warning': ['num_forms'],
     'edit-unmatched-warning': ['num_forms'],
     'edit-form-list-item': ['form_link', 'list_grammatical_feature_labels', 'num_statements'],
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Measure the memory usage of the gunicorn workers.
+
+The resident set size (RSS) of each worker includes the pages
+it shares with the master and the other workers, so it overstates
+how much memory an additional worker costs. The unique set size
+(USS, the private pages of the process) is what each worker
+really adds; the proportional set size (PSS) divides the shared
+pages evenly among the processes sharing them.
+
+Usage: worker_memory.py [MASTER_PID]
+(defaults to the oldest gunicorn process, i. e. the master)"""
+
+import os
+import sys
+from typing import TypedDict
+
+
+class MemoryUsage(TypedDict):
+    rss: int
+    pss: int
+    uss: int
+
+
+def memory_usage(pid: int | str = 'self') -> MemoryUsage:
+    """Get the memory usage of a process in bytes, from /proc/<pid>/smaps_rollup."""
+    fields: dict[str, int] = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            parts = value.split()
+            if len(parts) == 2 and parts[1] == 'kB':
+                fields[key] = int(parts[0]) * 1024
+    return {
+        'rss': fields['Rss'],
+        'pss': fields['Pss'],
+        'uss': fields['Private_Clean'] + fields['Private_Dirty'],
+    }
+
+
+def child_pids(pid: int) -> list[int]:
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child_pid) for child_pid in f.read().split()]
+
+
+def find_gunicorn_master() -> int:
+    candidates = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                cmdline = f.read()
+            with open(f'/proc/{entry}/stat') as f:
+                start_time = int(f.read().rpartition(')')[2].split()[19])
+        except OSError:
+            continue
+        # gunicorn is either the executable or the script run by python
+        if any(os.path.basename(arg).startswith(b'gunicorn') for arg in cmdline.split(b'\0')[:2]):
+            candidates.append((start_time, int(entry)))
+    if not candidates:
+        sys.exit('no gunicorn process found')
+    return min(candidates)[1]
+
+
+def format_mib(size: int) -> str:
+    return f'{size / 1024 / 1024:.1f} MiB'
+
+
+if __name__ == '__main__':
+    master_pid = int(sys.argv[1]) if len(sys.argv) > 1 else find_gunicorn_master()
+    print(f'{"process":>16} {"RSS":>12} {"PSS":>12} {"USS":>12}')
+    for name, pid in [('master', master_pid)] + [('worker', worker_pid) for worker_pid in child_pids(master_pid)]:
+        usage = memory_usage(pid)
+        print(f'{name + " " + str(pid):>16} {format_mib(usage["rss"]):>12} {format_mib(usage["pss"]):>12} {format_mib(usage["uss"]):>12}')